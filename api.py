@@ -1,18 +1,101 @@
-from fastapi import FastAPI
+import asyncio
+import json
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from constants import TEST_STEPS_IN_NATURAL_LANGUAGE
-from test_script_generator import run_test
-from models import TestCase
-from utils import parse_natural_language_steps_to_testcase
-from test_workflow_api import execute_full_workflow, TestExecutionRequest
+from typing import List
+from test_script_generator import run_tests, replay_test_case, device_scheduler, job_manager
+from job_queue import JobQueueFull
+from models import TestCase, TestResult
+from utils import parse_natural_language_steps_to_testcase, token_ledger, config
+from test_workflow_api import execute_full_workflow, cancel_workflow, TestExecutionRequest
 
 app = FastAPI()
 
 PORT = 8000
 
 
+@app.on_event("startup")
+def warm_driver_pool():
+    if (config.get('driver_pool', {}) or {}).get('prewarm'):
+        for device in device_scheduler.devices:
+            device.pool.warm()
+
+
+@app.on_event("shutdown")
+def close_driver_pool():
+    device_scheduler.close()
+
+
 @app.post("/run-test/")
 def run_test_api(test_case: TestCase):
-    return run_test(test_case)
+    # Queued like any other test case so concurrent requests never share a device
+    return run_tests([test_case])[0]
+
+
+@app.post("/run-tests/", response_model=List[TestResult])
+def run_tests_api(test_cases: List[TestCase]):
+    """Run test cases in parallel across the devices configured in config.yaml"""
+    return run_tests(test_cases)
+
+
+@app.post("/replay/{test_case_id}")
+def replay_api(test_case_id: str):
+    """Re-run the recorded code of a test case that passed before, without the LLM, with per-step timings"""
+    report = replay_test_case(test_case_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"No recorded run for test case {test_case_id}")
+    return report
+
+
+@app.post("/jobs/", status_code=202)
+def submit_job_api(test_cases: List[TestCase]):
+    """Queue a suite of test cases and return its job id without waiting for the run"""
+    if not test_cases:
+        raise HTTPException(status_code=422, detail="test_cases must not be empty")
+    try:
+        job = job_manager.submit(test_cases)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"job_id": job.id, "status": job.status, "test_case_ids": job.test_case_ids}
+
+
+@app.get("/jobs/")
+def jobs_api():
+    return job_manager.stats()
+
+
+@app.get("/jobs/{job_id}")
+def job_api(job_id: str):
+    """Status of a job, with the TestResult of every finished test case"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events_api(job_id: str):
+    """Server-sent events with the progress of a job, per test case and step, until it finishes"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+
+    async def stream():
+        cursor = 0
+        while True:
+            events = await asyncio.to_thread(job.events_since, cursor, 15)
+            if not events:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                yield f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+            cursor = events[-1]["id"] + 1
+            if events[-1]["event"] == "job_finished":
+                return
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
 
 
 @app.post("/text-to-json/")
@@ -21,6 +104,23 @@ def run_nlp_to_json_api():
     return test_case_json[0]
 
 
+@app.get("/token-usage/")
+def token_usage_api():
+    """Prompt/completion tokens and latency per LLM call site and per test case"""
+    return token_ledger.summary()
+
+
+@app.get("/token-usage/{test_case_id}")
+def test_case_token_usage_api(test_case_id: str):
+    return token_ledger.summary(test_case_id)
+
+
+@app.get("/devices/")
+def devices_api():
+    """Queued test cases, and per device the running test case and its open/idle Appium sessions"""
+    return device_scheduler.stats()
+
+
 @app.post("/execute-workflow/")
 async def execute_workflow_api(request: TestExecutionRequest):
     """
@@ -32,6 +132,14 @@ async def execute_workflow_api(request: TestExecutionRequest):
     return await execute_full_workflow(request)
 
 
+@app.delete("/execute-workflow/{workflow_id}")
+async def cancel_workflow_api(workflow_id: str):
+    """Cancel a running workflow started with that workflow_id and stop its node process"""
+    if not cancel_workflow(workflow_id):
+        raise HTTPException(status_code=404, detail=f"Workflow {workflow_id} is not running")
+    return {"workflow_id": workflow_id, "status": "cancelling"}
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
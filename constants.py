@@ -229,6 +229,12 @@ Rules:
         </POMDetails>
 """
 
+PROMPT_RULES_CONTENT_CORELATION_STEPS = """
+7. The code below belongs to consecutive steps, each inside a <StepDetails index="N"> block. Correlate them together,
+   then return one <StepDetails index="N"> block per step, N being the same step number, holding that step's
+   <FeatureDetails> and <POMDetails>.
+"""
+
 EXTRACT_CLASS_NAME_RULES = """
 1. Identify all class declarations in the code
 2. Extract only the class names (not methods, properties, or other identifiers)
@@ -0,0 +1,136 @@
+"""
+Scheduler that runs test cases in parallel across Appium devices.
+
+Every device (Appium server URL, udid, systemPort) gets its own worker
+thread and its own driver pool, so sessions are never shared between
+devices. Submitted batches are served round-robin: a large batch cannot
+starve a small one submitted after it, and each free device takes the next
+test case of the next batch in turn.
+"""
+import contextvars
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import Future
+
+# One Appium server + device; pool is the AppiumDriverPool bound to it
+Device = namedtuple("Device", ["name", "pool"])
+
+
+class _Batch:
+    def __init__(self, test_cases, run):
+        self.run = run
+        # Each test case runs in a copy of the submitter's context, so context variables follow it to the device
+        self.pending = deque((test_case, Future(), contextvars.copy_context()) for test_case in test_cases)
+        self.futures = [future for _, future, _ in self.pending]
+
+
+class DeviceScheduler:
+    def __init__(self, devices, run):
+        """
+        Args:
+            devices: list of Device
+            run: callable(test_case, device) executed on a device worker thread
+        """
+        if not devices:
+            raise ValueError("DeviceScheduler needs at least one device")
+        self.devices = devices
+        self.run = run
+        self._condition = threading.Condition()
+        # Batches that still have queued test cases, rotated after every dispatch
+        self._batches = deque()
+        self._busy = {}
+        self._completed = {device.name: 0 for device in devices}
+        self._workers = []
+        self._closed = False
+
+    def _start_workers(self):
+        if self._workers:
+            return
+        for device in self.devices:
+            worker = threading.Thread(target=self._work, args=(device,), name=f"device-{device.name}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, test_cases, run=None):
+        """
+        Queue test_cases as one batch. Returns one Future per test case, in order.
+        run overrides the scheduler's callable for this batch, e.g. to replay instead of generate.
+        """
+        batch = _Batch(test_cases, run or self.run)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("DeviceScheduler is closed")
+            self._start_workers()
+            if batch.pending:
+                self._batches.append(batch)
+                self._condition.notify_all()
+        return batch.futures
+
+    def run_all(self, test_cases):
+        """Run test_cases across the devices and wait. Failures are returned in place as exceptions."""
+        results = []
+        for future in self.submit(test_cases):
+            try:
+                results.append(future.result())
+            except BaseException as e:
+                results.append(e)
+        return results
+
+    def _next_job(self):
+        with self._condition:
+            self._condition.wait_for(lambda: self._batches or self._closed)
+            if self._closed:
+                return None
+            batch = self._batches.popleft()
+            test_case, future, context = batch.pending.popleft()
+            if batch.pending:
+                self._batches.append(batch)
+            return test_case, future, context, batch.run
+
+    def _work(self, device):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            test_case, future, context, run = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            with self._condition:
+                self._busy[device.name] = test_case
+            try:
+                future.set_result(context.run(run, test_case, device))
+            except BaseException as e:
+                # Anything, SystemExit included, must resolve the future and keep the device serving
+                print(f"❌ Test case failed on device {device.name}: {e!r}")
+                future.set_exception(e)
+            finally:
+                with self._condition:
+                    self._busy.pop(device.name, None)
+                    self._completed[device.name] += 1
+
+    def stats(self):
+        with self._condition:
+            return {
+                "queued": sum(len(batch.pending) for batch in self._batches),
+                "devices": [
+                    {
+                        "name": device.name,
+                        "busy_with": getattr(self._busy.get(device.name), "test_case_id", None),
+                        "completed": self._completed[device.name],
+                        "sessions": device.pool.stats()
+                    }
+                    for device in self.devices
+                ]
+            }
+
+    def close(self):
+        """Stop the workers after their current test case, cancel queued ones and close every pool."""
+        with self._condition:
+            self._closed = True
+            batches, self._batches = self._batches, deque()
+            self._condition.notify_all()
+        for batch in batches:
+            for _, future, _ in batch.pending:
+                future.cancel()
+        for device in self.devices:
+            device.pool.close()
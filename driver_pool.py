@@ -0,0 +1,142 @@
+"""
+Pool of warm Appium sessions.
+
+Creating a UiAutomator2 session installs/launches the APK and waits through
+app startup, so sessions are kept open between test cases instead. Before a
+session is lent out it is health-checked and the app data is cleared (a plain
+terminate/activate is opt-in); a dead session is replaced by a new one.
+"""
+import threading
+from contextlib import contextmanager
+
+# clear wipes app data, terminate + activate (restart) keeps it, none leaves the app where the last test left it
+RESET_MODES = ("clear", "restart", "none")
+
+
+class DriverPoolTimeout(Exception):
+    """No session became available in time."""
+
+
+class AppiumDriverPool:
+    def __init__(self, factory, app_package, size=1, reset_mode="clear", acquire_timeout=600):
+        if reset_mode not in RESET_MODES:
+            raise ValueError(f"Unknown driver_pool reset_mode '{reset_mode}', expected one of {RESET_MODES}")
+        self.factory = factory
+        self.app_package = app_package
+        self.size = size
+        self.reset_mode = reset_mode
+        self.acquire_timeout = acquire_timeout
+        self._condition = threading.Condition()
+        # Most recently released last, so the warmest session is lent first
+        self._idle = []
+        self._open = 0
+
+    @classmethod
+    def from_config(cls, factory, app_package, pool_config):
+        pool_config = pool_config or {}
+        return cls(
+            factory,
+            app_package,
+            size=int(pool_config.get("size", 1)),
+            reset_mode=pool_config.get("reset_mode", "clear"),
+            acquire_timeout=float(pool_config.get("acquire_timeout", 600))
+        )
+
+    def _is_healthy(self, driver):
+        try:
+            return driver.session_id is not None and driver.query_app_state(self.app_package) is not None
+        except Exception as e:
+            print(f"⚠️ Pooled Appium session failed its health check: {e}")
+            return False
+
+    def _reset_app(self, driver):
+        if self.reset_mode == "none":
+            return
+        if self.reset_mode == "clear":
+            driver.execute_script("mobile: clearApp", {"appId": self.app_package})
+        else:
+            driver.terminate_app(self.app_package)
+        driver.activate_app(self.app_package)
+
+    def _discard(self, driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"⚠️ Error closing Appium session: {e}")
+
+    def acquire(self):
+        """Lend a healthy session with a freshly reset app, creating one if the pool is not full."""
+        while True:
+            with self._condition:
+                if not self._condition.wait_for(lambda: self._idle or self._open < self.size,
+                                                timeout=self.acquire_timeout):
+                    raise DriverPoolTimeout(f"No Appium session available within {self.acquire_timeout} s")
+                driver = self._idle.pop() if self._idle else None
+                if driver is None:
+                    # Reserve the slot before the slow session creation happens outside the lock
+                    self._open += 1
+
+            if driver is None:
+                try:
+                    driver = self.factory()
+                except Exception:
+                    self._release_slot()
+                    raise
+                print(f"🆕 Created Appium session {driver.session_id}")
+                # A new session has just launched the app, no reset needed
+                return driver
+
+            try:
+                if self._is_healthy(driver):
+                    self._reset_app(driver)
+                    print(f"♻️ Reusing Appium session {driver.session_id}")
+                    return driver
+            except Exception as e:
+                print(f"⚠️ Could not reset the app on a pooled session: {e}")
+            self._discard(driver)
+            self._release_slot()
+
+    def release(self, driver, broken=False):
+        """Return a session to the pool, or close it when it is broken."""
+        if broken:
+            self._discard(driver)
+            self._release_slot()
+            return
+        with self._condition:
+            self._idle.append(driver)
+            self._condition.notify()
+
+    def _release_slot(self):
+        with self._condition:
+            self._open -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def lease(self):
+        driver = self.acquire()
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def warm(self, count=None):
+        """Open sessions up front so the first test cases skip session creation too."""
+        drivers = []
+        try:
+            for _ in range(min(count or self.size, self.size)):
+                drivers.append(self.acquire())
+        finally:
+            for driver in drivers:
+                self.release(driver)
+
+    def close(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._condition.notify_all()
+        for driver in idle:
+            self._discard(driver)
+
+    def stats(self):
+        with self._condition:
+            return {"size": self.size, "open": self._open, "idle": len(self._idle), "reset_mode": self.reset_mode}
@@ -0,0 +1,131 @@
+"""
+Incremental one-way directory sync.
+
+A manifest in the destination records, for every file synced from the
+source, its content hash and the size/mtime it had in the source. Files whose
+size and mtime are unchanged are skipped without being read, changed files
+are hashed and copied only when their content differs, and files that
+disappeared from the source are pruned. Every copy is written to a temporary
+file next to its target and renamed into place, so readers never see a
+half-written file. Syncs into the same destination run one at a time, so
+concurrent runs in one process never clobber each other's manifest entries.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+
+MANIFEST_NAME = ".sync_manifest.json"
+
+# One lock per destination directory, created under _locks_guard
+_locks_guard = threading.Lock()
+_dest_locks = {}
+
+
+def file_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_manifest(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _atomic_copy(source_path, dest_path):
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    tmp_path = f"{dest_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        shutil.copy2(source_path, tmp_path)
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _atomic_write_json(path, data):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _dest_lock(dest_dir):
+    key = os.path.realpath(dest_dir)
+    with _locks_guard:
+        return _dest_locks.setdefault(key, threading.Lock())
+
+
+def _remove_empty_dirs(root, relative_dir):
+    while relative_dir:
+        directory = os.path.join(root, relative_dir)
+        try:
+            os.rmdir(directory)
+        except OSError:
+            return
+        relative_dir = os.path.dirname(relative_dir)
+
+
+def sync_tree(source_dir, dest_dir):
+    """
+    Make dest_dir contain every file of source_dir, copying only what changed.
+
+    Returns:
+        dict: {"copied": [...], "unchanged": count, "pruned": [...]} with paths relative to source_dir
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    # The manifest is read, updated and written back as a whole
+    with _dest_lock(dest_dir):
+        return _sync_tree(source_dir, dest_dir)
+
+
+def _sync_tree(source_dir, dest_dir):
+    manifest_path = os.path.join(dest_dir, MANIFEST_NAME)
+    manifest = _load_manifest(manifest_path)
+    new_manifest = {}
+    copied = []
+    unchanged = 0
+
+    for root, _, files in os.walk(source_dir):
+        for name in files:
+            source_path = os.path.join(root, name)
+            relative_path = os.path.relpath(source_path, source_dir).replace(os.sep, "/")
+            dest_path = os.path.join(dest_dir, relative_path)
+            stat = os.stat(source_path)
+            entry = manifest.get(relative_path)
+            dest_exists = os.path.exists(dest_path)
+
+            if entry and dest_exists and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                new_manifest[relative_path] = entry
+                unchanged += 1
+                continue
+
+            content_hash = file_hash(source_path)
+            if not (entry and dest_exists and entry["hash"] == content_hash):
+                _atomic_copy(source_path, dest_path)
+                copied.append(relative_path)
+            else:
+                unchanged += 1
+            new_manifest[relative_path] = {"hash": content_hash, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    pruned = []
+    for relative_path in manifest:
+        if relative_path in new_manifest:
+            continue
+        dest_path = os.path.join(dest_dir, relative_path)
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        _remove_empty_dirs(dest_dir, os.path.dirname(relative_path))
+        pruned.append(relative_path)
+
+    if new_manifest != manifest:
+        _atomic_write_json(manifest_path, new_manifest)
+    return {"copied": copied, "unchanged": unchanged, "pruned": pruned}
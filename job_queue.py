@@ -0,0 +1,164 @@
+"""
+Asynchronous test jobs.
+
+A job is a suite of test cases submitted in one request. It is queued on the
+device scheduler and its id returned immediately; clients poll the job for
+status and results or follow its progress events (test case and step
+started/finished) as they happen. The number of test cases queued or running
+is bounded, so a burst of submissions is rejected instead of piling up.
+"""
+import contextvars
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+# Progress callback of the job the current test case belongs to; follows the test case onto its device thread
+current_progress = contextvars.ContextVar("current_progress", default=None)
+
+
+def report_progress(event, **fields):
+    """Publish a progress event to the job running the current test case, if any."""
+    callback = current_progress.get()
+    if callback is not None:
+        callback(event, fields)
+
+
+class JobQueueFull(Exception):
+    """Accepting the job would exceed the queued test case limit."""
+
+
+class Job:
+    def __init__(self, test_cases):
+        self.id = uuid.uuid4().hex
+        self.test_case_ids = [str(test_case.test_case_id) for test_case in test_cases]
+        self.status = JOB_QUEUED
+        self.created_at = time.time()
+        self.finished_at = None
+        self.results = [None] * len(test_cases)
+        self._remaining = len(test_cases)
+        self._events = []
+        self._condition = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status in (JOB_SUCCEEDED, JOB_FAILED)
+
+    def add_event(self, event, fields):
+        with self._condition:
+            if self.status == JOB_QUEUED and event == "test_case_started":
+                self.status = JOB_RUNNING
+            self._events.append({"id": len(self._events), "event": event, "time": time.time(), **fields})
+            self._condition.notify_all()
+
+    def _set_result(self, position, result):
+        with self._condition:
+            self.results[position] = result
+            self._remaining -= 1
+            if self._remaining == 0:
+                failed = any(_result_status(result) != "success" for result in self.results)
+                self.status = JOB_FAILED if failed else JOB_SUCCEEDED
+                self.finished_at = time.time()
+                self._events.append({"id": len(self._events), "event": "job_finished", "time": self.finished_at,
+                                     "status": self.status})
+            self._condition.notify_all()
+
+    def events_since(self, cursor, timeout):
+        """Events with id >= cursor, waiting up to timeout seconds for one when there are none yet."""
+        with self._condition:
+            self._condition.wait_for(lambda: len(self._events) > cursor or self.done, timeout=timeout)
+            return self._events[cursor:]
+
+    def to_dict(self):
+        with self._condition:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "test_case_ids": self.test_case_ids,
+                "completed": len(self.test_case_ids) - self._remaining,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+                "results": list(self.results)
+            }
+
+
+def _result_status(result):
+    if isinstance(result, dict):
+        return result.get("status")
+    return getattr(result, "status", None)
+
+
+class JobManager:
+    def __init__(self, scheduler, max_queued_test_cases=50, max_finished_jobs=100):
+        self.scheduler = scheduler
+        self.max_queued_test_cases = max_queued_test_cases
+        self.max_finished_jobs = max_finished_jobs
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._active_test_cases = 0
+
+    @classmethod
+    def from_config(cls, scheduler, jobs_config):
+        jobs_config = jobs_config or {}
+        return cls(
+            scheduler,
+            max_queued_test_cases=int(jobs_config.get("max_queued_test_cases", 50)),
+            max_finished_jobs=int(jobs_config.get("max_finished_jobs", 100))
+        )
+
+    def submit(self, test_cases):
+        """Queue test_cases as one job and return it without waiting. Raises JobQueueFull, or ValueError when empty."""
+        if not test_cases:
+            # Nothing would ever finish the job, it would stay queued forever
+            raise ValueError("A job needs at least one test case")
+        job = Job(test_cases)
+        with self._lock:
+            if self._active_test_cases + len(test_cases) > self.max_queued_test_cases:
+                raise JobQueueFull(f"{self._active_test_cases} test cases are already queued or running, "
+                                   f"the limit is {self.max_queued_test_cases}")
+            self._active_test_cases += len(test_cases)
+            self._jobs[job.id] = job
+            self._evict_finished()
+
+        token = current_progress.set(job.add_event)
+        try:
+            futures = self.scheduler.submit(test_cases)
+        finally:
+            current_progress.reset(token)
+        for position, future in enumerate(futures):
+            future.add_done_callback(lambda future, position=position: self._on_done(job, position, future))
+        return job
+
+    def _on_done(self, job, position, future):
+        if future.cancelled():
+            result = {"status": "failed", "errors": "cancelled"}
+        elif future.exception() is not None:
+            result = {"status": "failed", "errors": str(future.exception())}
+        else:
+            result = future.result()
+        with self._lock:
+            self._active_test_cases -= 1
+        job._set_result(position, result)
+
+    def _evict_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(len(finished) - self.max_finished_jobs, 0)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active_test_cases": self._active_test_cases,
+                "max_queued_test_cases": self.max_queued_test_cases,
+                "jobs": {status: sum(1 for job in self._jobs.values() if job.status == status)
+                         for status in (JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED)}
+            }
@@ -0,0 +1,350 @@
+"""
+Deterministic splitter for the JavaScript the model emits for page objects.
+
+A small tokenizer understands strings, template literals (including nested
+`${...}` substitutions), comments and regex literals, so braces inside them
+never confuse the class boundaries. The top-level parser then cuts every
+class out of a consolidated Classes.js in one pass and builds a standalone
+CommonJS file for each: the class, the top-level declarations it uses,
+require() lines for the sibling classes it references and
+`module.exports = ClassName;`.
+
+Anything the tokenizer cannot make sense of raises JsParseError so callers
+can fall back to LLM extraction.
+"""
+from collections import namedtuple
+
+Token = namedtuple("Token", ["kind", "value", "start", "end", "newline_before"])
+
+# A top-level statement: kind is "class", "function", "declaration" or "other"
+JsStatement = namedtuple("JsStatement", ["kind", "name", "declared", "identifiers", "text", "start", "end"])
+
+# Keywords after which a "/" starts a regex literal rather than a division
+REGEX_PREFIX_KEYWORDS = {
+    "return", "typeof", "instanceof", "in", "of", "new", "delete", "void",
+    "throw", "case", "do", "else", "yield", "await"
+}
+
+# Tokens that start a new statement when they follow a newline (automatic semicolon insertion)
+STATEMENT_KEYWORDS = {
+    "const", "let", "var", "class", "function", "async", "import", "export",
+    "module", "exports", "if", "for", "while", "return", "describe", "it"
+}
+
+DECLARATION_KEYWORDS = {"const", "let", "var", "import"}
+
+# Identifiers never treated as references to top-level declarations
+IGNORED_IDENTIFIERS = {"this", "super", "require", "module", "exports", "as", "from", "default"}
+
+OPENING = {"(": ")", "[": "]", "{": "}"}
+CLOSING = {")", "]", "}"}
+
+
+class JsParseError(ValueError):
+    """The source is outside the JavaScript subset the splitter understands."""
+
+
+def _is_identifier_start(ch):
+    return ch.isalpha() or ch in "_$#"
+
+
+def _is_identifier_part(ch):
+    return ch.isalnum() or ch in "_$"
+
+
+def _regex_allowed(previous):
+    if previous is None:
+        return True
+    if previous.kind == "punct":
+        return previous.value not in (")", "]", "}")
+    if previous.kind == "ident":
+        return previous.value in REGEX_PREFIX_KEYWORDS
+    return False
+
+
+def tokenize(source):
+    """Split source into identifier, punctuation, string, template, regex and number tokens."""
+    tokens = []
+    # One entry per open "{": True when it is a template literal substitution "${"
+    brace_stack = []
+    i = 0
+    n = len(source)
+    newline = False
+    template_resume = None
+
+    while i < n or template_resume is not None:
+        if template_resume is not None:
+            # Continue a template literal after the "}" that closed a substitution
+            i = _scan_template(source, template_resume, tokens, brace_stack, newline)
+            template_resume = None
+            newline = False
+            continue
+
+        ch = source[i]
+        if ch == "\n":
+            newline = True
+            i += 1
+            continue
+        if ch.isspace():
+            i += 1
+            continue
+        if source.startswith("//", i):
+            end = source.find("\n", i)
+            i = n if end == -1 else end
+            continue
+        if source.startswith("/*", i):
+            end = source.find("*/", i + 2)
+            if end == -1:
+                raise JsParseError(f"Unterminated block comment at offset {i}")
+            if "\n" in source[i:end]:
+                newline = True
+            i = end + 2
+            continue
+
+        start = i
+        previous = tokens[-1] if tokens else None
+        if ch in "'\"":
+            i = _scan_string(source, i, ch)
+            tokens.append(Token("string", source[start:i], start, i, newline))
+        elif ch == "`":
+            i = _scan_template(source, i + 1, tokens, brace_stack, newline, start)
+        elif ch == "/" and _regex_allowed(previous):
+            i = _scan_regex(source, i)
+            tokens.append(Token("regex", source[start:i], start, i, newline))
+        elif _is_identifier_start(ch):
+            i += 1
+            while i < n and _is_identifier_part(source[i]):
+                i += 1
+            tokens.append(Token("ident", source[start:i], start, i, newline))
+        elif ch.isdigit():
+            i += 1
+            while i < n and (_is_identifier_part(source[i]) or source[i] == "."):
+                i += 1
+            tokens.append(Token("number", source[start:i], start, i, newline))
+        elif ch == "}" and brace_stack and brace_stack[-1]:
+            brace_stack.pop()
+            template_resume = i + 1
+            i += 1
+        else:
+            if ch == "{":
+                brace_stack.append(False)
+            elif ch == "}":
+                if not brace_stack:
+                    raise JsParseError(f"Unbalanced '}}' at offset {i}")
+                brace_stack.pop()
+            tokens.append(Token("punct", ch, start, i + 1, newline))
+            i += 1
+        newline = False
+
+    if brace_stack:
+        raise JsParseError("Unbalanced '{' at end of source")
+    return tokens
+
+
+def _scan_string(source, i, quote):
+    i += 1
+    while i < len(source):
+        ch = source[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch == quote:
+            return i + 1
+        if ch == "\n":
+            break
+        i += 1
+    raise JsParseError(f"Unterminated string literal at offset {i}")
+
+
+def _scan_template(source, i, tokens, brace_stack, newline, start=None):
+    """Scan template text from i; stops at the closing backtick or at a "${" substitution."""
+    start = i if start is None else start
+    while i < len(source):
+        ch = source[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch == "`":
+            tokens.append(Token("template", source[start:i + 1], start, i + 1, newline))
+            return i + 1
+        if source.startswith("${", i):
+            tokens.append(Token("template", source[start:i + 2], start, i + 2, newline))
+            brace_stack.append(True)
+            return i + 2
+        i += 1
+    raise JsParseError(f"Unterminated template literal at offset {start}")
+
+
+def _scan_regex(source, i):
+    start = i
+    i += 1
+    in_class = False
+    while i < len(source):
+        ch = source[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch == "\n":
+            break
+        if ch == "[":
+            in_class = True
+        elif ch == "]":
+            in_class = False
+        elif ch == "/" and not in_class:
+            i += 1
+            while i < len(source) and _is_identifier_part(source[i]):
+                i += 1
+            return i
+        i += 1
+    raise JsParseError(f"Unterminated regex literal at offset {start}")
+
+
+def _match_brackets(tokens):
+    """Map the index of every opening bracket token to the index of its closing token."""
+    matches = {}
+    stack = []
+    for idx, token in enumerate(tokens):
+        if token.kind != "punct":
+            continue
+        if token.value in OPENING:
+            stack.append(idx)
+        elif token.value in CLOSING:
+            if not stack or OPENING[tokens[stack[-1]].value] != token.value:
+                raise JsParseError(f"Mismatched '{token.value}' at offset {token.start}")
+            matches[stack.pop()] = idx
+    if stack:
+        raise JsParseError(f"Unclosed '{tokens[stack[-1]].value}' at offset {tokens[stack[-1]].start}")
+    return matches
+
+
+def parse_statements(source):
+    """Parse the top level of source into JsStatement records."""
+    tokens = tokenize(source)
+    matches = _match_brackets(tokens)
+    statements = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token.kind == "punct" and token.value == ";":
+            i += 1
+            continue
+
+        body_start = i
+        if token.kind == "ident" and token.value == "export":
+            body_start += 1
+            if body_start < len(tokens) and tokens[body_start].value == "default":
+                body_start += 1
+        head = tokens[body_start] if body_start < len(tokens) else token
+
+        if head.kind == "ident" and head.value == "class":
+            end = _parse_block_statement(tokens, matches, body_start, "class")
+            name = tokens[body_start + 1].value
+            statements.append(_statement(source, tokens, "class", name, {name}, body_start, end))
+        elif head.kind == "ident" and (head.value == "function" or
+                                       (head.value == "async" and body_start + 1 < len(tokens)
+                                        and tokens[body_start + 1].value == "function")):
+            end = _parse_block_statement(tokens, matches, body_start, "function")
+            name_token = next((t for t in tokens[body_start:end] if t.kind == "ident"
+                               and t.value not in ("async", "function")), None)
+            name = name_token.value if name_token else None
+            statements.append(_statement(source, tokens, "function", name, {name} if name else set(), body_start, end))
+        else:
+            end = _parse_simple_statement(tokens, matches, i)
+            if head.kind == "ident" and head.value in DECLARATION_KEYWORDS:
+                declared = _declared_names(tokens, body_start, end)
+                statements.append(_statement(source, tokens, "declaration", None, declared, body_start, end))
+            else:
+                statements.append(_statement(source, tokens, "other", None, set(), i, end))
+        i = end
+    return statements
+
+
+def _parse_block_statement(tokens, matches, i, keyword):
+    """Return the token index after a class/function declaration starting at i."""
+    if keyword == "class" and (i + 1 >= len(tokens) or tokens[i + 1].kind != "ident"):
+        raise JsParseError(f"Anonymous or malformed class at offset {tokens[i].start}")
+    j = i + 1
+    while j < len(tokens):
+        token = tokens[j]
+        if token.kind == "punct" and token.value == "{":
+            return matches[j] + 1
+        if token.kind == "punct" and token.value in OPENING:
+            j = matches[j] + 1
+            continue
+        j += 1
+    raise JsParseError(f"Missing body for {keyword} at offset {tokens[i].start}")
+
+
+def _parse_simple_statement(tokens, matches, i):
+    """Return the token index after a statement ending in ";" or at an ASI line break."""
+    j = i
+    while j < len(tokens):
+        token = tokens[j]
+        if token.kind == "punct" and token.value == ";":
+            return j + 1
+        if j > i and token.newline_before and token.kind == "ident" and token.value in STATEMENT_KEYWORDS:
+            previous = tokens[j - 1]
+            if previous.kind != "punct" or previous.value in CLOSING:
+                return j
+        if token.kind == "punct" and token.value in OPENING:
+            j = matches[j] + 1
+            continue
+        j += 1
+    return j
+
+
+def _declared_names(tokens, i, end):
+    names = set()
+    for token in tokens[i + 1:end]:
+        if token.kind == "punct" and token.value == "=":
+            break
+        if token.kind == "ident" and token.value not in IGNORED_IDENTIFIERS and token.value not in DECLARATION_KEYWORDS:
+            names.add(token.value)
+    return names
+
+
+def _statement(source, tokens, kind, name, declared, first, end):
+    identifiers = {t.value for t in tokens[first:end] if t.kind == "ident"}
+    start = tokens[first].start
+    stop = tokens[end - 1].end
+    return JsStatement(kind, name, declared, identifiers, source[start:stop], start, stop)
+
+
+def split_classes(source):
+    """
+    Split source into standalone per-class CommonJS files in one pass.
+
+    Returns:
+        dict: class name -> file content, in source order. Raises JsParseError.
+    """
+    statements = parse_statements(source)
+    class_names = {statement.name for statement in statements if statement.kind == "class"}
+    dependencies = [statement for statement in statements if statement.kind in ("declaration", "function")]
+
+    class_files = {}
+    for statement in statements:
+        if statement.kind != "class":
+            continue
+        needed = set(statement.identifiers) - {statement.name} - IGNORED_IDENTIFIERS
+        included = []
+        changed = True
+        while changed:
+            changed = False
+            for dependency in dependencies:
+                if dependency not in included and dependency.declared & needed:
+                    included.append(dependency)
+                    needed |= dependency.identifiers - IGNORED_IDENTIFIERS
+                    changed = True
+        included.sort(key=lambda dependency: dependency.start)
+        declared_by_dependencies = set().union(*(dependency.declared for dependency in included)) if included else set()
+
+        lines = [f"const {name} = require('./{name}');"
+                 for name in sorted(needed & class_names) if name not in declared_by_dependencies]
+        lines += [dependency.text for dependency in included]
+        if lines:
+            lines.append("")
+        lines.append(statement.text)
+        lines.append("")
+        lines.append(f"module.exports = {statement.name};")
+        class_files[statement.name] = "\n".join(lines) + "\n"
+    return class_files
@@ -0,0 +1,179 @@
+"""
+Persistent, content-addressed cache for LLM responses.
+
+Entries are keyed by model id, sampling parameters and a normalized prompt
+hash and stored as one JSON file per key under the cache directory. The
+cache is bounded by entry count and total size (least recently used entries
+are evicted first) and entries expire after a TTL.
+
+Modes:
+    off         - never read or write
+    read_write  - serve hits, store misses
+    replay      - read-only; a miss raises LLMCacheMiss instead of calling the model
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_MODE_OFF = "off"
+CACHE_MODE_READ_WRITE = "read_write"
+CACHE_MODE_REPLAY = "replay"
+CACHE_MODES = (CACHE_MODE_OFF, CACHE_MODE_READ_WRITE, CACHE_MODE_REPLAY)
+
+
+class LLMCacheMiss(KeyError):
+    """Raised in replay mode when a prompt has no cached response."""
+
+
+def normalize_prompt(prompt):
+    """Drop whitespace differences that do not change the meaning of a prompt."""
+    return "\n".join(line.rstrip() for line in prompt.strip().splitlines())
+
+
+class LLMCache:
+    def __init__(self, directory=".llm_cache", mode=CACHE_MODE_READ_WRITE, max_entries=5000,
+                 max_bytes=256 * 1024 * 1024, ttl_seconds=7 * 24 * 3600):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown llm_cache mode '{mode}', expected one of {CACHE_MODES}")
+        self.directory = directory
+        self.mode = mode
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> size in bytes, least recently used first
+        self._index = None
+        self._total_bytes = 0
+
+    @classmethod
+    def from_config(cls, cache_config):
+        cache_config = cache_config or {}
+        return cls(
+            directory=cache_config.get("directory", ".llm_cache"),
+            mode=cache_config.get("mode", CACHE_MODE_READ_WRITE),
+            max_entries=int(cache_config.get("max_entries", 5000)),
+            max_bytes=int(float(cache_config.get("max_size_mb", 256)) * 1024 * 1024),
+            ttl_seconds=int(float(cache_config.get("ttl_hours", 168)) * 3600)
+        )
+
+    @property
+    def enabled(self):
+        return self.mode != CACHE_MODE_OFF
+
+    def make_key(self, model_id, params, prompt):
+        material = json.dumps({
+            "model_id": model_id,
+            "params": params,
+            "prompt": normalize_prompt(prompt)
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _load_index(self):
+        # Rebuild the LRU order from file mtimes the first time the cache is used
+        if self._index is not None:
+            return
+        entries = []
+        if os.path.isdir(self.directory):
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if name.endswith(".json"):
+                        stat = os.stat(os.path.join(root, name))
+                        entries.append((stat.st_mtime, name[:-len(".json")], stat.st_size))
+        entries.sort()
+        self._index = OrderedDict((key, size) for _, key, size in entries)
+        self._total_bytes = sum(self._index.values())
+
+    def get(self, key):
+        """Return the cached response text, or None on a miss (LLMCacheMiss in replay mode)."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._load_index()
+            response = self._read(key)
+            if response is None:
+                self.misses += 1
+                if self.mode == CACHE_MODE_REPLAY:
+                    raise LLMCacheMiss(f"No cached LLM response for key {key} (replay mode)")
+                return None
+            self.hits += 1
+            return response
+
+    def _read(self, key):
+        path = self._path(key)
+        if key not in self._index or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Dropping unreadable LLM cache entry {key}: {e}")
+            self._remove(key)
+            return None
+        # Replay must stay deterministic, so expired entries are still served there
+        if self.mode != CACHE_MODE_REPLAY and time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            self._remove(key)
+            return None
+        self._index.move_to_end(key)
+        if self.mode != CACHE_MODE_REPLAY:
+            os.utime(path)
+        return entry.get("response")
+
+    def put(self, key, response, model_id=None, params=None):
+        if self.mode != CACHE_MODE_READ_WRITE or response is None:
+            return
+        entry = json.dumps({
+            "model_id": model_id,
+            "params": params,
+            "created_at": time.time(),
+            "response": response
+        })
+        path = self._path(key)
+        with self._lock:
+            self._load_index()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(entry)
+            os.replace(tmp_path, path)
+            self._total_bytes += len(entry) - self._index.pop(key, 0)
+            self._index[key] = len(entry)
+            self._evict()
+
+    def invalidate(self, key):
+        """Drop the entry for key, e.g. a response its caller rejected. Replay mode keeps its entries."""
+        if self.mode != CACHE_MODE_READ_WRITE:
+            return
+        with self._lock:
+            self._load_index()
+            self._remove(key)
+
+    def _remove(self, key):
+        self._total_bytes -= self._index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._index and (len(self._index) > self.max_entries or self._total_bytes > self.max_bytes):
+            oldest_key = next(iter(self._index))
+            self._remove(oldest_key)
+
+    def stats(self):
+        with self._lock:
+            self._load_index()
+            return {
+                "mode": self.mode,
+                "entries": len(self._index),
+                "size_bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,129 @@
+"""
+Concurrent Bedrock client.
+
+One boto3 client with a pooled HTTP connection set is shared by every
+caller (boto3 clients are thread-safe). Each call builds its own request
+payload, a semaphore bounds how many requests are in flight at once, and
+ainvoke lets asyncio callers await a call without blocking the event loop.
+"""
+import asyncio
+import contextvars
+import functools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+
+from token_accounting import count_tokens
+
+
+class BedrockLLMClient:
+    def __init__(self, model_id, sampling_params, aws_config, cache=None, ledger=None, max_concurrency=4,
+                 max_pool_connections=16, read_timeout=300):
+        self.model_id = model_id
+        self.sampling_params = dict(sampling_params)
+        self.cache = cache
+        self.ledger = ledger
+        self.max_concurrency = max_concurrency
+        self._in_flight = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_pool_connections, thread_name_prefix="bedrock")
+        aws_config = aws_config or {}
+        self._bedrock = boto3.client(
+            service_name='bedrock-runtime',
+            region_name=aws_config.get('region_name'),
+            aws_access_key_id=aws_config.get('AWS_ACCESS_KEY_ID'),
+            aws_secret_access_key=aws_config.get('AWS_SECRET_ACCESS_KEY'),
+            aws_session_token=aws_config.get('AWS_SESSION_TOKEN'),
+            config=Config(max_pool_connections=max_pool_connections, read_timeout=read_timeout)
+        )
+
+    @classmethod
+    def from_config(cls, model_id, sampling_params, config, cache=None, ledger=None):
+        llm_config = config.get('llm', {}) or {}
+        return cls(
+            model_id,
+            sampling_params,
+            config.get('aws', {}),
+            cache=cache,
+            ledger=ledger,
+            max_concurrency=int(llm_config.get('max_concurrency', 4)),
+            max_pool_connections=int(llm_config.get('max_pool_connections', 16)),
+            read_timeout=int(llm_config.get('read_timeout', 300))
+        )
+
+    def build_payload(self, prompt):
+        """Fresh request body per call, nothing shared between concurrent requests."""
+        return json.dumps({
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            **self.sampling_params
+        })
+
+    def invoke(self, prompt, call_site="other"):
+        """
+        Blocking call: cache lookup, budget check, then Bedrock invoke_model within the
+        in-flight limit. Token usage is recorded against call_site.
+        """
+        started = time.perf_counter()
+        prompt_tokens = count_tokens(prompt)
+        print(f"Token count: {prompt_tokens} ({call_site})")
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(self.model_id, self.sampling_params, prompt)
+            cached_response = self.cache.get(cache_key)
+            if cached_response is not None:
+                print(f"♻️ LLM cache hit: {cache_key[:12]}")
+                self._record(call_site, prompt_tokens, count_tokens(cached_response), started, cached=True)
+                return cached_response
+
+        if self.ledger is not None:
+            self.ledger.check_budget(prompt_tokens, call_site)
+
+        body = self.build_payload(prompt)
+        with self._in_flight:
+            response = self._bedrock.invoke_model(
+                modelId=self.model_id,
+                body=body,
+                contentType="application/json",
+                accept="application/json"
+            )
+            response_body = json.loads(response["body"].read())
+
+        # Extract content
+        response_text = response_body["choices"][0]["message"]["content"]
+        if cache_key is not None:
+            self.cache.put(cache_key, response_text, self.model_id, self.sampling_params)
+
+        # Prefer the provider's own usage numbers when the response carries them
+        usage = response_body.get("usage") or {}
+        self._record(
+            call_site,
+            usage.get("prompt_tokens") or prompt_tokens,
+            usage.get("completion_tokens") or count_tokens(response_text),
+            started
+        )
+        return response_text
+
+    def invalidate(self, prompt):
+        """Forget the cached response to prompt after the caller rejected it, so a retry asks the model again."""
+        if self.cache is not None:
+            self.cache.invalidate(self.cache.make_key(self.model_id, self.sampling_params, prompt))
+
+    def _record(self, call_site, prompt_tokens, completion_tokens, started, cached=False):
+        if self.ledger is not None:
+            self.ledger.record(call_site, prompt_tokens, completion_tokens,
+                               (time.perf_counter() - started) * 1000, cached)
+
+    async def ainvoke(self, prompt, call_site="other"):
+        loop = asyncio.get_running_loop()
+        # Run in the caller's context so the test case scope follows the call into the worker thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, functools.partial(context.run, self.invoke, prompt, call_site))
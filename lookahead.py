@@ -0,0 +1,61 @@
+"""
+Lookahead generation of consecutive steps.
+
+Steps that act on the same screen (tap a field, then type into it) can be
+resolved together: one prompt carries the current snapshot and the next
+steps, and the response holds a code block per step. The blocks are only
+used while the screen keeps its structure, the classes and resource ids of
+its elements, which typing text or toggling a checkbox does not change. The
+Feature/POM fragments of the steps run from a batch are correlated together
+in one call once the batch is done or abandoned, keeping one block per step. On the first mismatch or failure the rest
+of the batch is dropped and the remaining steps of the test case are
+generated one at a time.
+"""
+import hashlib
+import re
+
+STEP_BLOCK = re.compile(r'<StepDetails\s+index\s*=\s*["\']?(\d+)["\']?\s*>(.*?)</StepDetails>', re.DOTALL | re.IGNORECASE)
+
+
+def structure_fingerprint(ui_elements):
+    """Fingerprint of the screen's layout: the set of (class, resource_id) of its elements, ignoring text and state."""
+    pairs = sorted({(element.get("class") or "", element.get("resource_id") or "") for element in ui_elements})
+    digest = hashlib.blake2b(digest_size=16)
+    for class_name, resource_id in pairs:
+        digest.update(f"{class_name}\x1f{resource_id}\x1e".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def parse_step_blocks(raw):
+    """The response text of every <StepDetails index="N"> block, by step number."""
+    return {int(match.group(1)): match.group(2) for match in STEP_BLOCK.finditer(raw or "")}
+
+
+class LookaheadBatch:
+    def __init__(self, blocks, structure, prompt=None):
+        """
+        Args:
+            blocks: step number -> response text holding that step's <PythonDetails>, <FeatureDetails>, <POMDetails>
+            structure: structure_fingerprint of the screen the batch was generated on
+            prompt: the prompt the batch answers, to drop its cached response when a block turns out wrong
+        """
+        self.blocks = dict(blocks)
+        self.structure = structure
+        self.prompt = prompt
+        # Steps run from the batch whose Feature/POM fragments still await correlation
+        self.executed = []
+        self.dropped = False
+
+    def covers(self, idx):
+        return idx in self.blocks
+
+    def take(self, idx, structure):
+        """The block of step idx if the screen still has the batch's structure, else None."""
+        if structure != self.structure:
+            return None
+        return self.blocks.pop(idx, None)
+
+    def drop(self):
+        """Discard the blocks not run yet after a mismatch or failure; a dropped batch turns lookahead off."""
+        self.blocks.clear()
+        self.dropped = True
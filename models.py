@@ -1,10 +1,11 @@
 from pydantic import BaseModel
-from typing import List    
+from typing import List, Optional    
 
 class TestCase(BaseModel):
     test_case_id: int
     scenario_name: str
     steps: List[str]
+    resume: Optional[bool] = False  # replay the checkpointed steps of a previous run without LLM calls
 
 
 
@@ -16,3 +17,6 @@ class TestResult(BaseModel):
     pull_request_url: str = None
     errors: str 
     elements: str
+    token_usage: Optional[dict] = None
+    wait_report: Optional[list] = None
+    device: Optional[str] = None
@@ -0,0 +1,127 @@
+"""
+Compact UI context for step-resolution prompts.
+
+Only actionable elements are described (anything with a label, and
+clickable/focusable/input nodes with a resource id), empty and "None" fields
+are left out, identical rows are collapsed, and the remaining rows are
+ranked by lexical overlap with the step so the most relevant ones survive a
+hard token budget. Kept rows are emitted in screen order, so "the first X"
+in a step still refers to what the user sees first.
+"""
+import re
+
+from token_accounting import count_tokens
+
+EMPTY_VALUES = {"", "none", "null"}
+
+# Words too common in steps to say anything about which element is meant
+STOP_WORDS = {
+    "a", "an", "the", "on", "in", "into", "to", "of", "and", "or", "for", "with", "from", "at", "by",
+    "is", "it", "its", "this", "that", "then", "user", "should", "be", "as", "i", "my", "me", "page", "screen"
+}
+
+INPUT_VERBS = {"enter", "type", "input", "fill", "write", "search", "clear"}
+
+INPUT_CLASS_HINTS = ("EditText", "TextField", "SearchView", "AutoComplete")
+
+# Rows are "Label: value" pairs; the labels are the ones PROMPT_RULES refer to
+TEXT_FIELDS = (("text", "Text"), ("resource_id", "Resource-ID"), ("content_desc", "Content-Desc"), ("class", "Class"))
+
+
+def _value(element, column):
+    value = element.get(column)
+    if value is None:
+        return None
+    value = str(value).strip()
+    return None if value.lower() in EMPTY_VALUES else value
+
+
+def _is_true(element, column):
+    return _value(element, column) == "true"
+
+
+def _is_input(element):
+    class_name = _value(element, "class") or ""
+    return any(hint in class_name for hint in INPUT_CLASS_HINTS)
+
+
+def is_actionable(element):
+    """Labelled nodes, plus unlabelled nodes the user can still act on; bare layout containers are not."""
+    if _value(element, "text") or _value(element, "content_desc"):
+        return True
+    if _is_input(element):
+        return True
+    return bool(_value(element, "resource_id")) and (_is_true(element, "clickable") or _is_true(element, "focusable"))
+
+
+def format_element(element):
+    parts = [f"{label}: {_value(element, column)}" for column, label in TEXT_FIELDS if _value(element, column)]
+    # Focusable is always stated because non-focusable elements need @focusable='false' in the XPath
+    parts.append(f"Focusable: {_value(element, 'focusable') or 'false'}")
+    if _value(element, "enabled") == "false":
+        parts.append("Enabled: false")
+    for column, label in (("clickable", "Clickable"), ("focused", "Focused"), ("selected", "Selected")):
+        if _is_true(element, column):
+            parts.append(f"{label}: true")
+    return ", ".join(parts)
+
+
+def _words(text):
+    return {word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOP_WORDS}
+
+
+def score_element(element, step_words, quoted_phrases, wants_input):
+    """Cheap lexical relevance of an element to the step."""
+    labels = [_value(element, column) or "" for column in ("text", "content_desc", "resource_id")]
+    label_text = " ".join(labels).lower()
+    # resource ids like com.app:id/login_button contribute "login" and "button"
+    score = 2 * len(step_words & _words(label_text.replace("_", " ")))
+    for phrase in quoted_phrases:
+        if phrase in label_text:
+            score += 5
+            if phrase in (labels[0].lower(), labels[1].lower()):
+                score += 5
+    if wants_input and _is_input(element):
+        score += 3
+    return score
+
+
+def build_ui_context(step, ui_elements, max_tokens=0):
+    """
+    Describe the actionable elements of ui_elements for step within max_tokens (0 disables the budget).
+
+    Returns:
+        tuple: (context, kept, total) where kept/total count actionable rows after de-duplication
+    """
+    rows = []
+    seen = set()
+    for element in ui_elements:
+        if not is_actionable(element):
+            continue
+        row = format_element(element)
+        if row in seen:
+            continue
+        seen.add(row)
+        rows.append((element, row))
+
+    step = step or ""
+    quoted_phrases = [phrase.strip().lower() for phrase in re.findall(r"['\"]([^'\"]+)['\"]", step) if phrase.strip()]
+    step_words = _words(step)
+    wants_input = bool(step_words & INPUT_VERBS)
+
+    ranked = sorted(
+        range(len(rows)),
+        key=lambda position: (-score_element(rows[position][0], step_words, quoted_phrases, wants_input), position)
+    )
+
+    selected = []
+    used_tokens = 0
+    for position in ranked:
+        row_tokens = count_tokens(rows[position][1]) + 1
+        if max_tokens and selected and used_tokens + row_tokens > max_tokens:
+            continue
+        selected.append(position)
+        used_tokens += row_tokens
+
+    context = "\n".join(rows[position][1] for position in sorted(selected))
+    return context, len(selected), len(rows)
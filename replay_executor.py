@@ -0,0 +1,155 @@
+"""
+Replay of recorded runs without the LLM.
+
+A run's generated code is recorded step by step ("# Step N: <text>" headers
+followed by the validated snippet). The replay executor compiles every
+snippet once, runs them back to back against a driver with UI idle waits in
+between, and reports the time spent executing and waiting per step, which
+makes smoke-testing a new APK build a matter of seconds.
+"""
+import json
+import os
+import re
+import time
+import uuid
+from collections import namedtuple
+
+from snippet_executor import SnippetRejected
+
+STEP_HEADER = re.compile(r"^# Step (\d+): (.*)$")
+
+RecordedStep = namedtuple("RecordedStep", ["idx", "step", "code"])
+
+
+def format_step_header(idx, step):
+    return f"# Step {idx}: {' '.join(str(step).split())}"
+
+
+def parse_generated_code(text):
+    """Split recorded generated code into RecordedStep entries; code before the first header is ignored."""
+    steps = []
+    current = None
+    for line in text.splitlines():
+        match = STEP_HEADER.match(line)
+        if match:
+            if current:
+                steps.append(RecordedStep(current[0], current[1], "\n".join(current[2]).strip()))
+            current = (int(match.group(1)), match.group(2), [])
+        elif current is not None:
+            current[2].append(line)
+    if current:
+        steps.append(RecordedStep(current[0], current[1], "\n".join(current[2]).strip()))
+    return steps
+
+
+class RecordedRun:
+    def __init__(self, test_case_id, scenario_name, steps):
+        self.test_case_id = str(test_case_id)
+        self.scenario_name = scenario_name
+        self.steps = list(steps)
+
+    @classmethod
+    def from_generated_code(cls, test_case_id, scenario_name, text):
+        return cls(test_case_id, scenario_name, parse_generated_code(text))
+
+    @staticmethod
+    def _path(directory, test_case_id):
+        safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", str(test_case_id))
+        return os.path.join(directory, f"{safe_id}.json")
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        path = self._path(directory, self.test_case_id)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "test_case_id": self.test_case_id,
+                "scenario_name": self.scenario_name,
+                "steps": [step._asdict() for step in self.steps]
+            }, f, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, directory, test_case_id):
+        """The recorded run of test_case_id, or None if it was never recorded."""
+        try:
+            with open(cls._path(directory, test_case_id), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        return cls(data["test_case_id"], data.get("scenario_name"),
+                   [RecordedStep(step["idx"], step["step"], step["code"]) for step in data["steps"]])
+
+
+class ReplayExecutor:
+    def __init__(self, execute, waiter, compile_snippet):
+        """
+        Args:
+            execute: callable(driver, code) running a compiled snippet, with its own stale-element retries
+            waiter: UiIdleWaiter used between steps
+            compile_snippet: callable(code) returning a cached code object, raising SnippetRejected
+        """
+        self.execute = execute
+        self.waiter = waiter
+        self.compile_snippet = compile_snippet
+
+    def replay(self, driver, run, stop_on_failure=True):
+        """
+        Run every recorded step of run against driver.
+
+        Returns:
+            dict: {"test_case_id", "status", "total_ms", "steps": [{"idx", "step", "status", "compile_ms", "exec_ms",
+            "wait_ms", "error"}]}
+        """
+        started = time.perf_counter()
+        report = {"test_case_id": run.test_case_id, "status": "success", "total_ms": 0, "steps": []}
+
+        # Compile everything first, a broken snippet fails the replay before the device is touched
+        compiled = []
+        for recorded in run.steps:
+            compile_started = time.perf_counter()
+            try:
+                compiled.append(self.compile_snippet(recorded.code))
+            except SnippetRejected as e:
+                report["status"] = "failed"
+                report["steps"].append(self._step_report(recorded, "failed", compile_started, error=str(e)))
+                report["total_ms"] = round((time.perf_counter() - started) * 1000)
+                return report
+            report["steps"].append(self._step_report(recorded, "pending", compile_started))
+
+        for recorded, code, step_report in zip(run.steps, compiled, report["steps"]):
+            exec_started = time.perf_counter()
+            try:
+                self.execute(driver, code)
+                step_report["status"] = "success"
+            except Exception as e:
+                step_report["status"] = "failed"
+                step_report["error"] = str(e)
+                report["status"] = "failed"
+            step_report["exec_ms"] = round((time.perf_counter() - exec_started) * 1000)
+            print(f"▶️ Replayed step {recorded.idx} ({step_report['status']}, {step_report['exec_ms']} ms): {recorded.step}")
+            if step_report["status"] == "failed" and stop_on_failure:
+                break
+
+            wait_started = time.perf_counter()
+            self.waiter.wait_for_idle(driver, "after_step")
+            step_report["wait_ms"] = round((time.perf_counter() - wait_started) * 1000)
+
+        for step_report in report["steps"]:
+            if step_report["status"] == "pending":
+                step_report["status"] = "skipped"
+        report["total_ms"] = round((time.perf_counter() - started) * 1000)
+        return report
+
+    @staticmethod
+    def _step_report(recorded, status, compile_started, error=None):
+        return {
+            "idx": recorded.idx,
+            "step": recorded.step,
+            "status": status,
+            "compile_ms": round((time.perf_counter() - compile_started) * 1000, 3),
+            "exec_ms": None,
+            "wait_ms": None,
+            "error": error
+        }
@@ -0,0 +1,182 @@
+"""
+One retry budget per test step, shared by every retry layer.
+
+Code execution, element lookups, UI extraction, scrolling and step
+regeneration all retry inside each other. Instead of each layer counting its
+own attempts with its own waits, they classify the error, draw from the
+budget of the step they run in and stop once its wall-clock deadline or LLM
+call allowance is used up, so the worst case of a step is capped. Stale
+element errors wait for the UI to settle, transient driver errors back off
+exponentially with jitter, anything else is not retried.
+"""
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+STALE = "stale"
+TRANSIENT = "transient"
+FATAL = "fatal"
+
+STALE_EXCEPTIONS = {"StaleElementReferenceException", "NoSuchElementException"}
+TRANSIENT_EXCEPTIONS = {"ConnectionError", "ProtocolError", "ReadTimeoutError", "NewConnectionError"}
+
+STALE_INDICATORS = (
+    "stale",
+    "cached elements",
+    "do not exist in dom",
+    "element is no longer attached",
+    "element not found",
+    "no such element",
+    "elementscache.restore",
+    "elementscache.get"
+)
+TRANSIENT_INDICATORS = (
+    "connection reset",
+    "connection refused",
+    "connection aborted",
+    "remote end closed connection",
+    "socket hang up",
+    "max retries exceeded"
+)
+
+# Budget of the step currently running; copied into asyncio tasks and worker threads
+current_retry_budget = contextvars.ContextVar("current_retry_budget", default=None)
+
+
+class RetryBudgetExhausted(Exception):
+    """The step ran out of wall-clock time or LLM calls."""
+
+
+def classify_error(error):
+    """STALE, TRANSIENT or FATAL for an exception or error message."""
+    if isinstance(error, BaseException):
+        names = {cls.__name__ for cls in type(error).__mro__}
+        if names & STALE_EXCEPTIONS:
+            return STALE
+        if names & TRANSIENT_EXCEPTIONS:
+            return TRANSIENT
+    message = str(error).lower()
+    if any(indicator in message for indicator in STALE_INDICATORS):
+        return STALE
+    if any(indicator in message for indicator in TRANSIENT_INDICATORS):
+        return TRANSIENT
+    return FATAL
+
+
+@contextmanager
+def retry_budget_scope(budget):
+    """Make budget the one every retry inside the block draws from."""
+    token = current_retry_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        current_retry_budget.reset(token)
+
+
+class RetryPolicy:
+    def __init__(self, waiter, step_deadline_seconds=180, llm_calls_per_step=6, backoff_base_ms=250,
+                 backoff_max_ms=4000):
+        """
+        Args:
+            waiter: UiIdleWaiter used before retrying a stale element error
+            step_deadline_seconds: wall-clock budget of a step, 0 disables
+            llm_calls_per_step: code generation calls a step may make, 0 disables
+        """
+        self.waiter = waiter
+        self.step_deadline_seconds = step_deadline_seconds
+        self.llm_calls_per_step = llm_calls_per_step
+        self.backoff_base_ms = backoff_base_ms
+        self.backoff_max_ms = backoff_max_ms
+
+    @classmethod
+    def from_config(cls, retry_config, waiter):
+        retry_config = retry_config or {}
+        return cls(
+            waiter,
+            step_deadline_seconds=float(retry_config.get("step_deadline_seconds", 180)),
+            llm_calls_per_step=int(retry_config.get("llm_calls_per_step", 6)),
+            backoff_base_ms=int(retry_config.get("backoff_base_ms", 250)),
+            backoff_max_ms=int(retry_config.get("backoff_max_ms", 4000))
+        )
+
+    def new_budget(self, label=None):
+        return RetryBudget(self, label)
+
+    def current_budget(self):
+        """The budget of the running step; calls outside a step get a budget of their own."""
+        return current_retry_budget.get() or self.new_budget()
+
+    def backoff_ms(self, attempt):
+        """Full-jitter exponential backoff before retry number attempt + 1."""
+        return random.uniform(0, min(self.backoff_max_ms, self.backoff_base_ms * (2 ** attempt)))
+
+
+class RetryBudget:
+    def __init__(self, policy, label=None):
+        self.policy = policy
+        self.label = label
+        self.started = time.monotonic()
+        self.deadline = self.started + policy.step_deadline_seconds if policy.step_deadline_seconds > 0 else None
+        self.llm_calls = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def remaining_seconds(self):
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+    def _deadline_reason(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return f"deadline of {self.policy.step_deadline_seconds:g}s passed"
+        return None
+
+    def exhausted_reason(self):
+        """Why the step may not go on trying (deadline passed or LLM calls used up), or None."""
+        reason = self._deadline_reason()
+        if reason is None and 0 < self.policy.llm_calls_per_step <= self.llm_calls:
+            reason = f"all {self.policy.llm_calls_per_step} LLM calls used"
+        return reason
+
+    def charge_llm_call(self):
+        """Account for one code generation call. Raises RetryBudgetExhausted when none is left."""
+        with self._lock:
+            reason = self.exhausted_reason()
+            if reason is None:
+                self.llm_calls += 1
+        if reason is not None:
+            raise RetryBudgetExhausted(f"Retry budget of {self.label or 'step'} exhausted: {reason}")
+
+    def retry(self, driver, error, attempt, max_attempts, retry_on=(STALE, TRANSIENT)):
+        """
+        Decide whether the operation that raised error on attempt (0-based) runs again, and wait before it does.
+
+        Returns:
+            bool: True after waiting for the retry, False when error is not retryable or the budget is used up
+        """
+        kind = classify_error(error)
+        if kind not in retry_on or attempt + 1 >= max_attempts:
+            return False
+        # Only the deadline limits device retries; the last snippet an LLM call paid for may still need them
+        reason = self._deadline_reason()
+        if reason is not None:
+            print(f"⛔ Not retrying {kind} error, {reason}")
+            return False
+        with self._lock:
+            self.retries += 1
+        print(f"🔄 Retrying {kind} error (attempt {attempt + 1}/{max_attempts}): {str(error).splitlines()[0] if str(error) else type(error).__name__}")
+        if kind == STALE and driver is not None:
+            self.policy.waiter.wait_for_idle(driver, "stale")
+        else:
+            delay = self.policy.backoff_ms(attempt) / 1000
+            remaining = self.remaining_seconds()
+            time.sleep(delay if remaining is None else min(delay, remaining))
+        return True
+
+    def summary(self):
+        return {
+            "elapsed_ms": round((time.monotonic() - self.started) * 1000),
+            "llm_calls": self.llm_calls,
+            "retries": self.retries,
+            "exhausted": self.exhausted_reason()
+        }
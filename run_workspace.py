@@ -0,0 +1,84 @@
+"""
+Per-run scratch workspace.
+
+A run collects the executed Appium code and the Cucumber/POM fragments of
+every step before the final files are generated. Each run keeps them in its
+own in-memory buffers, so concurrent runs never share a file. A buffer that
+grows past spill_bytes moves to a file in the run's own directory, and with
+keep_files every buffer is written there when the run ends.
+"""
+import io
+import os
+import shutil
+import threading
+import uuid
+
+
+class RunWorkspace:
+    def __init__(self, run_id, directory=".runs", spill_bytes=8 * 1024 * 1024, keep_files=False):
+        self.run_id = run_id
+        self.path = os.path.join(directory, run_id)
+        # 0 never spills
+        self.spill_bytes = spill_bytes
+        self.keep_files = keep_files
+        self._lock = threading.Lock()
+        self._buffers = {}
+        self._sizes = {}
+
+    @classmethod
+    def from_config(cls, test_case_id, workspace_config):
+        workspace_config = workspace_config or {}
+        return cls(
+            f"{test_case_id}-{uuid.uuid4().hex[:8]}",
+            directory=workspace_config.get("directory", ".runs"),
+            spill_bytes=int(float(workspace_config.get("spill_mb", 8)) * 1024 * 1024),
+            keep_files=bool(workspace_config.get("keep_files", False))
+        )
+
+    def _open_file(self, name):
+        os.makedirs(self.path, exist_ok=True)
+        return open(os.path.join(self.path, name), "w+", encoding="utf-8")
+
+    def append(self, name, text):
+        with self._lock:
+            buffer = self._buffers.get(name)
+            if buffer is None:
+                buffer = self._buffers[name] = io.StringIO()
+            buffer.write(text)
+            self._sizes[name] = self._sizes.get(name, 0) + len(text)
+            if self.spill_bytes and isinstance(buffer, io.StringIO) and self._sizes[name] > self.spill_bytes:
+                spilled = self._open_file(name)
+                spilled.write(buffer.getvalue())
+                self._buffers[name] = spilled
+                print(f"💾 Workspace buffer {name} spilled to {spilled.name}")
+
+    def read(self, name):
+        with self._lock:
+            buffer = self._buffers.get(name)
+            if buffer is None:
+                return ""
+            if isinstance(buffer, io.StringIO):
+                return buffer.getvalue()
+            buffer.flush()
+            buffer.seek(0)
+            content = buffer.read()
+            buffer.seek(0, io.SEEK_END)
+            return content
+
+    def close(self):
+        """Write the buffers out when keep_files is set, otherwise drop the run directory."""
+        with self._lock:
+            for name, buffer in self._buffers.items():
+                if self.keep_files and isinstance(buffer, io.StringIO):
+                    with self._open_file(name) as f:
+                        f.write(buffer.getvalue())
+                buffer.close()
+            self._buffers = {}
+        if not self.keep_files and os.path.isdir(self.path):
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
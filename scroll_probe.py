@@ -0,0 +1,76 @@
+"""
+Scrollability from a single UI snapshot.
+
+Decides whether the current screen can scroll from the snapshot a step has
+already taken, without any extra Appium call: a node flagged scrollable, a
+known scrolling container class, or content whose bounds reach past the
+screen's root view. Decisions are cached by snapshot fingerprint, so asking
+again for the same screen costs nothing.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+SCROLLABLE_CLASSES = {
+    "android.widget.ScrollView",
+    "android.widget.HorizontalScrollView",
+    "android.widget.ListView",
+    "android.widget.GridView",
+    "android.widget.RecyclerView",
+    "androidx.recyclerview.widget.RecyclerView",
+    "android.support.v7.widget.RecyclerView",
+    "androidx.core.widget.NestedScrollView",
+    "androidx.viewpager.widget.ViewPager"
+}
+
+BOUNDS_PATTERN = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+
+
+def parse_bounds(bounds):
+    """(left, top, right, bottom) of a UiAutomator2 bounds string like "[0,0][1080,2400]", or None."""
+    match = BOUNDS_PATTERN.match(bounds or "")
+    return tuple(int(value) for value in match.groups()) if match else None
+
+
+def scrollable_reason(snapshot):
+    """Why the screen in snapshot is scrollable, or None if it is not."""
+    viewport = None
+    overflow = None
+    for element in snapshot:
+        if element.get("scrollable") == "true":
+            return f"scrollable {element.get('class')}"
+        if element.get("class") in SCROLLABLE_CLASSES:
+            return f"scrolling container {element.get('class')}"
+        bounds = parse_bounds(element.get("bounds"))
+        if bounds is None:
+            continue
+        if viewport is None:
+            # The first node is the window's root view
+            viewport = bounds
+        elif overflow is None and bounds[3] > viewport[3]:
+            overflow = f"content reaches {bounds[3]}px, screen height is {viewport[3]}px"
+    return overflow
+
+
+class ScrollProbe:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._decisions = OrderedDict()
+
+    def is_scrollable(self, snapshot):
+        fingerprint = snapshot.fingerprint
+        with self._lock:
+            if fingerprint in self._decisions:
+                self._decisions.move_to_end(fingerprint)
+                return self._decisions[fingerprint]
+        reason = scrollable_reason(snapshot)
+        if reason:
+            print(f"L105: ✅ Page is scrollable - {reason}")
+        else:
+            print("L153: ❌ Page does not appear to be scrollable")
+        with self._lock:
+            self._decisions[fingerprint] = reason is not None
+            while len(self._decisions) > self.max_entries:
+                self._decisions.popitem(last=False)
+        return reason is not None
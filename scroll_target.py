@@ -0,0 +1,61 @@
+"""
+Targeted scroll-to-element for steps that name their target.
+
+Quoted labels in a step ("Tap 'Settings'") are pulled out locally, and a
+single device-side UiScrollable.scrollIntoView brings the matching element on
+screen: exact text first, then text containing the label, then a horizontal
+list. The step is then generated once against the screen that shows its
+target, instead of scrolling blindly and prompting after every scroll.
+"""
+import re
+
+from appium.webdriver.common.appiumby import AppiumBy
+
+from constants import SCROLL_COMMANDS
+
+# "double", 'single' (not an apostrophe inside a word) and typographic quotes
+QUOTED_LABEL = re.compile(r'"([^"]+)"|(?<!\w)\'([^\']+)\'(?!\w)|“([^”]+)”|‘([^’]+)’')
+
+# Tried in order for every label, each is one UiScrollable call on the device
+SCROLL_TARGET_STRATEGIES = ("scroll_to_text_exact", "scroll_to_text_contains", "scroll_horizontal_to_text")
+
+
+def extract_target_labels(step):
+    """The quoted labels of a step, in order and without duplicates."""
+    labels = []
+    for match in QUOTED_LABEL.finditer(str(step)):
+        label = " ".join(next(group for group in match.groups() if group is not None).split())
+        if label and label not in labels:
+            labels.append(label)
+    return labels
+
+
+def uiselector_string(text):
+    """Escape text for a UiSelector string literal."""
+    return text.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def uiautomator_code(command):
+    """Step snippet that runs a UiAutomator command, to record a scroll with the step it made work."""
+    return f"driver.find_element(AppiumBy.ANDROID_UIAUTOMATOR, {command!r})"
+
+
+def scroll_to_target(driver, labels):
+    """
+    Scroll the first label that can be found into view.
+
+    Returns:
+        tuple: (label, strategy, code) of the element scrolled into view, code being the snippet that repeats the
+        scroll, or None if no label was found
+    """
+    for label in labels:
+        for strategy in SCROLL_TARGET_STRATEGIES:
+            command = SCROLL_COMMANDS[strategy](uiselector_string(label))
+            try:
+                driver.find_element(AppiumBy.ANDROID_UIAUTOMATOR, command)
+            except Exception as e:
+                print(f"L310: 🔎 {strategy} found no '{label}': {str(e).splitlines()[0] if str(e) else type(e).__name__}")
+                continue
+            print(f"L312: 🎯 Scrolled '{label}' into view using {strategy}")
+            return label, strategy, uiautomator_code(command)
+    return None
@@ -0,0 +1,200 @@
+"""
+Compile-once, validated execution of generated Appium snippets.
+
+Every snippet is parsed and checked before anything touches the device:
+imports, function/class/async definitions, undefined or dunder names,
+private attributes, calls like exec/eval/open, driver methods outside an
+allowlist (quit, new sessions, app install/reset), execute_script with
+anything but a gesture command and any way of aliasing the driver are
+rejected with SnippetRejected, as are syntax errors. Accepted snippets are
+compiled once and their code objects cached by content hash, so retries, memo
+hits, checkpoint resumes and replays of the same code never parse it again.
+Snippets run with a fixed set of names and a reduced set of builtins.
+"""
+import ast
+import builtins
+import hashlib
+import threading
+import types
+from collections import OrderedDict
+
+
+class SnippetRejected(ValueError):
+    """A generated snippet does not compile or uses something it may not."""
+
+
+# driver methods and properties a step may use; anything else (quit, start_session, install_app, ...) is rejected
+DRIVER_ATTRIBUTES = frozenset({
+    "find_element", "find_elements", "back", "hide_keyboard", "is_keyboard_shown", "press_keycode",
+    "long_press_keycode", "keyevent", "swipe", "tap", "scroll", "drag_and_drop", "flick",
+    "page_source", "current_activity", "current_package", "get_window_size", "get_window_rect", "orientation",
+    "implicitly_wait", "switch_to", "contexts", "context", "current_context", "activate_app", "background_app",
+    "query_app_state", "is_app_installed", "open_notifications", "get_clipboard_text", "set_clipboard_text",
+    "get_screenshot_as_base64", "get_screenshot_as_png", "save_screenshot", "capabilities"
+})
+
+# driver.execute_script is only accepted with one of these literal commands; "mobile: shell", installApp, removeApp,
+# clearApp and arbitrary scripts are rejected
+SAFE_MOBILE_COMMANDS = frozenset({
+    "mobile: scrollGesture", "mobile: swipeGesture", "mobile: flingGesture", "mobile: clickGesture",
+    "mobile: longClickGesture", "mobile: doubleClickGesture", "mobile: dragGesture", "mobile: pinchOpenGesture",
+    "mobile: pinchCloseGesture"
+})
+
+FORBIDDEN_CALLS = frozenset({
+    "exec", "eval", "compile", "open", "__import__", "globals", "locals", "vars", "getattr", "setattr", "delattr",
+    "input", "breakpoint", "exit", "quit", "help"
+})
+
+FORBIDDEN_NODES = (ast.Import, ast.ImportFrom, ast.Global, ast.Nonlocal, ast.FunctionDef, ast.ClassDef,
+                   ast.AsyncFunctionDef, ast.Await, ast.AsyncFor, ast.AsyncWith)
+
+# Attributes that hand back the driver from an element or a wait, e.g. element.parent
+DRIVER_LEAKING_ATTRIBUTES = frozenset({"parent", "driver"})
+
+SAFE_BUILTINS = {
+    name: getattr(builtins, name) for name in (
+        "abs", "all", "any", "bool", "dict", "enumerate", "Exception", "float", "IndexError", "int", "isinstance",
+        "iter", "KeyError", "len", "list", "max", "min", "next", "print", "range", "reversed", "round", "set", "sorted", "str",
+        "sum", "TimeoutError", "tuple", "ValueError", "zip"
+    )
+}
+
+
+class _SnippetValidator(ast.NodeVisitor):
+    """
+    Walks a snippet keeping track of the names that hold the driver: driver itself and, inside a lambda, its
+    parameters (WebDriverWait.until calls them with the driver). Those may only be used to reach an allowlisted
+    attribute or be passed to one of the provided names (WebDriverWait(driver, 10)), so the driver can never be
+    aliased, returned or handed to something that calls quit() on it.
+    """
+
+    def __init__(self, tree, names):
+        self.names = frozenset(names)
+        self.protected_names = self.names | {"driver"}
+        bound = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load)}
+        bound |= {node.name for node in ast.walk(tree) if isinstance(node, ast.ExceptHandler) and node.name}
+        bound |= {arg.arg for node in ast.walk(tree) if isinstance(node, ast.Lambda) for arg in _lambda_args(node)}
+        self.known_names = self.protected_names | frozenset(SAFE_BUILTINS) | bound
+        self.parents = {child: node for node in ast.walk(tree) for child in ast.iter_child_nodes(node)}
+        self.driver_names = frozenset({"driver"})
+
+    def generic_visit(self, node):
+        if isinstance(node, FORBIDDEN_NODES):
+            raise SnippetRejected(f"line {node.lineno}: {type(node).__name__} is not allowed in a step snippet")
+        super().generic_visit(node)
+
+    def visit_Lambda(self, node):
+        outer = self.driver_names
+        self.driver_names = outer | {arg.arg for arg in _lambda_args(node)}
+        try:
+            self.generic_visit(node)
+        finally:
+            self.driver_names = outer
+
+    def visit_Name(self, node):
+        if node.id.startswith("__"):
+            raise SnippetRejected(f"line {node.lineno}: name {node.id} is not allowed")
+        if not isinstance(node.ctx, ast.Load):
+            if node.id in self.protected_names:
+                raise SnippetRejected(f"line {node.lineno}: {node.id} must not be reassigned")
+            return
+        if node.id not in self.known_names:
+            raise SnippetRejected(f"line {node.lineno}: name {node.id} is not defined for step snippets")
+        if node.id in self.driver_names and not self._is_allowed_driver_use(node):
+            raise SnippetRejected(f"line {node.lineno}: {node.id} may only be used to call driver methods "
+                                  f"or be passed to {', '.join(sorted(self.names))}")
+
+    def _is_allowed_driver_use(self, node):
+        parent = self.parents.get(node)
+        if isinstance(parent, ast.Attribute):
+            # The attribute itself is checked against the allowlist in visit_Attribute
+            return True
+        if isinstance(parent, ast.keyword):
+            node, parent = parent, self.parents.get(parent)
+        return (isinstance(parent, ast.Call) and parent.func is not node and isinstance(parent.func, ast.Name)
+                and parent.func.id in self.names)
+
+    def visit_Attribute(self, node):
+        if node.attr.startswith("_"):
+            raise SnippetRejected(f"line {node.lineno}: private attribute {node.attr} is not allowed")
+        if node.attr in DRIVER_LEAKING_ATTRIBUTES:
+            raise SnippetRejected(f"line {node.lineno}: attribute {node.attr} is not allowed")
+        if isinstance(node.value, ast.Name) and node.value.id in self.driver_names and node.attr not in DRIVER_ATTRIBUTES:
+            raise SnippetRejected(f"line {node.lineno}: {node.value.id}.{node.attr} is not allowed")
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        if isinstance(node.func, ast.Name) and node.func.id in FORBIDDEN_CALLS:
+            raise SnippetRejected(f"line {node.lineno}: {node.func.id}() is not allowed")
+        func = node.func
+        if (isinstance(func, ast.Attribute) and func.attr == "execute_script" and isinstance(func.value, ast.Name)
+                and func.value.id in self.driver_names):
+            command = node.args[0] if node.args else None
+            if not (isinstance(command, ast.Constant) and command.value in SAFE_MOBILE_COMMANDS):
+                raise SnippetRejected(f"line {node.lineno}: {func.value.id}.execute_script is only allowed with one of "
+                                      f"{', '.join(sorted(SAFE_MOBILE_COMMANDS))}")
+            # The attribute itself is not in DRIVER_ATTRIBUTES, so only its receiver and the arguments are visited
+            for child in [func.value, *node.args, *node.keywords]:
+                self.visit(child)
+            return
+        self.generic_visit(node)
+
+
+def _lambda_args(node):
+    args = node.args
+    return [*args.posonlyargs, *args.args, *args.kwonlyargs, *filter(None, (args.vararg, args.kwarg))]
+
+
+def validate_snippet(tree, names):
+    """
+    Raise SnippetRejected for the first disallowed node of tree, before anything runs.
+    names are the objects provided to every snippet besides driver.
+    """
+    _SnippetValidator(tree, names).visit(tree)
+
+
+class SnippetExecutor:
+    def __init__(self, names, max_entries=1024):
+        """
+        Args:
+            names: objects every snippet can use besides driver, e.g. {"By": By, "time": time}
+            max_entries: compiled (or rejected) snippets kept by content hash
+        """
+        self._globals = {**names, "__builtins__": SAFE_BUILTINS}
+        self.names = frozenset(names)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._compiled = OrderedDict()
+
+    def compile(self, code):
+        """The cached code object of code. Raises SnippetRejected when it is invalid or not allowed."""
+        if isinstance(code, types.CodeType):
+            return code
+        key = hashlib.blake2b(code.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            if key in self._compiled:
+                self._compiled.move_to_end(key)
+                compiled = self._compiled[key]
+                if isinstance(compiled, SnippetRejected):
+                    raise SnippetRejected(str(compiled))
+                return compiled
+        try:
+            tree = ast.parse(code, "<snippet>", "exec")
+            validate_snippet(tree, self.names)
+            compiled = compile(tree, "<snippet>", "exec")
+        except SyntaxError as e:
+            compiled = SnippetRejected(f"SyntaxError: {e}")
+        except SnippetRejected as e:
+            compiled = e
+        with self._lock:
+            self._compiled[key] = compiled
+            while len(self._compiled) > self.max_entries:
+                self._compiled.popitem(last=False)
+        if isinstance(compiled, SnippetRejected):
+            raise compiled
+        return compiled
+
+    def run(self, driver, code):
+        """Run code (source or a code object from compile) against driver in a fresh namespace."""
+        exec(self.compile(code), {**self._globals, "driver": driver})
@@ -0,0 +1,78 @@
+"""
+Minimal dependency-graph pipeline for asyncio stages.
+
+Every stage starts as soon as the stages it depends on have finished, so
+independent stages (typically LLM calls) run concurrently. A failed stage
+skips its dependents but lets unrelated branches finish, and every stage is
+timed relative to the start of the pipeline.
+"""
+import asyncio
+import time
+from collections import namedtuple
+
+# func is an async callable receiving {dependency name: result}
+Stage = namedtuple("Stage", ["name", "func", "depends_on"])
+
+
+class StageSkipped(Exception):
+    """A stage did not run because one of its dependencies failed."""
+
+
+async def run_stages(stages):
+    """
+    Run stages respecting their dependencies.
+
+    Returns:
+        tuple: (results, report) where results maps stage name -> result and report lists
+        {"stage", "status", "started_ms", "duration_ms", "error"} in declaration order
+    """
+    pipeline_started = time.perf_counter()
+    stage_names = {stage.name for stage in stages}
+    for stage in stages:
+        unknown = set(stage.depends_on) - stage_names
+        if unknown:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stages {sorted(unknown)}")
+
+    tasks = {}
+    timings = {}
+
+    async def run_stage(stage):
+        inputs = {}
+        for dependency in stage.depends_on:
+            try:
+                inputs[dependency] = await tasks[dependency]
+            except Exception as e:
+                timings[stage.name] = {"stage": stage.name, "status": "skipped", "started_ms": None,
+                                       "duration_ms": None, "error": f"dependency '{dependency}' failed"}
+                raise StageSkipped(stage.name) from e
+        started = time.perf_counter()
+        status, error = "success", None
+        try:
+            return await stage.func(inputs)
+        except Exception as e:
+            status, error = "failed", str(e)
+            raise
+        finally:
+            timings[stage.name] = {
+                "stage": stage.name,
+                "status": status,
+                "started_ms": round((started - pipeline_started) * 1000),
+                "duration_ms": round((time.perf_counter() - started) * 1000),
+                "error": error
+            }
+            print(f"⏱️ Stage {stage.name}: {status} in {timings[stage.name]['duration_ms']} ms")
+
+    # Dependencies must exist before dependents await them, so create tasks in topological order
+    pending = list(stages)
+    while pending:
+        ready = [stage for stage in pending if all(dependency in tasks for dependency in stage.depends_on)]
+        if not ready:
+            raise ValueError(f"Stage dependency cycle between {[stage.name for stage in pending]}")
+        for stage in ready:
+            tasks[stage.name] = asyncio.ensure_future(run_stage(stage))
+            pending.remove(stage)
+
+    outcomes = await asyncio.gather(*tasks.values(), return_exceptions=True)
+    results = {name: outcome for name, outcome in zip(tasks, outcomes) if not isinstance(outcome, BaseException)}
+    report = [timings[stage.name] for stage in stages]
+    return results, report
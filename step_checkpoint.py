@@ -0,0 +1,99 @@
+"""
+Step checkpoints per test case.
+
+Every step that succeeds stores its validated Appium code and Feature/POM
+fragments under the test case id. A resumed run replays the checkpointed
+prefix of its steps without any LLM call and only generates from the first
+step that has no checkpoint (or whose replay fails).
+"""
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+from step_memo import normalize_step
+
+
+class StepCheckpoints:
+    def __init__(self, directory=".checkpoints", enabled=True):
+        self.directory = directory
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, checkpoint_config):
+        checkpoint_config = checkpoint_config or {}
+        return cls(
+            directory=checkpoint_config.get("directory", ".checkpoints"),
+            enabled=bool(checkpoint_config.get("enabled", True))
+        )
+
+    def _path(self, test_case_id):
+        safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", str(test_case_id))
+        return os.path.join(self.directory, f"{safe_id}.json")
+
+    def _load(self, test_case_id):
+        try:
+            with open(self._path(test_case_id), "r", encoding="utf-8") as f:
+                return json.load(f).get("steps", [])
+        except (OSError, ValueError):
+            return []
+
+    def _save(self, test_case_id, steps):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(test_case_id)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"test_case_id": str(test_case_id), "steps": steps}, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def record(self, test_case_id, idx, step, code, feature, pom):
+        """Checkpoint step idx (1-based); any later checkpoints are dropped, they no longer follow it."""
+        if not self.enabled or test_case_id is None or not code:
+            return
+        with self._lock:
+            steps = self._load(test_case_id)[:idx - 1]
+            if len(steps) != idx - 1:
+                # A gap means an earlier step was not checkpointed, the prefix cannot be resumed past it
+                return
+            steps.append({
+                "idx": idx,
+                "step": step,
+                "code": code,
+                "feature": feature,
+                "pom": pom,
+                "recorded_at": time.time()
+            })
+            self._save(test_case_id, steps)
+
+    def completed_prefix(self, test_case_id, steps):
+        """Checkpoints of the leading steps that still match the test case's steps, in order."""
+        if not self.enabled:
+            return []
+        with self._lock:
+            checkpoints = self._load(test_case_id)
+        prefix = []
+        for step, checkpoint in zip(steps, checkpoints):
+            if normalize_step(step) != normalize_step(checkpoint["step"]):
+                break
+            prefix.append(checkpoint)
+        return prefix
+
+    def truncate(self, test_case_id, completed):
+        """Keep only the first `completed` checkpoints, e.g. after step completed+1 failed to replay."""
+        if not self.enabled:
+            return
+        with self._lock:
+            steps = self._load(test_case_id)
+            if len(steps) > completed:
+                self._save(test_case_id, steps[:completed])
+
+    def clear(self, test_case_id):
+        if not self.enabled:
+            return
+        with self._lock:
+            path = self._path(test_case_id)
+            if os.path.exists(path):
+                os.remove(path)
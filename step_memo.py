@@ -0,0 +1,158 @@
+"""
+Persistent step-to-code memo.
+
+Maps (normalized step text, screen activity, UI snapshot fingerprint) to the
+validated Appium snippet and the Feature/POM fragments generated for it, so
+a step that already succeeded on an identical screen can run again without
+any LLM call.
+
+Entries are appended to a JSON lines log, one compact line per record or
+forget, and the log is rewritten only once superseded lines outnumber the
+live entries. Entries older than the TTL and the oldest ones beyond
+max_entries are dropped.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+# The log is not compacted while it is shorter than this
+MIN_COMPACT_LINES = 64
+
+
+def normalize_step(step):
+    """Lower-case, collapse whitespace and drop trailing punctuation of a step."""
+    return re.sub(r"\s+", " ", step).strip().rstrip(".;: ").lower()
+
+
+class StepMemo:
+    def __init__(self, path=".step_memo.jsonl", enabled=True, max_entries=5000, ttl_days=30):
+        """
+        Args:
+            max_entries: entries kept, the oldest recorded are dropped first, 0 disables
+            ttl_days: entries older than this are dropped, 0 disables
+        """
+        self.path = path
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_days * 86400
+        self._lock = threading.Lock()
+        # Ordered from the oldest record to the newest
+        self._entries = None
+        self._log_lines = 0
+
+    @classmethod
+    def from_config(cls, memo_config):
+        memo_config = memo_config or {}
+        return cls(
+            path=memo_config.get("path", ".step_memo.jsonl"),
+            enabled=bool(memo_config.get("enabled", True)),
+            max_entries=int(memo_config.get("max_entries", 5000)),
+            ttl_days=float(memo_config.get("ttl_days", 30))
+        )
+
+    def make_key(self, step, activity, fingerprint):
+        material = "\x1f".join([normalize_step(step), activity or "", fingerprint or ""])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        self._log_lines = 0
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        record = json.loads(line)
+                        self._log_lines += 1
+                        key = record.pop("key")
+                        # A later line supersedes the earlier ones and moves the entry to the newest end
+                        self._entries.pop(key, None)
+                        if not record.get("forgotten"):
+                            self._entries[key] = record
+            except (OSError, ValueError, KeyError, AttributeError) as e:
+                # Keeps the entries read so far, e.g. before a line cut off by a crash
+                print(f"⚠️ Ignoring the rest of unreadable step memo {self.path}: {e}")
+        self._evict()
+
+    def _expired(self, entry, now):
+        return self.ttl_seconds > 0 and now - entry.get("recorded_at", 0) > self.ttl_seconds
+
+    def _evict(self):
+        """Drop expired entries and the oldest ones beyond max_entries. Returns the dropped keys."""
+        now = time.time()
+        dropped = [key for key, entry in self._entries.items() if self._expired(entry, now)]
+        for key in dropped:
+            del self._entries[key]
+        if self.max_entries > 0:
+            overflow = list(self._entries)[:max(0, len(self._entries) - self.max_entries)]
+            for key in overflow:
+                del self._entries[key]
+            dropped += overflow
+        return dropped
+
+    def _append(self, *records):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._log_lines += len(records)
+        if self._log_lines > max(2 * len(self._entries), MIN_COMPACT_LINES):
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the log with one line per live entry."""
+        tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for key, entry in self._entries.items():
+                f.write(json.dumps({"key": key, **entry}, separators=(",", ":")) + "\n")
+        os.replace(tmp_path, self.path)
+        self._log_lines = len(self._entries)
+
+    def lookup(self, step, activity, fingerprint):
+        """Return {"code", "feature", "pom", ...} for a previously validated step, or None."""
+        if not self.enabled:
+            return None
+        key = self.make_key(step, activity, fingerprint)
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, time.time()):
+                del self._entries[key]
+                return None
+            return entry
+
+    def record(self, step, activity, fingerprint, code, feature, pom):
+        if not self.enabled or not code:
+            return
+        key = self.make_key(step, activity, fingerprint)
+        with self._lock:
+            self._load()
+            entry = {
+                "step": step,
+                "activity": activity,
+                "fingerprint": fingerprint,
+                "code": code,
+                "feature": feature,
+                "pom": pom,
+                "recorded_at": time.time()
+            }
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            # Dropped entries are logged as forgotten, a later forget could otherwise bring them back on load
+            dropped = self._evict()
+            self._append({"key": key, **entry}, *({"key": old_key, "forgotten": True} for old_key in dropped))
+
+    def forget(self, step, activity, fingerprint):
+        if not self.enabled:
+            return
+        key = self.make_key(step, activity, fingerprint)
+        with self._lock:
+            self._load()
+            if self._entries.pop(key, None) is not None:
+                self._append({"key": key, "forgotten": True})
@@ -1,20 +1,101 @@
 from utils import *
 from constants import PROMPT_RULES, MAX_RETRY_ATTEMPTS, SCROLL_COMMANDS
 # from github_client import create_pull_request
-import time
 import re
 from selenium.webdriver.common.by import By
 from appium.webdriver.common.appiumby import AppiumBy
 from models import TestCase
 from models import TestResult
+from ui_snapshot import SNAPSHOT_MODE_PAGE_SOURCE, SNAPSHOT_MODE_ELEMENTS, UiSnapshot, extract_ui_elements_from_page_source, benchmark_ui_extraction
+from step_memo import StepMemo
+from token_accounting import test_case_scope, current_test_case
+from step_checkpoint import StepCheckpoints
+from replay_executor import RecordedRun, ReplayExecutor
+from prompt_context import build_ui_context
+from scroll_probe import ScrollProbe
+from scroll_target import extract_target_labels, scroll_to_target, uiautomator_code
+from retry_policy import RetryBudgetExhausted, STALE, classify_error, retry_budget_scope
+from snippet_executor import SnippetRejected
+from lookahead import LookaheadBatch, parse_step_blocks, structure_fingerprint
+from device_scheduler import Device, DeviceScheduler
+from run_workspace import RunWorkspace
+from job_queue import JobManager, report_progress
+from ui_wait import WaitReport, wait_report_scope, current_wait_report
 max_retry_attempts = MAX_RETRY_ATTEMPTS
+ui_snapshot_mode = config.get('ui_snapshot', {}).get('mode', SNAPSHOT_MODE_PAGE_SOURCE)
+step_memo = StepMemo.from_config(config.get('step_memo'))
+# Scrollability decided from the step's own snapshot, cached per screen fingerprint
+scroll_probe = ScrollProbe()
+step_checkpoints = StepCheckpoints.from_config(config.get('checkpoints'))
+recordings_directory = config.get('replay', {}).get('directory', '.recordings')
+replay_executor = ReplayExecutor(execute_appium_code, ui_waiter, snippet_executor.compile)
+prompt_context_max_tokens = int(config.get('prompt_context', {}).get('max_tokens', 1500))
+# Consecutive steps resolved in one LLM call while the screen keeps its layout, below 2 disables
+lookahead_steps = int(config.get('lookahead', {}).get('steps', 0))
+
+
+def run_test(test_case: TestCase, pool=None) -> TestResult:
+    # Every LLM call made for this test case is charged to it in the token ledger
+    token_ledger.reset(test_case.test_case_id)
+    # Scratch output of this run only, so concurrent runs never share a file
+    workspace = RunWorkspace.from_config(test_case.test_case_id, config.get('workspace'))
+    with test_case_scope(test_case.test_case_id), wait_report_scope(WaitReport()), workspace:
+        # The session goes back to the pool before the files are generated
+        with (pool or driver_pool).lease() as driver:
+            return_exception, return_status, ui_elements = run_test_steps(test_case, driver, workspace)
+        return finish_test_case(test_case, workspace, return_exception, return_status, ui_elements)
+
+
+def run_test_on_device(test_case: TestCase, device: Device) -> TestResult:
+    report_progress("test_case_started", test_case_id=str(test_case.test_case_id), device=device.name)
+    try:
+        result = run_test(test_case, device.pool)
+    except Exception as e:
+        report_progress("test_case_finished", test_case_id=str(test_case.test_case_id), status="failed", error=str(e))
+        raise
+    result.device = device.name
+    report_progress("test_case_finished", test_case_id=str(test_case.test_case_id), status=result.status)
+    return result
+
+
+# Spreads test cases over every configured device, one worker and driver pool per device
+device_scheduler = DeviceScheduler([Device(name, pool) for name, pool in create_device_pools()], run_test_on_device)
+
+def replay_on_device(recording: RecordedRun, device: Device) -> dict:
+    with device.pool.lease() as driver:
+        ui_waiter.wait_for_idle(driver, "driver_start")
+        report = replay_executor.replay(driver, recording)
+    report["device"] = device.name
+    return report
+
+
+def replay_test_case(test_case_id):
+    """Replay the recorded run of a test case on the next free device, without any LLM call. None if never recorded."""
+    recording = RecordedRun.load(recordings_directory, test_case_id)
+    if recording is None:
+        return None
+    return device_scheduler.submit([recording], run=replay_on_device)[0].result()
+
+
+# Suites submitted without waiting, fed to the device scheduler through a bounded queue
+job_manager = JobManager.from_config(device_scheduler, config.get('jobs'))
 
 
-def run_test(test_case: TestCase) -> TestResult:
+def run_tests(test_cases) -> list:
+    """Run test_cases in parallel across the devices, results in the order of test_cases."""
+    results = []
+    for test_case, outcome in zip(test_cases, device_scheduler.run_all(test_cases)):
+        if isinstance(outcome, BaseException):
+            outcome = TestResult(status="failed", errors=repr(outcome), elements="NA")
+        results.append(outcome)
+    return results
+
+
+def run_test_steps(test_case: TestCase, driver, workspace):
     print("L208: 🚀 Running: Multi-step test")
     
-    driver = initiate_appium_driver()
-    time.sleep(5)
+    ui_waiter.wait_for_idle(driver, "driver_start")
+    wait_report = current_wait_report.get()
 
     # steps = TEST_STEPS
     steps = test_case.steps
@@ -23,122 +104,378 @@ def run_test(test_case: TestCase) -> TestResult:
     print(f"L217: Test Case ID: {str(test_case_id)}")
     return_exception: any = None
     return_status: str = "success"
-    pr_url = "ERROR"
-    
-    delete_output_file(test_case_id)  # Clear previous output file
+    ui_elements = UiSnapshot()
+    lookahead_batch = None
+
+    if test_case.resume:
+        first_step = resume_from_checkpoints(driver, workspace, test_case_id, steps)
+    else:
+        step_checkpoints.clear(test_case_id)
+        first_step = 1
     
-    for idx, step in enumerate(steps, start=1):
+    for idx, step in enumerate(steps[first_step - 1:], start=first_step):
         print(f"L224: \n🔹 Step {idx}: {step}")
-        ui_elements = extract_ui_elements(driver)
+        wait_report.start_step(idx)
+        report_progress("step_started", test_case_id=test_case_id, step=idx, text=step)
+        # Every retry made for this step draws from one wall-clock and LLM call budget
+        with retry_budget_scope(retry_policy.new_budget(f"step {idx}")) as retry_budget:
+            ui_elements = extract_ui_elements(driver)
         
-        current_screen = detect_current_screen(driver)
-        print(f"L227: 🖥️ Current Screen Activity: {current_screen}")
-
-        #log_ui_elements(ui_elements, "Available selectors on this page")
-        ui_elements = remove_unwanted_elements(ui_elements)
-                
-        return_exception, return_status, ui_elements = execute_test_step(driver, idx, step, ui_elements)        
+            current_screen = detect_current_screen(driver)
+            print(f"L227: 🖥️ Current Screen Activity: {current_screen}")
+
+            #log_ui_elements(ui_elements, "Available selectors on this page")
+            ui_elements = remove_unwanted_elements(ui_elements)
+            # Scroll retries record their scroll with the step, memoized under the screen the step started on
+            start_ui_elements = ui_elements
+
+            # A dropped batch stays here for the rest of the test case and keeps lookahead off
+            lookahead_batch, from_lookahead, ui_elements = execute_lookahead_step(
+                driver, workspace, idx, step, steps, ui_elements, current_screen, lookahead_batch)
+            if from_lookahead:
+                return_exception, return_status = None, "success"
+            else:
+                return_exception, return_status, ui_elements = execute_test_step(driver, workspace, idx, step, ui_elements, current_screen)        
         
-        print(f"L231: ⚠️ Step {idx} status, return_status : {return_status}")
-        # If step failed, check if page is scrollable and retry
-        if return_status == "failed":
-            print(f"L234: ⚠️ Step {idx} status, return_status : {return_status},  going to check for exceptions logic with scroll")
+            print(f"L231: ⚠️ Step {idx} status, return_status : {return_status}")
+            # If step failed, check if page is scrollable and retry
+            if return_status == "failed":
+                print(f"L234: ⚠️ Step {idx} status, return_status : {return_status},  going to check for exceptions logic with scroll")
             
-            is_scrollable = check_if_page_scrollable(driver)
+                # Decided from the snapshot the failed step last took, no extra Appium calls
+                is_scrollable = scroll_probe.is_scrollable(UiSnapshot.from_dicts(ui_elements))
             
-            if is_scrollable:
-                return_exception, return_status, ui_elements = attempt_scroll_and_retry(driver, idx, step, ui_elements)
-            else:
-                print(f"L241: ❌ Page is not scrollable, cannot retry step {idx}")
+                exhausted = retry_budget.exhausted_reason()
+                if exhausted:
+                    print(f"L238: ⛔ Not scrolling to retry step {idx}, {exhausted}")
+                elif is_scrollable:
+                    target = attempt_scroll_to_target(driver, workspace, idx, step, current_screen, start_ui_elements)
+                    if target is not None:
+                        return_exception, return_status, ui_elements = target
+                    else:
+                        return_exception, return_status, ui_elements = attempt_scroll_and_retry(
+                            driver, workspace, idx, step, ui_elements, current_screen, start_ui_elements)
+                else:
+                    print(f"L241: ❌ Page is not scrollable, cannot retry step {idx}")
                 
+        retry_summary = retry_budget.summary()
+        if retry_summary["retries"] or retry_summary["exhausted"]:
+            print(f"L243: 🔁 Step {idx} retry budget: {retry_summary}")
+        report_progress("step_finished", test_case_id=test_case_id, step=idx, status=return_status,
+                        error=str(return_exception) if return_exception else None)
         if return_status == "failed":
             break
 
-        time.sleep(4)  # Small wait between steps
+        ui_waiter.wait_for_idle(driver, "after_step")
+        step_waits = wait_report.step_summary(idx)
+        if step_waits:
+            print(f"L245: ⏳ Step {idx} waited {step_waits['waited_ms']} ms for the UI to settle")
 
-    driver.quit()
-        
+    if lookahead_batch is not None:
+        finish_lookahead_batch(workspace, lookahead_batch)
+    return return_exception, return_status, ui_elements
+
+
+def resume_from_checkpoints(driver, workspace, test_case_id, steps):
+    """Replay the checkpointed prefix of steps without LLM calls. Returns the number of the first step to generate."""
+    wait_report = current_wait_report.get()
+    prefix = step_checkpoints.completed_prefix(test_case_id, steps)
+    print(f"L250: ⏩ Resuming test case {test_case_id}: {len(prefix)} of {len(steps)} steps checkpointed")
+    for checkpoint in prefix:
+        idx = checkpoint["idx"]
+        wait_report.start_step(idx)
+        try:
+            execute_appium_code(driver, checkpoint["code"])
+        except Exception as e:
+            print(f"L257: ⚠️ Checkpointed code for step {idx} failed, generating from step {idx}: {e}")
+            step_checkpoints.truncate(test_case_id, idx - 1)
+            return idx
+        print(f"L260: ⏩ Step {idx} replayed from checkpoint: {checkpoint['step']}")
+        append_to_file(workspace, checkpoint["code"], idx, checkpoint["step"])
+        save_step_artifacts(workspace, checkpoint.get("feature"), checkpoint.get("pom"))
+        report_progress("step_finished", test_case_id=test_case_id, step=idx, status="success", resumed=True)
+        ui_waiter.wait_for_idle(driver, "after_step")
+    return len(prefix) + 1
+
+
+def finish_test_case(test_case: TestCase, workspace, return_exception, return_status, ui_elements) -> TestResult:
+    test_case_id = str(test_case.test_case_id)
+    pr_url = "ERROR"
     if return_status == "success":
-        create_files(test_case_id)
+        report_progress("generating_files", test_case_id=test_case_id)
+        create_files(test_case_id, workspace)
+        # Nothing left to resume once the files are generated
+        step_checkpoints.clear(test_case_id)
+        recording = RecordedRun.from_generated_code(test_case_id, test_case.scenario_name, workspace.read(output_file_name))
+        print(f"L122: 📼 Recorded {len(recording.steps)} steps to {recording.save(recordings_directory)}")
         # pr_url = create_pull_request()
         elements = "NA"
     else:
         pr_url = "ERROR"
         elements = str(ui_elements)
     
-    return TestResult(status=return_status, errors=str(return_exception),pull_request_url=pr_url, elements=elements)
-
-def execute_test_step(driver, idx, step, ui_elements):
+    token_usage = token_ledger.summary(test_case_id)
+    print(f"L72: 🪙 Token usage for test case {test_case_id}: {token_usage['total']}")
+    return TestResult(status=return_status, errors=str(return_exception),pull_request_url=pr_url, elements=elements,
+                      token_usage=token_usage, wait_report=current_wait_report.get().summary())
+
+def execute_test_step(driver, workspace, idx, step, ui_elements, current_screen=None, max_attempts=max_retry_attempts,
+                      memo_ui_elements=None, setup_code=None):
+    """
+    Generate and run step idx against ui_elements, retrying within the step's budget.
+    memo_ui_elements is the screen the memo key is taken from when the prompt only gets part of it or a later one;
+    setup_code is code (a scroll) that already ran for this step and is recorded in front of the generated code,
+    so replays, resumes and memo hits repeat it.
+    """
     attempt = 0
     last_exception = None
     last_executed_code = None
     return_exception = None
     return_status = "success"
     print(f"L298: ⚠️  execute_test_step in step {idx}, attempt {attempt+1} ")
-    while attempt < max_retry_attempts:
+
+    # Memo key is the screen the step starts on, before any retry refreshes it
+    if current_screen is None:
+        current_screen = detect_current_screen(driver)
+    screen_fingerprint = UiSnapshot.from_dicts(ui_elements if memo_ui_elements is None else memo_ui_elements).fingerprint
+    # After a setup scroll the screen no longer is the one the memo entry starts on
+    if setup_code is None and replay_memoized_step(driver, workspace, idx, step, current_screen, screen_fingerprint):
+        return return_exception, return_status, ui_elements
+
+    retry_budget = retry_policy.current_budget()
+    while attempt < max_attempts:
+        try:
+            retry_budget.charge_llm_call()
+        except RetryBudgetExhausted as e:
+            print(f"L303: ⛔ {e}")
+            return_exception = last_exception or e
+            return_status = "failed"
+            break
         # Generate step-specific code, passing exception if any
-        generated_code_raw = resolve_actions_with_ui(step, ui_elements if attempt == 0 else ui_elements, last_exception, last_executed_code)
+        prompt = build_step_prompt(step, ui_elements, last_exception, last_executed_code)
+        generated_code_raw = fetch_llm_response(prompt, "step_resolution")
         generated_code = clean_generated_code(generated_code_raw)
         if generated_code.strip():
             try:
-                process_generated_code(driver, generated_code, generated_code_raw)
+                fetureDetails, pomDetails = process_generated_code(driver, workspace, idx, step, generated_code,
+                                                                   generated_code_raw, setup_code)
+                recorded_code = with_setup_code(setup_code, generated_code)
+                step_memo.record(step, current_screen, screen_fingerprint, recorded_code, fetureDetails, pomDetails)
+                step_checkpoints.record(current_test_case.get(), idx, step, recorded_code, fetureDetails, pomDetails)
                 return_status = "success"
                 break  # Success, exit retry loop
+            except LLM_HARD_ERRORS:
+                raise
             except Exception as e:                
-                error_msg = str(e)
+                # A retry with the same prompt must reach the model, not the rejected cached response
+                llm_client.invalidate(prompt)
                 log_ui_elements(ui_elements, "Available selectors after filtering")
                 print(f"L320: ❌ Error in step {idx},  step {step}, attempt {attempt+1} generated code: {generated_code}: {e}")
                 last_exception = e
                 last_executed_code = generated_code
                 
+                if isinstance(e, SnippetRejected):
+                    # Rejected before it reached the device, the screen is unchanged: regenerate right away
+                    attempt += 1
+                    if attempt == max_attempts:
+                        return_exception = e
+                        return_status = "failed"
+                        break
+                    continue
+
                 # Check if it's a stale element error
-                if is_stale_element_error(error_msg):
+                if classify_error(e) == STALE:
                     print(f"L325: 🔄 Detected stale element error, refreshing UI elements...")
                     # Refresh UI elements immediately for stale element errors
                     ui_elements = extract_ui_elements(driver)
                     ui_elements = remove_unwanted_elements(ui_elements)
+                else:
+                    ui_elements = extract_ui_elements(driver)
                     
                 attempt += 1       
 
-                # Only refresh UI elements if not already refreshed due to stale element error
-                if not is_stale_element_error(error_msg):
-                    ui_elements = extract_ui_elements(driver)     
-                if attempt == MAX_RETRY_ATTEMPTS:
+                if attempt == max_attempts:
                     return_exception = e
                     return_status = "failed"
                     break
         else:
             print(f"L340: ❌ No valid code generated for step {idx},  step {step}, retrying... attempt {attempt+1}")
+            llm_client.invalidate(prompt)
             last_exception = "No valid code generated"
             attempt += 1            
-            if attempt == MAX_RETRY_ATTEMPTS:
+            if attempt == max_attempts:
                 return_exception = "No valid code generated"
                 return_status = "failed"
                 break
 
-        time.sleep(4)  # Small wait between steps
+        ui_waiter.wait_for_idle(driver, "retry")
         
     return return_exception, return_status, ui_elements
 
-def attempt_scroll_and_retry(driver, idx, step, ui_elements):
+def execute_lookahead_step(driver, workspace, idx, step, steps, ui_elements, current_screen, batch):
+    """
+    Run step idx from a lookahead batch, generating a batch for it and the steps after it when there is none.
+    Returns (batch, succeeded, ui_elements): the batch to keep for the next steps (dropped once it no longer
+    applies), whether step idx succeeded, and the UI elements to resolve it with on its own if it did not.
+    """
+    if lookahead_steps < 2 or (batch is not None and batch.dropped):
+        return batch, False, ui_elements
+    structure = structure_fingerprint(ui_elements)
+    screen_fingerprint = UiSnapshot.from_dicts(ui_elements).fingerprint
+    if batch is None or not batch.covers(idx):
+        if batch is not None:
+            # Steps already run from the old batch keep their fragments, memo entries and checkpoints
+            finish_lookahead_batch(workspace, batch)
+        upcoming = steps[idx - 1:idx - 1 + lookahead_steps]
+        # The last step, or one the step memo already knows, gains nothing from a batch
+        if len(upcoming) < 2 or step_memo.lookup(step, current_screen, screen_fingerprint):
+            return None, False, ui_elements
+        batch = generate_lookahead_batch(idx, upcoming, ui_elements, structure)
+        if batch is None:
+            return None, False, ui_elements
+
+    generated_code_raw = batch.take(idx, structure)
+    if generated_code_raw is None:
+        print(f"L291: 🔀 Screen layout changed since the lookahead batch, resolving step {idx} on its own")
+        return drop_lookahead_batch(workspace, batch), False, ui_elements
+    generated_code = clean_generated_code(generated_code_raw)
+    if not generated_code.strip():
+        print(f"L295: ❌ Lookahead batch has no code for step {idx}, resolving it on its own")
+        llm_client.invalidate(batch.prompt)
+        return drop_lookahead_batch(workspace, batch), False, ui_elements
+    try:
+        fetureDetails, pomDetails = run_generated_code(driver, workspace, idx, step, generated_code, generated_code_raw)
+    except LLM_HARD_ERRORS:
+        raise
+    except Exception as e:
+        print(f"L299: ⚠️ Lookahead code for step {idx} failed, resolving it on its own: {e}")
+        llm_client.invalidate(batch.prompt)
+        if not isinstance(e, SnippetRejected):
+            # The failed code may have changed the screen
+            ui_waiter.wait_for_idle(driver, "retry")
+            ui_elements = remove_unwanted_elements(extract_ui_elements(driver))
+        return drop_lookahead_batch(workspace, batch), False, ui_elements
+    print(f"L305: 🔭 Step {idx} resolved from the lookahead batch")
+    batch.executed.append((idx, step, current_screen, screen_fingerprint, generated_code, fetureDetails, pomDetails))
+    if not batch.blocks:
+        finish_lookahead_batch(workspace, batch)
+    return batch, True, ui_elements
+
+
+def drop_lookahead_batch(workspace, batch):
+    """Drop the rest of batch, keeping what its executed steps produced, and turn lookahead off for the test case."""
+    finish_lookahead_batch(workspace, batch)
+    batch.drop()
+    print("L308: 🔭 Lookahead off for the rest of this test case")
+    return batch
+
+
+def finish_lookahead_batch(workspace, batch):
+    """Correlate the Feature/POM fragments of the steps run from batch in one call, then save and record each step."""
+    executed, batch.executed = batch.executed, []
+    if not executed:
+        return
+    correlated = correlate_batch_artifacts(executed)
+    test_case_id = current_test_case.get()
+    for idx, step, current_screen, screen_fingerprint, code, feature, pom in executed:
+        if idx in correlated:
+            fetureDetails, pomDetails = correlated[idx]
+        else:
+            print(f"L313: ⚠️ Batch correlation left out step {idx}, correlating it on its own")
+            fetureDetails, pomDetails = correlate_step_artifacts(feature, pom)
+        save_step_artifacts(workspace, fetureDetails, pomDetails)
+        step_memo.record(step, current_screen, screen_fingerprint, code, fetureDetails, pomDetails)
+        step_checkpoints.record(test_case_id, idx, step, code, fetureDetails, pomDetails)
+
+
+def correlate_batch_artifacts(executed):
+    """Correlated (Feature, POM) fragments of the executed batch steps by step number, from one LLM call."""
+    step_fragments = "\n".join(
+        f'<StepDetails index="{idx}">\n<FeatureDetails>\n{feature or ""}\n</FeatureDetails>\n'
+        f'<POMDetails>\n{pom or ""}\n</POMDetails>\n</StepDetails>'
+        for idx, *_, feature, pom in executed
+    )
+    blocks = parse_step_blocks(clean_and_extract_corelated_steps_code(step_fragments))
+    correlated = {}
+    for idx, *_ in executed:
+        if idx not in blocks:
+            continue
+        block = clean_refactored_code(blocks[idx])
+        fetureDetails = extract_tag_content("FeatureDetails", block)
+        pomDetails = extract_tag_content("POMDetails", block)
+        if fetureDetails is not None or pomDetails is not None:
+            correlated[idx] = fetureDetails, pomDetails
+    print(f"L311: 🔭 Correlated {len(correlated)} of the {len(executed)} steps run from the lookahead batch in one call")
+    return correlated
+
+
+def generate_lookahead_batch(first_idx, upcoming, ui_elements, structure):
+    """Resolve the upcoming steps, starting at step first_idx, in one LLM call. Returns None if none was resolved."""
+    try:
+        retry_policy.current_budget().charge_llm_call()
+    except RetryBudgetExhausted as e:
+        print(f"L316: ⛔ {e}")
+        return None
+    last_idx = first_idx + len(upcoming) - 1
+    prompt = build_lookahead_prompt(first_idx, upcoming, ui_elements)
+    blocks = parse_step_blocks(fetch_llm_response(prompt, "step_lookahead"))
+    blocks = {n: block for n, block in blocks.items() if first_idx <= n <= last_idx}
+    print(f"L321: 🔭 Lookahead resolved steps {sorted(blocks)} of {first_idx}-{last_idx} in one call")
+    if not blocks:
+        llm_client.invalidate(prompt)
+        return None
+    return LookaheadBatch(blocks, structure, prompt)
+
+
+def attempt_scroll_to_target(driver, workspace, idx, step, current_screen=None, start_ui_elements=None):
+    """
+    Scroll the step's quoted target into view on the device and generate the step once against that screen.
+    Returns (return_exception, return_status, ui_elements), or None if the step names no target that can be found.
+    """
+    labels = extract_target_labels(step)
+    if not labels:
+        print(f"L251: 🔎 Step {idx} names no quoted target, falling back to scrolling")
+        return None
+    print(f"L253: 🔎 Searching for {labels} to retry step {idx}")
+    target = scroll_to_target(driver, labels)
+    if target is None:
+        print(f"L256: ⚠️ None of {labels} could be scrolled into view, falling back to scrolling")
+        return None
+
+    ui_waiter.wait_for_idle(driver, "after_scroll")
+    ui_elements = remove_unwanted_elements(extract_ui_elements_with_retry(driver))
+    return execute_test_step(driver, workspace, idx, step, ui_elements, current_screen, max_attempts=1,
+                             memo_ui_elements=start_ui_elements, setup_code=target[2])
+
+
+def attempt_scroll_and_retry(driver, workspace, idx, step, ui_elements, current_screen=None, start_ui_elements=None):
     print(f"L255: 📜 Page is scrollable, attempting scroll and retry...")
-    original_ui_elements = ui_elements.copy()
+    # Snapshots are immutable, no copy is needed to keep the original around
+    original_ui_elements = ui_elements
     return_exception, return_status = None, "failed"
     max_scroll_attempts = 20
     scroll_attempt = 0
+    # Every scroll made so far, recorded in front of the step's code once it succeeds
+    scroll_codes = []
 
     # Keep scrolling until the set of UI elements stabilizes (no new elements found)
     previous_ui_elements = original_ui_elements
+    retry_budget = retry_policy.current_budget()
     while scroll_attempt < max_scroll_attempts:
+        exhausted = retry_budget.exhausted_reason()
+        if exhausted:
+            print(f"L263: ⛔ Stopping scroll attempts for step {idx}, {exhausted}")
+            break
         try:
             # Try scrolling down to reveal more elements with better error handling
-            scroll_success = perform_safe_scroll(driver)
-            if not scroll_success:
+            scroll_code = perform_safe_scroll(driver)
+            if scroll_code is None:
                 print(f"L266: ⚠️ Scroll operation failed, stopping scroll attempts for step {idx}")
                 break
 
+            scroll_codes.append(scroll_code)
             # Wait for DOM to stabilize after scrolling
-            time.sleep(2)
+            ui_waiter.wait_for_idle(driver, "after_scroll")
             
             # Extract new UI elements after scrolling with retry logic
             ui_elements_after_scroll = extract_ui_elements_with_retry(driver)
@@ -152,8 +489,15 @@ def attempt_scroll_and_retry(driver, idx, step, ui_elements):
                 print(f"L280: ⚠️ Scrolling did not reveal new elements, stopping scroll attempts for step {idx}, step {step},")
                 break
             else:
-                print(f"L283: 🔄 Retrying step {idx},  step {step}, with new UI elements after scrolling (attempt {scroll_attempt+1})...")
-                return_exception, return_status, ui_elements = execute_test_step(driver, idx, step, ui_elements_after_scroll)
+                # Only the newly revealed elements go to the LLM, the rest already failed this step
+                revealed_ui_elements = ui_elements_after_scroll.diff(previous_ui_elements).added
+                if not revealed_ui_elements:
+                    revealed_ui_elements = ui_elements_after_scroll
+                print(f"L283: 🔄 Retrying step {idx},  step {step}, with {len(revealed_ui_elements)} new UI elements after scrolling (attempt {scroll_attempt+1})...")
+                return_exception, return_status, ui_elements = execute_test_step(
+                    driver, workspace, idx, step, revealed_ui_elements, current_screen,
+                    memo_ui_elements=ui_elements_after_scroll if start_ui_elements is None else start_ui_elements,
+                    setup_code="\n".join(scroll_codes))
 
                 if return_status == "success":
                     #print(f"L287: ✅ Step {idx},  step {step}, succeeded after scrolling!")
@@ -162,273 +506,124 @@ def attempt_scroll_and_retry(driver, idx, step, ui_elements):
                     print(f"L290: ❌ Step {idx},  step {step}, still failed after scrolling, will try to scroll again.")
                     previous_ui_elements = ui_elements_after_scroll
                     scroll_attempt += 1
+        except LLM_HARD_ERRORS:
+            raise
         except Exception as scroll_error:
             print(f"L294: ⚠️ Error during scrolling: {scroll_error}")
-            if is_stale_element_error(str(scroll_error)):
-                print(f"L296: 🔄 Stale element error detected, waiting and retrying scroll...")
-                time.sleep(3)  # Wait longer for DOM to stabilize
+            if retry_budget.retry(driver, scroll_error, scroll_attempt, max_scroll_attempts):
                 scroll_attempt += 1
                 continue
             else:
-                print(f"L300: ❌ Non-stale error during scrolling, stopping attempts")
+                print(f"L300: ❌ Error during scrolling is not retryable, stopping attempts")
                 break        
 
     return return_exception, return_status, ui_elements
 
 
 
-def is_stale_element_error(error_msg):
-    """Check if the error is related to stale elements."""
-    stale_indicators = [
-        "stale", 
-        "cached elements", 
-        "do not exist in dom", 
-        "element is no longer attached",
-        "element not found",
-        "no such element",
-        "StaleElementReferenceException",
-        "ElementsCache.restore",
-        "ElementsCache.get"
-    ]
-    return any(indicator in error_msg.lower() for indicator in stale_indicators)
-
-def safe_driver_operation(operation, max_retries=MAX_RETRY_ATTEMPTS, wait_time=2):
-    """Safely execute any driver operation with automatic retry on stale element errors."""
-    for attempt in range(max_retries):
-        try:
-            return operation()
-        except Exception as e:
-            error_msg = str(e)
-            if is_stale_element_error(error_msg):
-                print(f"⚠️ Stale element error (attempt {attempt + 1}/{max_retries}): {error_msg}")
-                if attempt < max_retries - 1:
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    print(f"❌ Operation failed after {max_retries} attempts due to persistent stale elements")
-                    raise e
-            else:
-                # Non-stale error, re-raise immediately
-                raise e
-    return None
-
 def safe_find_elements(driver, by, value, max_retries=MAX_RETRY_ATTEMPTS):
-    """Safely find elements with automatic retry on stale element errors."""
-    for attempt in range(max_retries):
+    """Find elements, retrying stale and transient errors within the current step's retry budget."""
+    retry_budget = retry_policy.current_budget()
+    attempt = 0
+    while True:
         try:
-            elements = driver.find_elements(by, value)
-            return elements
+            return driver.find_elements(by, value)
         except Exception as e:
-            if is_stale_element_error(str(e)) and attempt < max_retries - 1:
-                print(f"⚠️ Stale element error in find_elements (attempt {attempt + 1}), retrying...")
-                time.sleep(1)
-                continue
-            else:
+            if not retry_budget.retry(driver, e, attempt, max_retries):
                 raise e
-    return []
+            attempt += 1
 
 def perform_safe_scroll(driver, max_retries=MAX_RETRY_ATTEMPTS):
-    """Perform scrolling with retry logic for stale element errors."""
+    """
+    Perform scrolling with retry logic for stale element errors.
+    Returns the step snippet that repeats the scroll that worked, or None if every method failed.
+    """
     scroll_methods = [
         # Method 1: Simple UiScrollable scrollForward
-        lambda: driver.find_element(AppiumBy.ANDROID_UIAUTOMATOR, 
-            'new UiScrollable(new UiSelector().scrollable(true)).scrollForward()'),
+        uiautomator_code('new UiScrollable(new UiSelector().scrollable(true)).scrollForward()'),
         # Method 2: UiScrollable with flingForward  
-        lambda: driver.find_element(AppiumBy.ANDROID_UIAUTOMATOR,
-            'new UiScrollable(new UiSelector().scrollable(true)).flingForward()'),
+        uiautomator_code('new UiScrollable(new UiSelector().scrollable(true)).flingForward()'),
         # Method 3: UiScrollable with scrollToEnd
-        lambda: driver.find_element(AppiumBy.ANDROID_UIAUTOMATOR,
-            'new UiScrollable(new UiSelector().scrollable(true)).scrollToEnd(10)'),
+        uiautomator_code('new UiScrollable(new UiSelector().scrollable(true)).scrollToEnd(10)'),
         # Method 4: Direct swipe gesture (fallback)
-        lambda: driver.swipe(500, 1500, 500, 500, 1000)
+        "driver.swipe(500, 1500, 500, 500, 1000)"
     ]
     
+    retry_budget = retry_policy.current_budget()
     for method_idx, scroll_method in enumerate(scroll_methods):
+        if retry_budget.exhausted_reason():
+            break
         for attempt in range(max_retries):
             try:
-                scroll_method()
+                snippet_executor.run(driver, scroll_method)
+                # Callers wait for the UI to settle before reading it
                 print(f"✅ Scroll successful using method {method_idx + 1}")
-                time.sleep(1)  # Small wait after successful scroll
-                return True
+                return scroll_method
             except Exception as e:
-                error_msg = str(e)
-                if is_stale_element_error(error_msg):
-                    print(f"⚠️ Stale element error in scroll method {method_idx + 1} (attempt {attempt + 1}): {error_msg}")
-                    if attempt < max_retries - 1:
-                        time.sleep(2)  # Wait for DOM to stabilize
-                        continue
-                    else:
-                        print(f"❌ Scroll method {method_idx + 1} failed after {max_retries} attempts")
-                        break
-                else:
-                    print(f"⚠️ Non-stale error in scroll method {method_idx + 1}: {error_msg}")
-                    if method_idx < len(scroll_methods) - 1:  # Try next method
-                        break
-                    else:
-                        print(f"❌ Last scroll method failed: {error_msg}")
-                        break
+                if retry_budget.retry(driver, e, attempt, max_retries):
+                    continue
+                # Not retryable, out of attempts or out of budget: try the next method
+                print(f"⚠️ Scroll method {method_idx + 1} failed: {e}")
+                break
     
     print("❌ All scroll methods failed")
-    return False
+    return None
 
 def extract_ui_elements_with_retry(driver, max_retries=MAX_RETRY_ATTEMPTS):
     """Extract UI elements with enhanced retry logic for stale element errors."""
+    retry_budget = retry_policy.current_budget()
     for attempt in range(max_retries):
+        if retry_budget.exhausted_reason():
+            break
         try:
             ui_elements = extract_ui_elements(driver)
             if ui_elements:  # Only return if we got some elements
                 return ui_elements
             else:
                 print(f"⚠️ No elements found (attempt {attempt + 1}), retrying...")
-                time.sleep(2)
+                ui_waiter.wait_for_idle(driver, "retry")
         except Exception as e:
-            error_msg = str(e)
-            if is_stale_element_error(error_msg):
-                print(f"⚠️ Stale element error in extract_ui_elements (attempt {attempt + 1}): {error_msg}")
-                if attempt < max_retries - 1:
-                    time.sleep(2)
-                    continue
-            else:
-                print(f"❌ Non-stale error in extract_ui_elements: {error_msg}")
+            if not retry_budget.retry(driver, e, attempt, max_retries):
+                print(f"❌ Error in extract_ui_elements is not retried: {e}")
                 break
     
     print("❌ Failed to extract UI elements after all retries")
-    return []
+    return UiSnapshot()
 
 def ui_elements_equal(elements1, elements2):
-    """Compare two UI element lists to check if they're essentially the same."""
-    if len(elements1) != len(elements2):
-        return False
-    
-    # Create simplified representations for comparison
-    def simplify_element(element):
-        return (
-            element.get('text', ''),
-            element.get('resource_id', ''),
-            element.get('content_desc', ''),
-            element.get('class', ''),
-            element.get('bounds', '')
-        )
-    
-    simplified1 = [simplify_element(e) for e in elements1]
-    simplified2 = [simplify_element(e) for e in elements2]
-    
-    # Sort both lists to handle order differences
-    simplified1.sort()
-    simplified2.sort()
-    
-    return simplified1 == simplified2
+    """Compare two UI snapshots by their order-independent fingerprint."""
+    return UiSnapshot.from_dicts(elements1).fingerprint == UiSnapshot.from_dicts(elements2).fingerprint
 
-def check_if_page_scrollable(driver):
-    """Check if the current page/screen is scrollable."""
-    try:
-        # Method 1: Check for scrollable elements using UiAutomator
-        try:
-            scrollable_elements = safe_driver_operation(
-                lambda: driver.find_elements(AppiumBy.ANDROID_UIAUTOMATOR, 
-                    'new UiSelector().scrollable(true)'))
-            
-            if scrollable_elements:
-                print(f"L105: ✅ Page is scrollable - Found {len(scrollable_elements)} scrollable containers")
-                return True
-        except Exception as ui_error:
-            print(f"L109: ⚠️ UiAutomator scrollable check failed: {ui_error}")
-        
-        # Method 2: Check for common scrollable view classes
-        scrollable_classes = [
-            'android.widget.ScrollView',
-            'android.widget.ListView', 
-            'android.widget.RecyclerView',
-            'androidx.recyclerview.widget.RecyclerView',
-            'android.support.v7.widget.RecyclerView'
-        ]
-        
-        for class_name in scrollable_classes:
-            try:
-                elements = safe_driver_operation(
-                    lambda: driver.find_elements(By.CLASS_NAME, class_name))
-                if elements:
-                    print(f"L123: ✅ Page is scrollable - Found {class_name}")
-                    return True
-            except Exception as class_error:
-                print(f"L126: ⚠️ Error checking class {class_name}: {class_error}")
-                continue
-        
-        # Method 3: Check viewport vs content size (if available)
-        try:
-            screen_size = safe_driver_operation(lambda: driver.get_window_size())
-            all_elements = safe_driver_operation(
-                lambda: driver.find_elements(By.XPATH, "//*"))
-            max_y = 0
-            for element in all_elements:
-                try:
-                    location = safe_driver_operation(lambda: element.location)
-                    size = safe_driver_operation(lambda: element.size)
-                    element_bottom = location['y'] + size['height']
-                    max_y = max(max_y, element_bottom)
-                except Exception as element_error:
-                    # Skip problematic elements
-                    if is_stale_element_error(str(element_error)):
-                        continue
-                    else:
-                        raise element_error
-            
-            if max_y > screen_size['height']:
-                print(f"L147: ✅ Page is scrollable - Content height ({max_y}) > Screen height ({screen_size['height']})")
-                return True
-        except Exception as size_error:
-            print(f"L150: ⚠️ Error checking content size: {size_error}")
-            pass
-            
-        print("L153: ❌ Page does not appear to be scrollable")
-        return False
-        
-    except Exception as e:
-        print(f"L157: ⚠️ Error checking scrollability: {e}")
-        return False
+def extract_ui_elements(driver, mode=None):
+    """Grab all UI elements with their key attributes.
 
+    Uses a single page_source snapshot by default and falls back to querying
+    every element when the snapshot cannot be fetched or parsed.
+    """
+    mode = mode or ui_snapshot_mode
+    if mode == SNAPSHOT_MODE_PAGE_SOURCE:
+        try:
+            return extract_ui_elements_from_page_source(driver)
+        except Exception as e:
+            print(f"L132: ⚠️ Page source snapshot failed, falling back to per-element extraction: {e}")
+    return extract_ui_elements_per_element(driver)
 
 
-def extract_ui_elements(driver):
-    """Grab all UI elements with their key attributes."""
+def extract_ui_elements_per_element(driver):
+    """Grab all UI elements by reading each attribute over the Appium wire."""
     try:
         elements = safe_find_elements(driver, By.XPATH, "//*")
         print("L135: Total elements found:", len(elements))
     except Exception as e:
         print(f"L137: ⚠️ Error finding elements, retrying: {e}")
-        time.sleep(2)
+        ui_waiter.wait_for_idle(driver, "stale")
         try:
             elements = safe_find_elements(driver, By.XPATH, "//*")
             print("L141: Total elements found on retry:", len(elements))
         except Exception as retry_e:
             print(f"L143: ❌ Failed to find elements on retry: {retry_e}")
-            return []
-    
-    # for el in elements:
-    #     print("...."+el.get_attribute("className")+"..."+el.text+"...."+el.get_attribute("contentDescription"))
-
-    # Define interactable Android UI classes
-    interactable_classes = [
-        'android.widget.Button',
-        'android.widget.EditText',
-        'android.widget.CheckBox',
-        'android.widget.RadioButton',
-        'android.widget.Switch',
-        'android.widget.Spinner',
-        'android.widget.ImageButton',
-        'android.widget.TextView',
-        'android.widget.ImageButton',
-        'android.view.View',  # Sometimes clickable
-    ]
+            return UiSnapshot()
 
-    # Filter interactable elements
-    interactable_elements = [
-        el for el in elements
-        if el.is_displayed()         
-        and el.get_attribute("className") in interactable_classes
-    ]
-
-    print("L150: Interactable elements found:", len(elements))
     ui_info = []
     for el in elements:
         try:
@@ -441,13 +636,23 @@ def extract_ui_elements(driver):
                 "focusable" : el.get_attribute("focusable"),
                 "enabled": el.get_attribute("enabled"),                
                 "focused": el.get_attribute("focused"),
-                "selected": el.get_attribute("selected")
+                "selected": el.get_attribute("selected"),
+                "clickable": el.get_attribute("clickable"),
+                "scrollable": el.get_attribute("scrollable")
             })
         except Exception as e:
             print(f"L146: Error reading element (possibly stale): {e}")
             # Skip stale elements instead of failing completely
             continue
-    return ui_info
+    return UiSnapshot.from_dicts(ui_info)
+
+
+def benchmark_extract_ui_elements(driver, rounds=3):
+    """Compare the page_source snapshot against per-element extraction on the current screen."""
+    return benchmark_ui_extraction(driver, {
+        SNAPSHOT_MODE_PAGE_SOURCE: lambda d: extract_ui_elements(d, SNAPSHOT_MODE_PAGE_SOURCE),
+        SNAPSHOT_MODE_ELEMENTS: extract_ui_elements_per_element
+    }, rounds)
 
 
 def clean_generated_code(raw):
@@ -470,11 +675,9 @@ def clean_generated_code(raw):
     return raw.strip()
 
 
-def resolve_actions_with_ui(nl_step, ui_elements, exception=None, last_executed_code=None):
-    context = "\n".join([
-        f"Text: {e['text']}, Resource-ID: {e['resource_id']}, Content-Desc: {e['content_desc']}, Focusable: {e['focusable']}, Enabled: {e['enabled']}, Focused: {e['focused']}, Selected: {e['selected']}, Class: {e['class']} "
-        for e in ui_elements if e["text"] or e["content_desc"] or e["resource_id"] or e["focusable"] or e['enabled'] or e['focused'] or e['selected'] or e['class']
-    ])
+def build_step_prompt(nl_step, ui_elements, exception=None, last_executed_code=None):
+    context, kept, total = build_ui_context(nl_step, ui_elements, prompt_context_max_tokens)
+    print(f"L228: 🧾 UI context: {kept}/{total} actionable elements")
 
     prompt = f"""
 You are a UI automation assistant.
@@ -488,31 +691,97 @@ LastExecutedCode (if any): {last_executed_code}
 
 Step: "{nl_step}"
 """
-    return fetch_llm_response(prompt)
+    return prompt
 
 
-def process_generated_code(driver, generated_code, generated_code_raw):
+def build_lookahead_prompt(first_idx, nl_steps, ui_elements):
+    context, kept, total = build_ui_context(" ".join(nl_steps), ui_elements, prompt_context_max_tokens)
+    print(f"L229: 🧾 UI context: {kept}/{total} actionable elements")
+    numbered_steps = "\n".join(f'{idx}. "{nl_step}"' for idx, nl_step in enumerate(nl_steps, start=first_idx))
+
+    prompt = f"""
+You are a UI automation assistant.
+
+Available UI elements:
+{context}
+
+{PROMPT_RULES}
+The steps below run one after another, starting on the screen above; resolve each one assuming the steps before it
+have run and the screen keeps these elements.
+Return one <StepDetails index="N"> block per step, N being the step number, each holding that step's <PythonDetails>,
+<FeatureDetails> and <POMDetails>. Stop at the first step that needs an element which is not in the list above.
+
+Steps:
+{numbered_steps}
+"""
+    return prompt
+
+
+def process_generated_code(driver, workspace, idx, step, generated_code, generated_code_raw, setup_code=None):
     """Process and execute the generated code, then save to files."""
+    fetureDetails, pomDetails = run_generated_code(driver, workspace, idx, step, generated_code, generated_code_raw,
+                                                   setup_code)
+    fetureDetails, pomDetails = correlate_step_artifacts(fetureDetails, pomDetails)
+
+    save_step_artifacts(workspace, fetureDetails, pomDetails)
+    return fetureDetails, pomDetails
+
+
+def run_generated_code(driver, workspace, idx, step, generated_code, generated_code_raw, setup_code=None):
+    """
+    Execute the generated code and save it, after setup_code that already ran for the step.
+    Returns the Feature and POM fragments of the response, uncorrelated.
+    """
     execute_appium_code(driver, generated_code)
     print(f"L195: \n💡 Formatted code : \n{generated_code}")
     print(f"L196: \n💡 Formatted code ended: ")
 
-    append_to_file(generated_code)
+    append_to_file(workspace, with_setup_code(setup_code, generated_code), idx, step)
     
     fetureDetails = extract_tag_content("FeatureDetails", generated_code_raw)
     pomDetails = extract_tag_content("POMDetails", generated_code_raw)
+    return fetureDetails, pomDetails
+
 
+def with_setup_code(setup_code, code):
+    """The code recorded for a step: the setup (scroll) that ran before its generated code, then that code."""
+    return f"{setup_code}\n{code}" if setup_code else code
 
+
+def correlate_step_artifacts(fetureDetails, pomDetails):
+    """Rewrite Feature and POM fragments so their step definitions line up, in one LLM call."""
     corelated_code = clean_and_extract_corelated_code(fetureDetails, pomDetails)
     corelated_code = clean_refactored_code(corelated_code)
     fetureDetails = extract_tag_content("FeatureDetails", corelated_code)
     pomDetails = extract_tag_content("POMDetails", corelated_code)
+    return fetureDetails, pomDetails
+
 
-    writeTofileCucumber(fetureDetails)
-    writeTofileCucumber("\n")
+def save_step_artifacts(workspace, fetureDetails, pomDetails):
+    """Append a step's Feature and POM fragments to the run's workspace."""
+    writeTofileCucumber(workspace, fetureDetails)
+    writeTofileCucumber(workspace, "\n")
 
     
-    writeTofilePom(pomDetails)
-    writeTofilePom("\n")
+    writeTofilePom(workspace, pomDetails)
+    writeTofilePom(workspace, "\n")
+
+
+def replay_memoized_step(driver, workspace, idx, step, current_screen, screen_fingerprint):
+    """Run a step from the step memo without any LLM call. Returns True on success."""
+    memo_entry = step_memo.lookup(step, current_screen, screen_fingerprint)
+    if not memo_entry:
+        return False
+    try:
+        execute_appium_code(driver, memo_entry["code"])
+    except Exception as e:
+        print(f"L360: ⚠️ Memoized code for step {idx} failed, falling back to generation: {e}")
+        step_memo.forget(step, current_screen, screen_fingerprint)
+        return False
+    print(f"L363: ♻️ Step {idx} replayed from step memo: \n{memo_entry['code']}")
+    append_to_file(workspace, memo_entry["code"], idx, step)
+    save_step_artifacts(workspace, memo_entry.get("feature"), memo_entry.get("pom"))
+    step_checkpoints.record(current_test_case.get(), idx, step, memo_entry["code"], memo_entry.get("feature"), memo_entry.get("pom"))
+    return True
 
 
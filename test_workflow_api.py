@@ -1,28 +1,30 @@
+import asyncio
 import json
 import re
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 import os
-import shutil
-import subprocess
-import time
+import uuid
 from typing import Optional
+from incremental_sync import sync_tree
 
 app = FastAPI()
 
 class TestExecutionRequest(BaseModel):
     """Request model for test execution and PR creation workflow"""
     auto_create_pr: Optional[bool] = False  # Set to True to skip user prompt for PR creation
+    workflow_id: Optional[str] = None  # Optional client-chosen id, used to cancel the workflow
 
 class TestExecutionResponse(BaseModel):
     """Response model for test execution workflow"""
     status: str
     message: str
     error_details: Optional[str] = None
+    workflow_id: Optional[str] = None
 
 def copy_files_to_android_runner():
     """
-    Copy extracted_files to android-testcase-runner/features folder.
+    Sync extracted_files into android-testcase-runner/features folder, copying only changed files.
     Returns: (success: bool, message: str)
     """
     try:
@@ -54,24 +56,18 @@ def copy_files_to_android_runner():
             print(f"⚠️ Creating features directory: {android_features_path}")
             os.makedirs(android_features_path, exist_ok=True)
         
-        print(f"📁 Copying content from {extracted_files_path} to {android_features_path}")
+        print(f"📁 Syncing content from {extracted_files_path} to {android_features_path}")
         
-        # Copy all contents from extracted_files to android-testcase-runner/features
+        # Only new or changed files are copied, files removed from extracted_files are pruned
         if os.path.exists(extracted_files_path) and os.listdir(extracted_files_path):
-            for item in os.listdir(extracted_files_path):
-                source_item = os.path.join(extracted_files_path, item)
-                dest_item = os.path.join(android_features_path, item)
-                
-                if os.path.isdir(source_item):
-                    if os.path.exists(dest_item):
-                        shutil.rmtree(dest_item)
-                    shutil.copytree(source_item, dest_item)
-                    print(f"📂 Copied directory: {item}")
-                else:
-                    shutil.copy2(source_item, dest_item)
-                    print(f"📄 Copied file: {item}")
+            sync_report = sync_tree(extracted_files_path, android_features_path)
+            for item in sync_report["copied"]:
+                print(f"📄 Copied file: {item}")
+            for item in sync_report["pruned"]:
+                print(f"🗑️ Removed file: {item}")
             
-            success_msg = f"✅ Successfully copied files to {android_features_path}"
+            success_msg = (f"✅ Successfully synced files to {android_features_path}: {len(sync_report['copied'])} copied, "
+                           f"{sync_report['unchanged']} unchanged, {len(sync_report['pruned'])} removed")
             print(success_msg)
             return True, success_msg
         else:
@@ -84,116 +80,140 @@ def copy_files_to_android_runner():
         print(error_msg)
         return False, error_msg
 
-def run_mcp_tests():
+# Node scripts running at once across all workflows, and how long one may run
+NODE_MAX_CONCURRENCY = 2
+NODE_TIMEOUT_SECONDS = 300
+
+node_semaphore = asyncio.Semaphore(NODE_MAX_CONCURRENCY)
+
+# Workflows in progress by id, so a client can cancel one
+running_workflows = {}
+
+
+def get_mcp_reviewer_path():
+    return os.path.join(os.path.dirname(os.getcwd()), "github-mcp-code-reviewer")
+
+
+async def terminate_process(process):
+    """Stop a node process, killing it if it ignores SIGTERM."""
+    if process.returncode is not None:
+        return
+    try:
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+    except ProcessLookupError:
+        pass
+
+
+async def run_node_script(script, label, cwd, timeout=NODE_TIMEOUT_SECONDS):
+    """
+    Run node <script> ../android-testcase-runner in cwd without blocking the event loop.
+    stdout/stderr are printed line by line while the script runs; on timeout or
+    cancellation the process is terminated.
+    Returns: (return_code: int, output: str)
+    """
+    async with node_semaphore:
+        process = await asyncio.create_subprocess_exec(
+            "node", script, "../android-testcase-runner",
+            cwd=cwd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout_lines, stderr_lines = [], []
+
+        async def pump(stream, lines, stream_name):
+            async for raw_line in stream:
+                line = raw_line.decode(errors="replace").rstrip("\n")
+                lines.append(line)
+                print(f"[{label} {stream_name}] {line}")
+
+        streaming = asyncio.gather(pump(process.stdout, stdout_lines, "stdout"),
+                                   pump(process.stderr, stderr_lines, "stderr"),
+                                   process.wait())
+        try:
+            await asyncio.wait_for(streaming, timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            await terminate_process(process)
+            streaming.cancel()
+            await asyncio.gather(streaming, return_exceptions=True)
+            raise
+
+        output = f"Return code: {process.returncode}\nSTDOUT:\n" + "\n".join(stdout_lines)
+        if stderr_lines:
+            output += "\nSTDERR:\n" + "\n".join(stderr_lines)
+        return process.returncode, output
+
+
+async def run_mcp_tests():
     """
     Run node test-mcp-enhanced.js ../android-testcase-runner
     Returns: (success: bool, message: str)
     """
     try:
         # Check if github-mcp-code-reviewer project exists
-        current_dir = os.getcwd()
-        parent_dir = os.path.dirname(current_dir)
-        mcp_reviewer_path = os.path.join(parent_dir, "github-mcp-code-reviewer")
+        mcp_reviewer_path = get_mcp_reviewer_path()
         
         if not os.path.exists(mcp_reviewer_path):
             error_msg = f"❌ github-mcp-code-reviewer project not found at {mcp_reviewer_path}"
             print(error_msg)
             return False, error_msg
         
-        print(f"🚀 Running MCP tests...")
+        print(f"🚀 Running MCP tests in {mcp_reviewer_path}...")
         
-        # Change to mcp reviewer directory and run the test
-        original_cwd = os.getcwd()
-        try:
-            os.chdir(mcp_reviewer_path)
-            print(f"📍 Changed directory to: {mcp_reviewer_path}")
-            
-            # Run the node command with android-testcase-runner as relative path argument
-            result = subprocess.run(
-                ["node", "test-mcp-enhanced.js", "../android-testcase-runner"],
-                capture_output=True,
-                text=True,
-                timeout=300  # 5 minute timeout
-            )
-            
-            output = f"Return code: {result.returncode}\nSTDOUT:\n{result.stdout}"
-            if result.stderr:
-                output += f"\nSTDERR:\n{result.stderr}"
-            
-            print(f"🔧 MCP Test output:\n{output}")
-            
-            if result.returncode == 0:
-                success_msg = "✅ MCP tests executed successfully"
-                print(success_msg)
-                return True, success_msg
-            else:
-                error_msg = f"❌ MCP test execution failed with return code {result.returncode}"
-                print(error_msg)
-                return False, error_msg
-                
-        finally:
-            # Always return to original directory
-            os.chdir(original_cwd)
-            print(f"📍 Returned to original directory: {original_cwd}")
+        # Run the node command with android-testcase-runner as relative path argument
+        return_code, output = await run_node_script("test-mcp-enhanced.js", "mcp-tests", mcp_reviewer_path)
+        
+        print(f"🔧 MCP Test output:\n{output}")
+        
+        if return_code == 0:
+            success_msg = "✅ MCP tests executed successfully"
+            print(success_msg)
+            return True, success_msg
+        else:
+            error_msg = f"❌ MCP test execution failed with return code {return_code}"
+            print(error_msg)
+            return False, error_msg
             
-    except subprocess.TimeoutExpired:
-        error_msg = "⏰ MCP test execution timed out after 5 minutes"
+    except asyncio.TimeoutError:
+        error_msg = f"⏰ MCP test execution timed out after {NODE_TIMEOUT_SECONDS} seconds"
         print(error_msg)
-        return False, error_msg, "Timeout occurred"
+        return False, error_msg
     except Exception as e:
         error_msg = f"❌ Error running MCP tests: {str(e)}"
         print(error_msg)
-        return False, error_msg, ""
+        return False, error_msg
 
-def run_pr_creation():
+async def run_pr_creation():
     """
     Run node test-pr-creation.js ../android-testcase-runner
     Returns: (success: bool, message: str, output: str)
     """
     try:
         # Use the same mcp_reviewer_path
-        current_dir = os.getcwd()
-        parent_dir = os.path.dirname(current_dir)
-        mcp_reviewer_path = os.path.join(parent_dir, "github-mcp-code-reviewer")
+        mcp_reviewer_path = get_mcp_reviewer_path()
         
         print(f"🚀 Creating Pull Request...")
         
-        # Change to mcp reviewer directory and run PR creation
-        original_cwd = os.getcwd()
-        try:
-            os.chdir(mcp_reviewer_path)
-            print(f"📍 Changed directory to: {mcp_reviewer_path}")
-            
-            # Run PR creation script
-            result = subprocess.run(
-                ["node", "test-pr-creation.js", "../android-testcase-runner"],
-                capture_output=True,
-                text=True,
-                timeout=300  # 5 minute timeout
-            )
-            
-            output = f"Return code: {result.returncode}\nSTDOUT:\n{result.stdout}"
-            if result.stderr:
-                output += f"\nSTDERR:\n{result.stderr}"
-            
-            print(f"🔧 PR Creation output:\n{output}")
-            
-            if result.returncode == 0:
-                success_msg = "✅ Pull Request created successfully"
-                print(success_msg)
-                return True, success_msg, output
-            else:
-                error_msg = f"❌ PR creation failed with return code {result.returncode}"
-                print(error_msg)
-                return False, error_msg, output
-                
-        finally:
-            # Always return to original directory
-            os.chdir(original_cwd)
-            print(f"📍 Returned to original directory: {original_cwd}")
+        # Run PR creation script
+        return_code, output = await run_node_script("test-pr-creation.js", "pr-creation", mcp_reviewer_path)
+        
+        print(f"🔧 PR Creation output:\n{output}")
+        
+        if return_code == 0:
+            success_msg = "✅ Pull Request created successfully"
+            print(success_msg)
+            return True, success_msg, output
+        else:
+            error_msg = f"❌ PR creation failed with return code {return_code}"
+            print(error_msg)
+            return False, error_msg, output
             
-    except subprocess.TimeoutExpired:
-        error_msg = "⏰ PR creation timed out after 5 minutes"
+    except asyncio.TimeoutError:
+        error_msg = f"⏰ PR creation timed out after {NODE_TIMEOUT_SECONDS} seconds"
         print(error_msg)
         return False, error_msg, "Timeout occurred"
     except Exception as e:
@@ -243,12 +263,39 @@ async def execute_full_workflow(request: TestExecutionRequest):
     1. Copy extracted_files to android-testcase-runner/features
     2. Run node test-mcp-enhanced.js
     3. Optionally run node test-pr-creation.js (based on auto_create_pr flag)
+
+    The workflow runs as its own task, so DELETE /workflows/{workflow_id} can cancel it
+    and stop its node process.
     """
-    
+    workflow_id = request.workflow_id or uuid.uuid4().hex
+    if workflow_id in running_workflows:
+        raise HTTPException(status_code=409, detail=f"Workflow {workflow_id} is already running")
+    task = asyncio.ensure_future(run_full_workflow(request))
+    running_workflows[workflow_id] = task
+    try:
+        # Shielded, so a cancelled request can be told apart from a workflow cancelled through cancel_workflow
+        response = await asyncio.shield(task)
+    except asyncio.CancelledError:
+        if not task.done():
+            # The request itself was cancelled (client disconnect, shutdown): stop the workflow and its node
+            # process, then let the cancellation through
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            raise
+        if not task.cancelled():
+            raise
+        response = TestExecutionResponse(status="cancelled", message=f"Workflow {workflow_id} was cancelled")
+    finally:
+        running_workflows.pop(workflow_id, None)
+    response.workflow_id = workflow_id
+    return response
+
+
+async def run_full_workflow(request: TestExecutionRequest):
     print("🚀 Starting full test execution workflow...")
     
     # Step 1: Copy files
-    copy_success, copy_message = copy_files_to_android_runner()
+    copy_success, copy_message = await asyncio.to_thread(copy_files_to_android_runner)
     if not copy_success:
         return TestExecutionResponse(
             status="failed",
@@ -257,7 +304,7 @@ async def execute_full_workflow(request: TestExecutionRequest):
         )
     
     # Step 2: Run MCP tests
-    test_success, test_message = run_mcp_tests()
+    test_success, test_message = await run_mcp_tests()
     if not test_success:
         return TestExecutionResponse(
             status="failed", 
@@ -268,7 +315,7 @@ async def execute_full_workflow(request: TestExecutionRequest):
     # Step 3: Conditionally run PR creation
     pr_output = None
     if request.auto_create_pr:
-        pr_success, pr_message, pr_output = run_pr_creation()
+        pr_success, pr_message, pr_output = await run_pr_creation()
         if pr_success:
             # Extract PR URL from output
             pr_url = extract_pr_url_from_output(pr_output)
@@ -288,6 +335,27 @@ async def execute_full_workflow(request: TestExecutionRequest):
             message="✅ Tests executed successfully (PR creation skipped)",
         )
 
+
+def cancel_workflow(workflow_id: str):
+    """Cancel a running workflow; its node process is terminated. Returns False if it is not running."""
+    task = running_workflows.get(workflow_id)
+    if task is None or task.done():
+        return False
+    task.cancel()
+    return True
+
+
+@app.get("/workflows/")
+async def workflows_api():
+    return {"running": list(running_workflows)}
+
+
+@app.delete("/workflows/{workflow_id}")
+async def cancel_workflow_api(workflow_id: str):
+    if not cancel_workflow(workflow_id):
+        raise HTTPException(status_code=404, detail=f"Workflow {workflow_id} is not running")
+    return {"workflow_id": workflow_id, "status": "cancelling"}
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The modules are flat and utils reads config.yaml from the working directory
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
@@ -0,0 +1,23 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from incremental_sync import MANIFEST_NAME, sync_tree
+
+
+def test_concurrent_syncs_into_one_destination(tmp_path):
+    source = tmp_path / "source"
+    dest = tmp_path / "dest"
+    for n in range(20):
+        path = source / f"features/test-case-{n}.feature"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"Feature: {n}\n")
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        reports = list(pool.map(lambda _: sync_tree(str(source), str(dest)), range(8)))
+
+    # Only the first sync copies anything, the others see its manifest
+    assert sorted(len(report["copied"]) for report in reports) == [0] * 7 + [20]
+    manifest = json.loads((dest / MANIFEST_NAME).read_text())
+    assert len(manifest) == 20
+    assert not [name for _, _, files in os.walk(dest) for name in files if name.endswith(".tmp")]
@@ -0,0 +1,123 @@
+import re
+
+import pytest
+
+import prompt_context
+import test_script_generator as tsg
+import token_accounting
+import utils
+from lookahead import structure_fingerprint
+from run_workspace import RunWorkspace
+from step_checkpoint import StepCheckpoints
+from step_memo import StepMemo
+
+SCREEN = [
+    {"class": "android.widget.EditText", "resource_id": "app:id/name", "text": "", "content_desc": "Name"},
+    {"class": "android.widget.EditText", "resource_id": "app:id/email", "text": "", "content_desc": "Email"},
+    {"class": "android.widget.Button", "resource_id": "app:id/save", "text": "Save", "content_desc": ""},
+]
+STEPS = ["Type Ann into Name", "Type ann@example.com into Email", "Tap Save"]
+
+
+def step_block(idx, code):
+    return (f'<StepDetails index="{idx}"><PythonDetails>{code}</PythonDetails>'
+            f'<FeatureDetails>When step {idx}</FeatureDetails><POMDetails>step{idx}() {{}}</POMDetails></StepDetails>')
+
+
+class FakeLLM:
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.calls = []
+
+    def __call__(self, prompt, call_site="other"):
+        self.calls.append(call_site)
+        if call_site == "step_lookahead":
+            return self.batches.pop(0)
+        if call_site == "correlation":
+            indexes = [int(idx) for idx in re.findall(r'<StepDetails index="(\d+)">', prompt)]
+            return "".join(f'<StepDetails index="{idx}"><FeatureDetails>Correlated {idx}</FeatureDetails>'
+                           f'<POMDetails>correlated{idx}() {{}}</POMDetails></StepDetails>' for idx in indexes)
+        raise AssertionError(call_site)
+
+
+@pytest.fixture
+def lookahead(monkeypatch, tmp_path):
+    executed = []
+
+    def execute(driver, code):
+        if "fail" in code:
+            raise RuntimeError("no such element")
+        executed.append(code)
+
+    monkeypatch.setattr(tsg, "lookahead_steps", 3)
+    # The tiktoken encoding is downloaded on first use
+    monkeypatch.setattr(prompt_context, "count_tokens", lambda text: len((text or "").split()))
+    monkeypatch.setattr(tsg, "step_memo", StepMemo(str(tmp_path / "memo.jsonl")))
+    monkeypatch.setattr(tsg, "step_checkpoints", StepCheckpoints(str(tmp_path / "checkpoints")))
+    monkeypatch.setattr(tsg, "execute_appium_code", execute)
+    monkeypatch.setattr(tsg, "extract_ui_elements", lambda driver: SCREEN)
+    monkeypatch.setattr(tsg.ui_waiter, "wait_for_idle", lambda driver, reason: None)
+    monkeypatch.setattr(tsg.llm_client, "invalidate", lambda prompt: None)
+    with RunWorkspace("lookahead", directory=str(tmp_path / "runs")) as workspace, token_accounting.test_case_scope("tc-1"):
+        yield workspace, executed
+
+
+def use_llm(monkeypatch, llm):
+    monkeypatch.setattr(tsg, "fetch_llm_response", llm)
+    monkeypatch.setattr(utils, "fetch_llm_response", llm)
+
+
+def run_step(workspace, idx, batch):
+    return tsg.execute_lookahead_step(None, workspace, idx, STEPS[idx - 1], STEPS, tsg.UiSnapshot.from_dicts(SCREEN),
+                                      "FormActivity", batch)
+
+
+def checkpoints():
+    return tsg.step_checkpoints.completed_prefix("tc-1", STEPS)
+
+
+def test_batch_failing_partway_keeps_executed_steps(monkeypatch, lookahead):
+    workspace, executed = lookahead
+    llm = FakeLLM([step_block(1, "driver.find_element('a').send_keys('Ann')")
+                   + step_block(2, "driver.find_element('fail').send_keys('x')")
+                   + step_block(3, "driver.find_element('c').click()")])
+    use_llm(monkeypatch, llm)
+
+    batch, succeeded, _ = run_step(workspace, 1, None)
+    assert succeeded and not batch.dropped
+    batch, succeeded, _ = run_step(workspace, 2, batch)
+
+    assert not succeeded and batch.dropped
+    assert llm.calls == ["step_lookahead", "correlation"]
+    assert [(c["idx"], c["feature"], c["pom"]) for c in checkpoints()] == [(1, "Correlated 1", "correlated1() {}")]
+    memo_entry = tsg.step_memo.lookup(STEPS[0], "FormActivity", tsg.UiSnapshot.from_dicts(SCREEN).fingerprint)
+    assert memo_entry["feature"] == "Correlated 1"
+    assert "Correlated 1" in workspace.read(utils.file_name_cucumber)
+    # Lookahead stays off for the rest of the test case
+    assert run_step(workspace, 3, batch) == (batch, False, tsg.UiSnapshot.from_dicts(SCREEN))
+
+
+def test_batch_skipping_a_step_is_finished_before_the_next_batch(monkeypatch, lookahead):
+    workspace, executed = lookahead
+    llm = FakeLLM([
+        step_block(1, "driver.find_element('a').send_keys('Ann')") + step_block(3, "driver.find_element('c').click()"),
+        step_block(2, "driver.find_element('b').send_keys('ann@example.com')") + step_block(3, "driver.find_element('c').click()"),
+    ])
+    use_llm(monkeypatch, llm)
+
+    batch, succeeded, _ = run_step(workspace, 1, None)
+    assert succeeded
+    batch, succeeded, _ = run_step(workspace, 2, batch)
+    assert succeeded
+    batch, succeeded, _ = run_step(workspace, 3, batch)
+    assert succeeded and not batch.blocks
+
+    assert llm.calls == ["step_lookahead", "correlation", "step_lookahead", "correlation"]
+    assert [(c["idx"], c["feature"]) for c in checkpoints()] == [
+        (1, "Correlated 1"), (2, "Correlated 2"), (3, "Correlated 3")]
+    assert len(executed) == 3
+
+
+def test_structure_fingerprint_ignores_text():
+    typed = [dict(element, text="Ann") if element["resource_id"] == "app:id/name" else element for element in SCREEN]
+    assert structure_fingerprint(typed) == structure_fingerprint(SCREEN)
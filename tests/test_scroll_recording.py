@@ -0,0 +1,95 @@
+import pytest
+
+import prompt_context
+import test_script_generator as tsg
+import token_accounting
+import utils
+from replay_executor import RecordedRun
+from run_workspace import RunWorkspace
+from step_checkpoint import StepCheckpoints
+from step_memo import StepMemo
+from ui_snapshot import UiSnapshot
+
+TOP = [
+    {"class": "android.widget.TextView", "resource_id": "app:id/title", "text": "Settings", "content_desc": ""},
+    {"class": "android.widget.Button", "resource_id": "app:id/wifi", "text": "Wi-Fi", "content_desc": ""},
+]
+BOTTOM = [
+    {"class": "android.widget.TextView", "resource_id": "app:id/title", "text": "Settings", "content_desc": ""},
+    {"class": "android.widget.Button", "resource_id": "app:id/about", "text": "About", "content_desc": ""},
+]
+STEP = "Tap 'About'"
+CODE = 'driver.find_element(By.XPATH, "About").click()'
+
+
+class NoSuchElementException(Exception):
+    pass
+
+
+class Element:
+    def click(self):
+        pass
+
+
+class Driver:
+    """Shows About only after a scroll."""
+
+    def __init__(self):
+        self.scrolled = False
+
+    def find_element(self, by, value):
+        if "scrollForward" in value or "scrollIntoView" in value:
+            self.scrolled = True
+            return Element()
+        if value == "About" and self.scrolled:
+            return Element()
+        raise NoSuchElementException(f"no such element: {value}")
+
+    def reset(self):
+        self.scrolled = False
+
+
+def fake_llm(prompt, call_site="other"):
+    if call_site == "step_resolution":
+        return f"<PythonDetails>{CODE}</PythonDetails><FeatureDetails>When I tap About</FeatureDetails><POMDetails>about() {{}}</POMDetails>"
+    if call_site == "correlation":
+        return "<FeatureDetails>When I tap About</FeatureDetails><POMDetails>about() {}</POMDetails>"
+    raise AssertionError(call_site)
+
+
+@pytest.fixture
+def scroll_run(monkeypatch, tmp_path):
+    driver = Driver()
+    monkeypatch.setattr(prompt_context, "count_tokens", lambda text: len((text or "").split()))
+    monkeypatch.setattr(tsg, "fetch_llm_response", fake_llm)
+    monkeypatch.setattr(utils, "fetch_llm_response", fake_llm)
+    monkeypatch.setattr(tsg, "step_memo", StepMemo(str(tmp_path / "memo.jsonl")))
+    monkeypatch.setattr(tsg, "step_checkpoints", StepCheckpoints(str(tmp_path / "checkpoints")))
+    monkeypatch.setattr(tsg, "extract_ui_elements", lambda driver: BOTTOM if driver.scrolled else TOP)
+    monkeypatch.setattr(tsg, "extract_ui_elements_with_retry", lambda driver: BOTTOM if driver.scrolled else TOP)
+    monkeypatch.setattr(tsg.ui_waiter, "wait_for_idle", lambda driver, reason: None)
+    monkeypatch.setattr(tsg.llm_client, "invalidate", lambda prompt: None)
+    with RunWorkspace("scroll", directory=str(tmp_path / "runs")) as workspace, token_accounting.test_case_scope("tc-2"):
+        yield driver, workspace
+
+
+@pytest.mark.parametrize("scroll", ["target", "blind"])
+def test_step_that_needed_a_scroll_is_recorded_with_it(scroll_run, scroll):
+    driver, workspace = scroll_run
+    start = UiSnapshot.from_dicts(TOP)
+    if scroll == "target":
+        result = tsg.attempt_scroll_to_target(driver, workspace, 1, STEP, "SettingsActivity", start)
+    else:
+        result = tsg.attempt_scroll_and_retry(driver, workspace, 1, STEP, start, "SettingsActivity", start)
+    assert result[1] == "success"
+
+    recorded = RecordedRun.from_generated_code("tc-2", "scroll", workspace.read(utils.output_file_name)).steps[0].code
+    checkpoint = tsg.step_checkpoints.completed_prefix("tc-2", [STEP])[0]["code"]
+    memo_entry = tsg.step_memo.lookup(STEP, "SettingsActivity", start.fingerprint)
+    assert recorded == checkpoint == memo_entry["code"]
+    assert recorded.splitlines()[-1] == CODE and "AppiumBy.ANDROID_UIAUTOMATOR" in recorded
+
+    # On a fresh, unscrolled screen the recorded code works on its own
+    driver.reset()
+    tsg.execute_appium_code(driver, recorded)
+    assert driver.scrolled
@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+from snippet_executor import SnippetExecutor, SnippetRejected
+
+
+class By:
+    XPATH = "xpath"
+
+
+class WebDriverWait:
+    def __init__(self, driver, timeout):
+        self.driver = driver
+
+    def until(self, condition):
+        return condition(self.driver)
+
+
+@pytest.fixture
+def executor():
+    return SnippetExecutor({"time": time, "By": By, "AppiumBy": By, "WebDriverWait": WebDriverWait})
+
+
+@pytest.mark.parametrize("code", [
+    'driver.find_element(By.XPATH, "//*[@text=\'Save\']").click()',
+    'WebDriverWait(driver, 10).until(lambda d: d.find_element(By.XPATH, "a")).click()',
+    'driver.execute_script("mobile: scrollGesture", {"left": 0, "top": 0, "width": 100, "height": 100, '
+    '"direction": "down", "percent": 1.0})',
+    'for element in driver.find_elements(By.XPATH, "a"):\n    element.click()',
+])
+def test_accepts_step_code(executor, code):
+    executor.compile(code)
+
+
+@pytest.mark.parametrize("code", [
+    'driver.quit()',
+    'x = driver',
+    'WebDriverWait(driver, 5).until(lambda d: d.quit())',
+    'driver.find_element(By.XPATH, "a").parent.quit()',
+    'driver.execute_script("mobile: shell", {"command": "rm -rf /sdcard"})',
+    'driver.execute_script("mobile: installApp", {"appPath": "/tmp/evil.apk"})',
+    'driver.execute_script("mobile: removeApp", {"appId": "com.expedia.bookings"})',
+    'driver.execute_script("mobile: clearApp", {"appId": "com.expedia.bookings"})',
+    'command = "mobile: scrollGesture"\ndriver.execute_script(command, {})',
+    'driver.execute_script()',
+    'run = driver.execute_script',
+    'WebDriverWait(driver, 5).until(lambda d: d.execute_script("mobile: shell", {"command": "reboot"}))',
+    'hasattr(driver, "quit")',
+])
+def test_rejects_unsafe_code(executor, code):
+    with pytest.raises(SnippetRejected):
+        executor.compile(code)
@@ -0,0 +1,14 @@
+from token_accounting import TokenLedger, test_case_scope as charge_to
+
+
+def test_ledger_keeps_only_recent_test_cases():
+    ledger = TokenLedger(max_test_cases=2)
+    for test_case_id in ("tc-1", "tc-2", "tc-1", "tc-3"):
+        with charge_to(test_case_id):
+            ledger.record("step_resolution", 100, 20, 5.0)
+
+    usage = ledger.summary()
+    # tc-2 was the least recently active when tc-3 came in
+    assert list(usage["by_test_case"]) == ["tc-1", "tc-3"]
+    assert ledger.summary("tc-1")["total"]["billed_tokens"] == 240
+    assert usage["total"]["calls"] == 4
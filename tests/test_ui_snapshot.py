@@ -0,0 +1,41 @@
+from ui_snapshot import UiSnapshot, parse_page_source
+
+ROW_HEIGHT = 200
+
+
+def list_screen(first_row, rows=5):
+    """A toolbar above a list showing rows first_row.. first_row + rows - 1."""
+    nodes = ['<node class="android.widget.TextView" resource-id="app:id/toolbar" text="Countries" '
+             'bounds="[0,0][1080,150]"/>',
+             '<node class="androidx.recyclerview.widget.RecyclerView" resource-id="app:id/list" text="" '
+             'scrollable="true" bounds="[0,150][1080,1150]">']
+    for position, row in enumerate(range(first_row, first_row + rows)):
+        top = 150 + position * ROW_HEIGHT
+        nodes.append(f'<node class="android.widget.TextView" resource-id="app:id/name" text="Country {row}" '
+                     f'bounds="[0,{top}][1080,{top + ROW_HEIGHT}]"/>')
+    nodes.append('</node>')
+    return parse_page_source(f'<hierarchy>{"".join(nodes)}</hierarchy>')
+
+
+def texts(snapshot):
+    return [element["text"] for element in snapshot]
+
+
+def test_scrolled_list_diff_only_has_revealed_rows():
+    before = list_screen(1)
+    # Scrolled by two rows: rows 3-5 moved up, 6-7 are new, 1-2 are gone
+    after = list_screen(3)
+
+    delta = after.diff(before)
+
+    assert texts(delta.added) == ["Country 6", "Country 7"]
+    assert texts(delta.removed) == ["Country 1", "Country 2"]
+
+
+def test_moved_elements_change_the_fingerprint_but_not_the_diff():
+    before = UiSnapshot.from_dicts([{"text": "OK", "class": "android.widget.Button", "bounds": "[0,0][100,50]"}])
+    moved = UiSnapshot.from_dicts([{"text": "OK", "class": "android.widget.Button", "bounds": "[0,500][100,550]"}])
+
+    assert moved.fingerprint != before.fingerprint
+    assert len(moved.diff(before).added) == 0 and len(moved.diff(before).removed) == 0
+    assert moved.fingerprint == UiSnapshot.from_dicts(moved.to_dicts()).fingerprint
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+import test_workflow_api as workflow_api
+
+
+@pytest.fixture
+def slow_workflow(monkeypatch):
+    state = {"started": asyncio.Event(), "stopped": False}
+
+    async def run_full_workflow(request):
+        state["started"].set()
+        try:
+            await asyncio.sleep(60)
+        finally:
+            state["stopped"] = True
+        return workflow_api.TestExecutionResponse(status="success", message="done")
+
+    monkeypatch.setattr(workflow_api, "run_full_workflow", run_full_workflow)
+    return state
+
+
+def test_cancel_workflow_returns_cancelled_response(slow_workflow):
+    async def scenario():
+        request = asyncio.ensure_future(
+            workflow_api.execute_full_workflow(workflow_api.TestExecutionRequest(workflow_id="wf-1")))
+        await slow_workflow["started"].wait()
+        assert workflow_api.cancel_workflow("wf-1")
+        return await request
+
+    response = asyncio.run(scenario())
+    assert response.status == "cancelled" and slow_workflow["stopped"]
+    assert "wf-1" not in workflow_api.running_workflows
+
+
+def test_cancelled_request_stops_the_workflow_and_propagates(slow_workflow):
+    async def scenario():
+        request = asyncio.ensure_future(
+            workflow_api.execute_full_workflow(workflow_api.TestExecutionRequest(workflow_id="wf-2")))
+        await slow_workflow["started"].wait()
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+
+    asyncio.run(scenario())
+    assert slow_workflow["stopped"]
+    assert "wf-2" not in workflow_api.running_workflows
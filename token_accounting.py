@@ -0,0 +1,133 @@
+"""
+Token accounting for LLM calls.
+
+The tokenizer is loaded once, lazily, and shared. Every call is recorded in
+a ledger by call site (step resolution, correlation, POM, class extraction,
+...) and by test case, and optional budgets reject oversized prompts before
+they are sent. Only the most recently active test cases are kept, so a
+long-running server does not accumulate the usage of every test case it ran.
+"""
+import contextvars
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+
+# Test case the current LLM calls are charged to; copied into asyncio tasks and worker threads
+current_test_case = contextvars.ContextVar("current_test_case", default=None)
+
+
+class TokenBudgetExceeded(Exception):
+    """A prompt would exceed the configured token budget and was not sent."""
+
+
+@lru_cache(maxsize=None)
+def get_encoder():
+    import tiktoken
+    return tiktoken.encoding_for_model("gpt-4")
+
+
+def count_tokens(text):
+    return len(get_encoder().encode(text or ""))
+
+
+@contextmanager
+def test_case_scope(test_case_id):
+    """Charge every LLM call made inside the block to test_case_id."""
+    token = current_test_case.set(str(test_case_id))
+    try:
+        yield
+    finally:
+        current_test_case.reset(token)
+
+
+def _empty_usage():
+    return {"calls": 0, "cached_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "billed_tokens": 0, "latency_ms": 0}
+
+
+def _add_usage(usage, prompt_tokens, completion_tokens, latency_ms, cached):
+    usage["calls"] += 1
+    usage["cached_calls"] += 1 if cached else 0
+    usage["prompt_tokens"] += prompt_tokens
+    usage["completion_tokens"] += completion_tokens
+    # Cache hits cost nothing, only billed tokens count against budgets
+    usage["billed_tokens"] += 0 if cached else prompt_tokens + completion_tokens
+    usage["latency_ms"] += round(latency_ms)
+
+
+class TokenLedger:
+    def __init__(self, max_prompt_tokens=0, max_tokens_per_test_case=0, max_test_cases=1000):
+        # 0 disables a budget
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_tokens_per_test_case = max_tokens_per_test_case
+        # Test cases whose usage is kept, the least recently active are dropped first
+        self.max_test_cases = max_test_cases
+        self._lock = threading.Lock()
+        self._totals = _empty_usage()
+        self._by_call_site = {}
+        self._by_test_case = OrderedDict()
+
+    @classmethod
+    def from_config(cls, budget_config):
+        budget_config = budget_config or {}
+        return cls(
+            max_prompt_tokens=int(budget_config.get("max_prompt_tokens", 0)),
+            max_tokens_per_test_case=int(budget_config.get("max_tokens_per_test_case", 0)),
+            max_test_cases=int(budget_config.get("max_test_cases", 1000))
+        )
+
+    def check_budget(self, prompt_tokens, call_site):
+        """Raise TokenBudgetExceeded before a prompt that would break a budget is sent."""
+        if self.max_prompt_tokens and prompt_tokens > self.max_prompt_tokens:
+            raise TokenBudgetExceeded(
+                f"{call_site} prompt has {prompt_tokens} tokens, budget is {self.max_prompt_tokens}")
+        test_case_id = current_test_case.get()
+        if self.max_tokens_per_test_case and test_case_id is not None:
+            with self._lock:
+                usage = self._by_test_case.get(test_case_id, {}).get("total", _empty_usage())
+                spent = usage["billed_tokens"]
+            if spent + prompt_tokens > self.max_tokens_per_test_case:
+                raise TokenBudgetExceeded(
+                    f"Test case {test_case_id} has used {spent} tokens, {call_site} prompt of {prompt_tokens} "
+                    f"would exceed the budget of {self.max_tokens_per_test_case}")
+
+    def record(self, call_site, prompt_tokens, completion_tokens, latency_ms, cached=False):
+        test_case_id = current_test_case.get()
+        with self._lock:
+            _add_usage(self._totals, prompt_tokens, completion_tokens, latency_ms, cached)
+            _add_usage(self._by_call_site.setdefault(call_site, _empty_usage()),
+                       prompt_tokens, completion_tokens, latency_ms, cached)
+            if test_case_id is not None:
+                test_case_usage = self._by_test_case.setdefault(test_case_id, {"total": _empty_usage(), "by_call_site": {}})
+                self._by_test_case.move_to_end(test_case_id)
+                _add_usage(test_case_usage["total"], prompt_tokens, completion_tokens, latency_ms, cached)
+                _add_usage(test_case_usage["by_call_site"].setdefault(call_site, _empty_usage()),
+                           prompt_tokens, completion_tokens, latency_ms, cached)
+                while len(self._by_test_case) > max(self.max_test_cases, 1):
+                    self._by_test_case.popitem(last=False)
+
+    def summary(self, test_case_id=None):
+        with self._lock:
+            if test_case_id is not None:
+                usage = self._by_test_case.get(str(test_case_id))
+                return {
+                    "test_case_id": str(test_case_id),
+                    "total": dict(usage["total"]) if usage else _empty_usage(),
+                    "by_call_site": {site: dict(u) for site, u in usage["by_call_site"].items()} if usage else {}
+                }
+            return {
+                "total": dict(self._totals),
+                "by_call_site": {site: dict(u) for site, u in self._by_call_site.items()},
+                "by_test_case": {
+                    test_case: dict(usage["total"]) for test_case, usage in self._by_test_case.items()
+                },
+                "budgets": {
+                    "max_prompt_tokens": self.max_prompt_tokens,
+                    "max_tokens_per_test_case": self.max_tokens_per_test_case
+                }
+            }
+
+    def reset(self, test_case_id):
+        """Clear the usage of one test case, e.g. before it is run again."""
+        with self._lock:
+            self._by_test_case.pop(str(test_case_id), None)
@@ -0,0 +1,326 @@
+"""
+Single round-trip UI snapshot engine.
+
+Fetches `driver.page_source` once and parses the UiAutomator2 hierarchy with a
+streaming XML parser, instead of issuing one Appium HTTP call per attribute
+per element.
+
+Snapshots are stored as a compact column table (UiSnapshot): every attribute
+value is interned once in the snapshot's own string table and rows are plain
+integer ids, so filtering, comparing and diffing never copy the element data.
+Views share the table of their base snapshot; the table is freed with it, so
+a long-running server does not keep the text of every screen it has seen.
+
+Every row also carries two stable 64-bit hashes computed while the snapshot
+is built: one of its identity (text, resource id, content description,
+class), which diffs match rows on so an element that only moved, e.g. after a
+scroll, is not reported as new, and one that also covers its bounds. The
+snapshot fingerprint is the order-independent sum of the latter, so "did the
+screen or its layout change?" is a constant-time comparison and the
+fingerprint can key caches across processes.
+"""
+import hashlib
+import time
+import xml.etree.ElementTree as ET
+from array import array
+from collections import Counter, namedtuple
+
+SNAPSHOT_MODE_PAGE_SOURCE = "page_source"
+SNAPSHOT_MODE_ELEMENTS = "elements"
+
+# Root node of the UiAutomator2 page source, not a real view
+HIERARCHY_TAG = "hierarchy"
+
+# Column order of a snapshot row, matches the legacy ui element dict keys
+UI_COLUMNS = ("text", "resource_id", "class", "content_desc", "bounds", "focusable", "enabled", "focused", "selected", "clickable",
+              "scrollable")
+COLUMN_INDEX = {name: idx for idx, name in enumerate(UI_COLUMNS)}
+
+# Columns that identify an element when diffing two screens; its position is not part of it
+IDENTITY_COLUMNS = ("text", "resource_id", "content_desc", "class")
+IDENTITY_INDEXES = tuple(COLUMN_INDEX[name] for name in IDENTITY_COLUMNS)
+
+# Columns the snapshot fingerprint covers: identity and position
+LAYOUT_COLUMNS = IDENTITY_COLUMNS + ("bounds",)
+LAYOUT_INDEXES = tuple(COLUMN_INDEX[name] for name in LAYOUT_COLUMNS)
+
+FINGERPRINT_MASK = (1 << 64) - 1
+
+# Result of UiSnapshot.diff: both fields are snapshot views
+UiDelta = namedtuple("UiDelta", ["added", "removed"])
+
+# Page source is fed to the pull parser in chunks so finished nodes can be freed
+PARSE_CHUNK_SIZE = 64 * 1024
+
+
+class StringTable:
+    """
+    Interns attribute values to small integer ids. Id 0 is reserved for None.
+    Written only while its snapshot is built, by the thread building it; afterwards read-only.
+    """
+    __slots__ = ("_ids", "_values")
+
+    def __init__(self):
+        self._ids = {}
+        self._values = [None]
+
+    def intern(self, value):
+        if value is None:
+            return 0
+        string_id = self._ids.get(value)
+        if string_id is None:
+            string_id = len(self._values)
+            self._ids[value] = string_id
+            self._values.append(value)
+        return string_id
+
+    def value(self, string_id):
+        return self._values[string_id]
+
+    def __len__(self):
+        return len(self._values)
+
+
+def element_hash(values):
+    """Stable 64-bit hash of an element's identity values (same across processes)."""
+    joined = "\x1f".join("\x00" if value is None else value for value in values)
+    return int.from_bytes(hashlib.blake2b(joined.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class UiElement:
+    """Read-only row of a UiSnapshot, usable wherever a ui element dict was."""
+    __slots__ = ("_snapshot", "_row")
+
+    def __init__(self, snapshot, row):
+        self._snapshot = snapshot
+        self._row = row
+
+    def __getitem__(self, key):
+        return self._snapshot._value(self._row, COLUMN_INDEX[key])
+
+    def get(self, key, default=None):
+        column = COLUMN_INDEX.get(key)
+        if column is None:
+            return default
+        return self._snapshot._value(self._row, column)
+
+    def keys(self):
+        return UI_COLUMNS
+
+    def items(self):
+        return [(name, self[name]) for name in UI_COLUMNS]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, UiElement):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self[name] for name in IDENTITY_COLUMNS))
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class UiSnapshot:
+    """
+    Column-oriented table of UI elements.
+
+    Columns are arrays of interned string ids. A filtered snapshot is a view:
+    it shares the columns and row hashes of its base and only keeps its own
+    row index array.
+    """
+    __slots__ = ("_strings", "_columns", "_hashes", "_layout_hashes", "_rows", "_fingerprint")
+
+    def __init__(self, strings=None, columns=None, hashes=None, layout_hashes=None, rows=None):
+        # A table per snapshot chain: ids are only compared within it, across screens rows are compared by hash
+        self._strings = strings if strings is not None else StringTable()
+        self._columns = columns if columns is not None else tuple(array("I") for _ in UI_COLUMNS)
+        # Identity hashes, matched by diff
+        self._hashes = hashes if hashes is not None else array("Q")
+        # Identity and bounds hashes, summed into the fingerprint
+        self._layout_hashes = layout_hashes if layout_hashes is not None else array("Q")
+        self._rows = rows if rows is not None else range(len(self._hashes))
+        self._fingerprint = None
+
+    @classmethod
+    def from_rows(cls, rows, strings=None):
+        """Build a snapshot from tuples ordered like UI_COLUMNS."""
+        snapshot = cls(strings)
+        intern = snapshot._strings.intern
+        columns = snapshot._columns
+        hashes = snapshot._hashes
+        layout_hashes = snapshot._layout_hashes
+        total = 0
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(intern(value))
+            hashes.append(element_hash([row[column] for column in IDENTITY_INDEXES]))
+            layout_hash = element_hash([row[column] for column in LAYOUT_INDEXES])
+            layout_hashes.append(layout_hash)
+            total += layout_hash
+        snapshot._rows = range(len(hashes))
+        snapshot._fingerprint = _format_fingerprint(len(hashes), total)
+        return snapshot
+
+    @classmethod
+    def from_dicts(cls, ui_elements, strings=None):
+        """Build a snapshot from legacy ui element dicts (or another snapshot)."""
+        if isinstance(ui_elements, UiSnapshot):
+            return ui_elements
+        return cls.from_rows((tuple(e.get(name) for name in UI_COLUMNS) for e in ui_elements), strings)
+
+    def _value(self, row, column):
+        return self._strings.value(self._columns[column][row])
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        for row in self._rows:
+            yield UiElement(self, row)
+
+    def __getitem__(self, index):
+        return UiElement(self, self._rows[index])
+
+    @property
+    def fingerprint(self):
+        """Order-independent content and layout fingerprint, computed once per snapshot or view."""
+        if self._fingerprint is None:
+            layout_hashes = self._layout_hashes
+            self._fingerprint = _format_fingerprint(len(self._rows), sum(layout_hashes[row] for row in self._rows))
+        return self._fingerprint
+
+    def filter(self, predicate):
+        """Return a view with the elements for which predicate(element) is true."""
+        rows = array("I", (row for row in self._rows if predicate(UiElement(self, row))))
+        return self._view(rows)
+
+    def _view(self, rows):
+        return UiSnapshot(self._strings, self._columns, self._hashes, self._layout_hashes, rows)
+
+    def diff(self, other):
+        """
+        Compare against an older snapshot. Elements are matched on their identity, so one that only moved (a
+        scrolled list row) is neither added nor removed.
+
+        Returns:
+            UiDelta: (added, removed) views; added rows come from self, removed from other
+        """
+        if self.fingerprint == other.fingerprint:
+            return UiDelta(self._view(array("I")), other._view(array("I")))
+        mine = Counter(self._hashes[row] for row in self._rows)
+        theirs = Counter(other._hashes[row] for row in other._rows)
+        return UiDelta(self._take(mine - theirs), other._take(theirs - mine))
+
+    def _take(self, counts):
+        rows = array("I")
+        for row in self._rows:
+            row_hash = self._hashes[row]
+            if counts.get(row_hash, 0) > 0:
+                counts[row_hash] -= 1
+                rows.append(row)
+        return self._view(rows)
+
+    def __eq__(self, other):
+        if not isinstance(other, UiSnapshot):
+            return NotImplemented
+        return self.fingerprint == other.fingerprint
+
+    def __hash__(self):
+        return hash(self.fingerprint)
+
+    def to_dicts(self):
+        return [element.to_dict() for element in self]
+
+    def __repr__(self):
+        return repr(self.to_dicts())
+
+
+def _format_fingerprint(count, total):
+    return f"{count:x}-{total & FINGERPRINT_MASK:016x}"
+
+
+def parse_page_source(xml_source, strings=None):
+    """
+    Parse a UiAutomator2 page source into a UiSnapshot with the ui element
+    columns used by extract_ui_elements (text, resource_id, class,
+    content_desc, bounds, focusable, enabled, focused, selected, clickable,
+    scrollable).
+    """
+    return UiSnapshot.from_rows(_iter_page_source_rows(xml_source), strings)
+
+
+def _iter_page_source_rows(xml_source):
+    parser = ET.XMLPullParser(events=("start", "end"))
+    for offset in range(0, len(xml_source), PARSE_CHUNK_SIZE):
+        parser.feed(xml_source[offset:offset + PARSE_CHUNK_SIZE])
+        yield from _read_page_source_events(parser)
+    parser.close()
+    yield from _read_page_source_events(parser)
+
+
+def _read_page_source_events(parser):
+    for event, node in parser.read_events():
+        if event == "end":
+            # Attributes were already read on "start", free the subtree
+            node.clear()
+            continue
+        if node.tag == HIERARCHY_TAG:
+            continue
+        attrib = node.attrib
+        yield (
+            attrib.get("text", ""),
+            attrib.get("resource-id") or None,
+            attrib.get("class", node.tag),
+            attrib.get("content-desc") or None,
+            attrib.get("bounds"),
+            attrib.get("focusable"),
+            attrib.get("enabled"),
+            attrib.get("focused"),
+            attrib.get("selected"),
+            attrib.get("clickable"),
+            attrib.get("scrollable")
+        )
+
+
+def extract_ui_elements_from_page_source(driver):
+    """Grab all UI elements with one page_source round trip."""
+    xml_source = driver.page_source
+    snapshot = parse_page_source(xml_source)
+    print(f"📸 Snapshot parsed from page source: {len(snapshot)} elements")
+    return snapshot
+
+
+def benchmark_ui_extraction(driver, extractors, rounds=3):
+    """
+    Time each extractor against the same screen.
+
+    Args:
+        driver: Appium driver on the screen to measure
+        extractors (dict): name -> callable(driver) returning a ui element list
+        rounds (int): number of timed runs per extractor
+
+    Returns:
+        dict: name -> {"elements", "best_ms", "avg_ms"}
+    """
+    results = {}
+    for name, extractor in extractors.items():
+        timings = []
+        element_count = 0
+        for _ in range(rounds):
+            started = time.perf_counter()
+            element_count = len(extractor(driver))
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = {
+            "elements": element_count,
+            "best_ms": round(min(timings), 2),
+            "avg_ms": round(sum(timings) / len(timings), 2)
+        }
+        print(f"⏱️ {name}: {element_count} elements, best {results[name]['best_ms']} ms, avg {results[name]['avg_ms']} ms")
+    return results
@@ -0,0 +1,157 @@
+"""
+Event-driven UI stabilization waits.
+
+Instead of sleeping a fixed time, wait_for_idle polls a hash of the view
+hierarchy and returns as soon as it has not changed for stable_ms, or when
+the timeout for the wait reason runs out. Timeouts adapt to how long each
+reason has actually needed to settle, capped by the configured value, and
+every wait is recorded in the WaitReport of the current test case by step.
+"""
+import contextvars
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds per wait reason, overridable under ui_wait.timeouts_ms in config.yaml
+DEFAULT_TIMEOUTS_MS = {
+    "driver_start": 10000,
+    "after_step": 4000,
+    "retry": 4000,
+    "after_scroll": 3000,
+    "stale": 3000,
+    "default": 3000
+}
+
+# An adaptive timeout leaves this much headroom over the observed settle time
+ADAPTIVE_HEADROOM = 2.5
+
+# Smoothing of the observed settle time per reason
+SETTLE_SMOOTHING = 0.3
+
+# Report of the test case currently running; copied into asyncio tasks and worker threads
+current_wait_report = contextvars.ContextVar("current_wait_report", default=None)
+
+
+def hierarchy_hash(driver):
+    """Cheap fingerprint of the current view hierarchy, None when it cannot be read."""
+    try:
+        return hashlib.blake2b(driver.page_source.encode("utf-8"), digest_size=8).digest()
+    except Exception:
+        return None
+
+
+class WaitReport:
+    """Waits of one test case, grouped by step."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._steps = {}
+        self.current_step = 0
+
+    def start_step(self, idx):
+        self.current_step = idx
+
+    def add(self, reason, waited_ms, timeout_ms, stable):
+        with self._lock:
+            step = self._steps.setdefault(self.current_step, {"step": self.current_step, "waited_ms": 0, "waits": []})
+            step["waited_ms"] += waited_ms
+            step["waits"].append({"reason": reason, "waited_ms": waited_ms, "timeout_ms": timeout_ms, "stable": stable})
+
+    def step_summary(self, idx):
+        with self._lock:
+            step = self._steps.get(idx)
+            return {"step": idx, "waited_ms": step["waited_ms"], "waits": list(step["waits"])} if step else None
+
+    def summary(self):
+        with self._lock:
+            return [
+                {"step": step["step"], "waited_ms": step["waited_ms"], "waits": list(step["waits"])}
+                for _, step in sorted(self._steps.items())
+            ]
+
+
+@contextmanager
+def wait_report_scope(report):
+    """Record every wait made inside the block in report."""
+    token = current_wait_report.set(report)
+    try:
+        yield report
+    finally:
+        current_wait_report.reset(token)
+
+
+class UiIdleWaiter:
+    def __init__(self, stable_ms=500, poll_ms=250, timeouts_ms=None, adaptive=True, min_timeout_ms=1000):
+        self.stable_ms = stable_ms
+        self.poll_ms = poll_ms
+        self.timeouts_ms = {**DEFAULT_TIMEOUTS_MS, **(timeouts_ms or {})}
+        self.adaptive = adaptive
+        self.min_timeout_ms = min_timeout_ms
+        self._lock = threading.Lock()
+        self._settle_ms = {}
+
+    @classmethod
+    def from_config(cls, wait_config):
+        wait_config = wait_config or {}
+        return cls(
+            stable_ms=int(wait_config.get("stable_ms", 500)),
+            poll_ms=int(wait_config.get("poll_ms", 250)),
+            timeouts_ms={reason: int(ms) for reason, ms in (wait_config.get("timeouts_ms") or {}).items()},
+            adaptive=bool(wait_config.get("adaptive", True)),
+            min_timeout_ms=int(wait_config.get("min_timeout_ms", 1000))
+        )
+
+    def timeout_for(self, reason):
+        """Configured timeout for reason, tightened to the observed settle time when adaptive."""
+        configured = self.timeouts_ms.get(reason, self.timeouts_ms["default"])
+        if not self.adaptive:
+            return configured
+        with self._lock:
+            settle_ms = self._settle_ms.get(reason)
+        if settle_ms is None:
+            return configured
+        return int(min(configured, max(self.min_timeout_ms, settle_ms * ADAPTIVE_HEADROOM + self.stable_ms)))
+
+    def _observe(self, reason, settle_ms):
+        with self._lock:
+            previous = self._settle_ms.get(reason)
+            self._settle_ms[reason] = settle_ms if previous is None else (
+                previous + SETTLE_SMOOTHING * (settle_ms - previous))
+
+    def wait_for_idle(self, driver, reason="default"):
+        """
+        Block until the view hierarchy has been unchanged for stable_ms or the timeout passes.
+
+        Returns:
+            bool: True when the UI settled, False when the wait timed out
+        """
+        timeout_ms = self.timeout_for(reason)
+        started = time.monotonic()
+        deadline = started + timeout_ms / 1000
+        last_hash = None
+        stable_since = None
+        stable = False
+        while True:
+            current_hash = hierarchy_hash(driver)
+            now = time.monotonic()
+            if current_hash is not None and current_hash == last_hash:
+                if (now - stable_since) * 1000 >= self.stable_ms:
+                    stable = True
+                    break
+            else:
+                last_hash, stable_since = current_hash, now
+            if now >= deadline:
+                break
+            time.sleep(min(self.poll_ms / 1000, deadline - now))
+
+        waited_ms = round((time.monotonic() - started) * 1000)
+        # A timed out wait counts as needing the full configured time, so the timeout grows back
+        self._observe(reason, max(waited_ms - self.stable_ms, 0) if stable
+                      else self.timeouts_ms.get(reason, self.timeouts_ms["default"]))
+        report = current_wait_report.get()
+        if report is not None:
+            report.add(reason, waited_ms, timeout_ms, stable)
+        if not stable:
+            print(f"⏳ UI did not settle within {timeout_ms} ms ({reason})")
+        return stable
@@ -1,8 +1,8 @@
+import asyncio
 import configparser
+import functools
 import os
 import time
-import boto3
-import json
 from botocore.exceptions import ClientError
 from models import TestCase
 from appium import webdriver
@@ -12,46 +12,72 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from typing import List
-import tiktoken
 import yaml
 import re
 import shutil
-from constants import PROMPT_RULES_CUCUMBER,PROMPT_RULES_POM,PROMPT_RULES_TEST_CODE, PROMPT_RULES_CLASS_CREATE, PROMPT_RULES_CONTENT_CORELATION, MAX_RETRY_ATTEMPTS, EXTRACT_CLASS_NAME_RULES
+from ui_snapshot import UiSnapshot
+from llm_cache import LLMCache, LLMCacheMiss
+from llm_client import BedrockLLMClient
+from token_accounting import TokenLedger, TokenBudgetExceeded
+from js_class_splitter import JsParseError, split_classes
+from stage_pipeline import Stage, run_stages
+from ui_wait import UiIdleWaiter
+from driver_pool import AppiumDriverPool
+from retry_policy import RetryPolicy, STALE, classify_error
+from snippet_executor import SnippetExecutor
+from replay_executor import format_step_header
+from constants import PROMPT_RULES_CUCUMBER,PROMPT_RULES_POM,PROMPT_RULES_TEST_CODE, PROMPT_RULES_CLASS_CREATE, PROMPT_RULES_CONTENT_CORELATION, PROMPT_RULES_CONTENT_CORELATION_STEPS, MAX_RETRY_ATTEMPTS, EXTRACT_CLASS_NAME_RULES
 
 model_id = "qwen.qwen3-coder-480b-a35b-v1:0"
 # Create an Amazon Bedrock Runtime client.
 
+# Buffers of a run's workspace, and their file names when spilled to the run directory
 output_file_name = "generated_code.txt"
 file_name_cucumber = "generated_script_cucumber.txt"
 file_name_pom = "generated_script_pom.txt"
 file_name = "generated_script.txt"
 file_name_consolidated_cucumber = ".feature"
 output_dir="extracted_files"
+app_package = "com.expedia.bookings"
+app_activity = "com.expedia.bookings.activity.SearchActivity"
 
 with open("config.yaml", "r") as f:
     config = yaml.safe_load(f)
 
-# Initialize Bedrock client with credentials
-bedrock = boto3.client(
-    service_name='bedrock-runtime',
-    region_name=config.get('aws', {}).get('region_name'),
-    aws_access_key_id=config.get('aws', {}).get('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=config.get('aws', {}).get('AWS_SECRET_ACCESS_KEY'),
-    aws_session_token=config.get('aws', {}).get('AWS_SESSION_TOKEN')
-)
-
-request_payload = {
-    "messages": [
-        {
-            "role": "user",
-            "content": ""
-        }
-    ],
+sampling_params = {
     "temperature": 0.5,
     "max_tokens": 8192,
     "top_p": 0.9
     }
 
+llm_cache = LLMCache.from_config(config.get('llm_cache'))
+
+# Prompt/completion tokens per call site and per test case, plus optional budgets
+token_ledger = TokenLedger.from_config(config.get('token_budget'))
+
+# Shared, thread-safe Bedrock client with pooled connections and a bounded in-flight limit
+llm_client = BedrockLLMClient.from_config(model_id, sampling_params, config, cache=llm_cache, ledger=token_ledger)
+
+# Waits for the view hierarchy to settle instead of sleeping a fixed time
+ui_waiter = UiIdleWaiter.from_config(config.get('ui_wait'))
+
+# Wall-clock and LLM call budget per step, shared by every retry layer
+retry_policy = RetryPolicy.from_config(config.get('retry'), ui_waiter)
+
+# Validates and compiles generated snippets once, before they reach the device
+snippet_executor = SnippetExecutor({
+    "time": time,
+    "By": By,
+    "AppiumBy": AppiumBy,
+    "WebDriverWait": WebDriverWait,
+    "EC": EC
+})
+
+class_extraction_config = config.get('class_extraction', {}) or {}
+class_extraction_workers = int(class_extraction_config.get('workers', 4))
+class_extraction_max_attempts = int(class_extraction_config.get('max_attempts', 4))
+class_extraction_backoff_seconds = float(class_extraction_config.get('backoff_seconds', 1))
+
 def get_apk_path():
     config = configparser.ConfigParser()
     config.read(os.path.join(os.path.dirname(__file__), 'app.properties'))
@@ -60,113 +86,94 @@ def get_apk_path():
         raise ValueError("APK_PATH not found in app.properties")
     return apk_path
 
-def fetch_llm_response(prompt):
-    # Placeholder for LLM integration
-    # In a real implementation, this would call an LLM API like OpenAI's GPT
-    countToken(prompt)
-    request_payload["messages"][0]["content"] = prompt
+# Never turned into an "ERROR: ..." response or retried: an exceeded budget must fail the test case
+# and a replay-mode cache miss must be reported, not hidden behind a fallback
+LLM_HARD_ERRORS = (LLMCacheMiss, TokenBudgetExceeded)
 
+def fetch_llm_response(prompt, call_site="other"):
     try:
-        response = bedrock.invoke_model(
-            modelId=model_id,
-            body=json.dumps(request_payload),
-            contentType="application/json",
-            accept="application/json"
-        )
-
-        response_body = json.loads(response["body"].read())
-
-        # Extract content
-        response_text = response_body["choices"][0]["message"]["content"]
-
-        #print("Response from Bedrock:", response_text)
-        return response_text
-
+        return llm_client.invoke(prompt, call_site)
+    except LLM_HARD_ERRORS:
+        raise
     except (ClientError, Exception) as e:
+        # Runs on device worker threads, raise instead of exiting the process
         print(f"ERROR: Can't invoke '{model_id}'. Reason: {e}")
-        exit(1)
+        raise
+
 
+async def fetch_llm_response_async(prompt, call_site="other"):
+    """Awaitable fetch_llm_response for pipeline stages; failures raise instead of exiting."""
+    return await llm_client.ainvoke(prompt, call_site)
 
-def append_to_file(text):
-    with open(output_file_name, "a") as file:
-        file.write(text + "\n")
 
-def delete_output_file(test_case_id):
-    if os.path.exists(output_file_name):
-        os.remove(output_file_name)
-        print(f"{output_file_name} has been deleted.")
-    with open(file_name_cucumber, "w") as file:
-        file.write("")
-    with open(file_name_pom, "w") as file:
-        file.write("")   
+def append_to_file(workspace, text, idx=None, step=None):
+    # The step header makes the generated code a recorded run the replay executor can parse
+    if idx is not None:
+        text = format_step_header(idx, step) + "\n" + text
+    workspace.append(output_file_name, text + "\n")
 
 def delete_output_folder(test_case_id):    
     delete_folder("extracted_files/"+test_case_id)
 
-def initiate_appium_driver():
+def initiate_appium_driver(device=None):
+    """Start a session on device ({"server_url", "udid", "system_port", ...} from config.yaml devices), or on the local emulator."""
+    device = device or {}
     # Appium driver setup
     options = UiAutomator2Options()
     options.platform_name = "Android"
     options.automation_name = "UiAutomator2"
-    options.device_name = "Android Emulator"
+    options.device_name = device.get('device_name', "Android Emulator")
+    if device.get('udid'):
+        options.udid = device['udid']
+    if device.get('system_port'):
+        # Every UiAutomator2 session on a host needs its own port
+        options.system_port = int(device['system_port'])
     # Load APK path from utility function
     options.app = get_apk_path()
-    options.app_package = "com.expedia.bookings"
-    options.app_activity = "com.expedia.bookings.activity.SearchActivity"
+    options.app_package = app_package
+    options.app_activity = app_activity
     #options.new_command_timeout = 3000  # <-- Increase timeout here
 
-    return webdriver.Remote("http://localhost:4723", options=options)
-
-def is_stale_element_error(error_msg):
-    """Check if the error is related to stale elements."""
-    stale_indicators = [
-        "stale", 
-        "cached elements", 
-        "do not exist in dom", 
-        "element is no longer attached",
-        "element not found",
-        "no such element",
-        "StaleElementReferenceException",
-        "ElementsCache.restore",
-        "ElementsCache.get"
+    return webdriver.Remote(device.get('server_url', "http://localhost:4723"), options=options)
+
+# Warm Appium sessions reused across test cases, reset between them instead of recreated
+driver_pool = AppiumDriverPool.from_config(initiate_appium_driver, app_package, config.get('driver_pool'))
+
+
+def create_device_pools():
+    """One driver pool per device configured under devices, or the default pool when none are."""
+    device_configs = config.get('devices') or []
+    if not device_configs:
+        return [("default", driver_pool)]
+    return [
+        (
+            device.get('name') or device.get('udid') or device.get('server_url'),
+            AppiumDriverPool.from_config(functools.partial(initiate_appium_driver, device), app_package, config.get('driver_pool'))
+        )
+        for device in device_configs
     ]
-    return any(indicator in error_msg.lower() for indicator in stale_indicators)
 
 def execute_appium_code(driver, code):
-    """Execute Appium code with proper exception handling for stale elements."""
-    max_retries = MAX_RETRY_ATTEMPTS
-    for attempt in range(max_retries):
+    """
+    Execute Appium code, retrying stale element errors within the current step's retry budget.
+    Raises SnippetRejected, without touching the device, when the code does not compile or is not allowed.
+    """
+    compiled = snippet_executor.compile(code)
+    budget = retry_policy.current_budget()
+    attempt = 0
+    while True:
         try:
-            exec(code, {
-                        "driver": driver,
-                        "time": time,
-                        "By": By,
-                        "AppiumBy": AppiumBy,
-                        "WebDriverWait": WebDriverWait,
-                        "EC": EC
-                    }
-                )
+            snippet_executor.run(driver, compiled)
             return  # Success, exit
         except Exception as e:
-            error_msg = str(e)
-            if is_stale_element_error(error_msg):
-                print(f"⚠️ Detected stale element error (attempt {attempt + 1}/{max_retries}): {error_msg}")
-                if attempt < max_retries - 1:
-                    print("🔄 Waiting for DOM to stabilize and retrying...")
-                    time.sleep(3)  # Wait longer for DOM to stabilize
-                    continue
-                else:
-                    print(f"❌ Code execution failed after {max_retries} attempts due to persistent stale elements")
-                    raise Exception(f"Persistent stale element error: {error_msg}")
-            else:
-                # Non-stale error, re-raise immediately
-                raise e
-def countToken(text): 
-    enc = tiktoken.encoding_for_model("gpt-4")
-    tokens = enc.encode(text)
-    print("Token count:", len(tokens))
-
-
+            if budget.retry(driver, e, attempt, MAX_RETRY_ATTEMPTS, retry_on=(STALE,)):
+                attempt += 1
+                continue
+            if classify_error(e) == STALE:
+                print(f"❌ Code execution failed after {attempt + 1} attempts due to persistent stale elements")
+                raise Exception(f"Persistent stale element error: {e}")
+            # Non-stale error, re-raise immediately
+            raise e
 def parse_natural_language_steps_to_testcase(nl_text: str) -> List[TestCase]:
     """
     Parses a natural language test case string and returns a TestCase object.
@@ -228,17 +235,13 @@ def extract_tag_content(tag_name, content):
     # Extract content inside the tag
     return content[start_index + len(start_tag):end_index].strip()  
 
-def writeTofileCucumber(code_to_write):    
+def writeTofileCucumber(workspace, code_to_write):    
     if code_to_write and code_to_write.strip(): 
-        with open(file_name_cucumber, "a") as file:
-            file.write(code_to_write)
-            file.write("\n\n")
+        workspace.append(file_name_cucumber, code_to_write + "\n\n")
 
-def writeTofilePom(code_to_write):    
+def writeTofilePom(workspace, code_to_write):    
     if code_to_write and code_to_write.strip(): 
-        with open(file_name_pom, "a") as file:
-            file.write(code_to_write)   
-            file.write("\n\n")    
+        workspace.append(file_name_pom, code_to_write + "\n\n")
 
 def delete_folder(folder_path):
     if os.path.exists(folder_path):
@@ -247,21 +250,53 @@ def delete_folder(folder_path):
     else:
         print(f"Folder not found: {folder_path}")
 
-def create_files(test_case_id):
+def create_files(test_case_id, workspace):
+    """Generate the feature file, page-object classes and step definitions for a finished run."""
+    return asyncio.run(create_files_async(test_case_id, workspace))
+
 
+async def create_files_async(test_case_id, workspace):
     delete_output_folder(test_case_id)
 
-    cuccumber_feature = clean_and_extract_cuccumber_code()
-    cuccumber_feature = extract_tag_content("FeatureTag", cuccumber_feature)
-    writeTofileCucumberFeature(cuccumber_feature,test_case_id)    
-    
-    pom_details = clean_and_extract_pom_code()
-    class_pom_details = clean_code_for_classes(pom_details)
-    extract_and_create_classes(class_pom_details,test_case_id);
+    # Both POM prompts use the same fragments, read them once
+    pom_source = workspace.read(file_name_pom)
+    cucumber_source = workspace.read(file_name_cucumber)
+
+    async def cucumber_llm(_):
+        return await fetch_llm_response_async(build_cucumber_prompt(cucumber_source), "cucumber")
+
+    async def write_feature(inputs):
+        cuccumber_feature = extract_tag_content("FeatureTag", inputs["cucumber_llm"])
+        writeTofileCucumberFeature(cuccumber_feature,test_case_id)    
+
+    async def pom_llm(_):
+        return await fetch_llm_response_async(build_pom_prompt(pom_source), "pom")
+
+    async def write_classes(inputs):
+        class_pom_details = clean_code_for_classes(inputs["pom_llm"])
+        return await extract_and_create_classes_async(class_pom_details,test_case_id)
+
+    async def test_code_llm(_):
+        return await fetch_llm_response_async(build_pom_test_prompt(pom_source), "pom_test_code")
+
+    async def write_test_code(inputs):
+        test_pom_details = clean_code_for_testcode(inputs["test_code_llm"])
+        extract_and_create_testclass(test_pom_details,test_case_id)
+
+    # Independent LLM stages run concurrently, each file is written as soon as its inputs are ready
+    _, stage_report = await run_stages([
+        Stage("cucumber_llm", cucumber_llm, []),
+        Stage("pom_llm", pom_llm, []),
+        Stage("test_code_llm", test_code_llm, []),
+        Stage("write_feature", write_feature, ["cucumber_llm"]),
+        Stage("write_classes", write_classes, ["pom_llm"]),
+        Stage("write_test_code", write_test_code, ["test_code_llm"])
+    ])
 
-    pom_test_details = clean_and_extract_pom_test_code()
-    test_pom_details = clean_code_for_testcode(pom_test_details)
-    extract_and_create_testclass(test_pom_details,test_case_id)
+    failed_stages = [stage for stage in stage_report if stage["status"] != "success"]
+    if failed_stages:
+        raise RuntimeError(f"Artifact generation failed for test case {test_case_id}: {failed_stages}")
+    return stage_report
 
 def clean_code_for_classes(pom_details):
     return clen_code_for_python_class_extract(extract_tag_content("ClassCode", pom_details))
@@ -278,6 +313,11 @@ def clen_code_for_python_class_extract(raw):
 
 
 def extract_and_create_classes(source_code, test_case_id):
+    """Split the consolidated POM source into one file per class. Returns the extraction report."""
+    return asyncio.run(extract_and_create_classes_async(source_code, test_case_id))
+
+
+async def extract_and_create_classes_async(source_code, test_case_id):
     output_dir = "extracted_files/"+test_case_id+"/files/page-objects"
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
@@ -287,96 +327,134 @@ def extract_and_create_classes(source_code, test_case_id):
     with open(file_path, "w") as file:
         file.write(source_code + "\n")  
 
-    class_names = extract_class_names_from_file(file_path)
-    print(f"Extracted class names: {class_names}")
+    # Split locally first, the LLM is only needed when the source cannot be parsed
+    extraction_report = split_classes_locally(source_code, output_dir)
+    if extraction_report is None:
+        extraction_report = await extract_classes_with_llm(source_code, output_dir)
+    log_extraction_report(extraction_report)
 
-    for class_name in class_names:
+    # Remove the temporary Classes.js file
+    remove_classes_file = os.path.join(output_dir, f"Classes.js")
+    if os.path.exists(remove_classes_file):
+        os.remove(remove_classes_file)
+        print(f"Removed temporary Classes.js file at {remove_classes_file}")
+
+    return extraction_report
+
+
+def split_classes_locally(source_code, output_dir):
+    """Write one file per class using the JS parser. Returns the report, or None if parsing fails."""
+    started = time.perf_counter()
+    try:
+        class_files = split_classes(source_code)
+    except JsParseError as parse_error:
+        print(f"⚠️ Local class split failed, falling back to LLM extraction: {parse_error}")
+        return None
+    if not class_files:
+        print("⚠️ Local class split found no classes, falling back to LLM extraction")
+        return None
+
+    extraction_report = []
+    for class_name, class_code in class_files.items():
         class_file_path = os.path.join(output_dir, f"{class_name}.js")
-        class_code = extract_refactored_class_code(source_code, class_name)
+        with open(class_file_path, "w") as class_file:
+            class_file.write(class_code)
+        print(f"✅ Created file for class: {class_name} at {class_file_path} (parser)")
+        extraction_report.append(class_extraction_result(class_name, "parser", 1, started))
+    return extraction_report
+
+
+async def extract_classes_with_llm(source_code, output_dir):
+    workers = asyncio.Semaphore(class_extraction_workers)
+    extraction_tasks = {}
+
+    def start_extraction(class_name):
+        if class_name not in extraction_tasks:
+            class_file_path = os.path.join(output_dir, f"{class_name}.js")
+            extraction_tasks[class_name] = asyncio.create_task(
+                extract_class_with_retry(source_code, class_name, class_file_path, workers))
+
+    # Classes the regex already sees start extracting while the LLM lists the rest
+    regex_matches = extract_class_names_with_regex(source_code)
+    class_names_task = asyncio.create_task(fetch_llm_response_async(build_class_names_prompt(source_code), "class_names"))
+    for class_name in regex_matches:
+        start_extraction(class_name)
+
+    try:
+        llm_classes = parse_class_names_response(await class_names_task)
+    except LLM_HARD_ERRORS:
+        for task in extraction_tasks.values():
+            task.cancel()
+        raise
+    except Exception as llm_error:
+        print(f"⚠️ LLM extraction failed: {llm_error}")
+        llm_classes = []
+    class_names = merge_class_names(regex_matches, llm_classes)
+    print(f"Extracted class names: {class_names}")
+    for class_name in class_names:
+        start_extraction(class_name)
+
+    return await asyncio.gather(*(extraction_tasks[class_name] for class_name in class_names))
+
+
+async def extract_class_with_retry(source_code, class_name, class_file_path, workers):
+    """
+    Extract one class with exponential backoff between attempts and write its file as soon
+    as it is ready. Falls back to the regex based extract_single_class after the last attempt.
+    """
+    started = time.perf_counter()
+    prompt = build_refactored_class_prompt(source_code, class_name)
+    for attempt in range(1, class_extraction_max_attempts + 1):
+        async with workers:
+            try:
+                response_text = await fetch_llm_response_async(prompt, "class_extraction")
+            except LLM_HARD_ERRORS:
+                raise
+            except Exception as e:
+                response_text = f"ERROR: Can't invoke '{model_id}'. Reason: {e}"
+        class_code = extract_tag_content("ClassFile", response_text)
         if class_code and "Class not found" not in class_code and "ERROR" not in class_code:
             with open(class_file_path, "w") as class_file:
                 class_file.write(class_code)
-            print(f"Created file for class: {class_name} at {class_file_path}")
-        else:
-            print(f"Skipping file creation for class: {class_name} due to extraction error.")
-
-    # Check if all classes were successfully created
-    missing_classes = []
-    for class_name in class_names:
-        class_file_path = os.path.join(output_dir, f"{class_name}.js")
-        if not os.path.exists(class_file_path):
-            missing_classes.append(class_name)
-    
-    # If there are missing classes, try to extract them again with retry logic
-    if missing_classes:
-        print(f"⚠️ Missing class files: {missing_classes}")
-        
-        max_retries = 3
-        still_missing = missing_classes.copy()
-        
-        for retry_attempt in range(max_retries):
-            if not still_missing:
-                break
-                
-            print(f"🔄 Retry attempt {retry_attempt + 1}/{max_retries} for missing classes: {still_missing}")
-            newly_created = []
-            
-            for class_name in still_missing:
-                print(f"🔄 Retrying extraction for class: {class_name}")
-                class_file_path = os.path.join(output_dir, f"{class_name}.js")
-                class_code = extract_refactored_class_code(source_code, class_name)
-                
-                if class_code and "Class not found" not in class_code and "ERROR" not in class_code:
-                    with open(class_file_path, "w") as class_file:
-                        class_file.write(class_code)
-                    print(f"✅ Successfully created file for class: {class_name} on retry {retry_attempt + 1}")
-                    newly_created.append(class_name)
-                else:
-                    print(f"❌ Failed to extract class: {class_name} on retry {retry_attempt + 1}")                    
-            
-            # Update still_missing list by removing successfully created classes
-            still_missing = [cls for cls in still_missing if cls not in newly_created]
-            
-            if still_missing and retry_attempt < max_retries - 1:
-                print(f"⏳ Waiting before next retry attempt...")
-                time.sleep(2)  # Brief delay between retries
-        
-        # Final check and error logging for any remaining missing classes
-        if still_missing:
-            print(f"❌ Failed to create files for classes after {max_retries} attempts: {still_missing}")
-            for class_name in still_missing:
-                error_log = f"Failed to extract class '{class_name}' from source code after {max_retries} retry attempts. Trying with manual intervention."
-                print(f"ERROR: {error_log}")
-
-                for class_name in still_missing:
-                    class_file_path = os.path.join(output_dir, f"{class_name}.js")
-                    extract_single_class(source_code, class_name, class_file_path)
-        else:
-            print("✅ All missing classes were successfully created after retries.")
-    else:
-        print("✅ All classes were successfully created on first attempt.")
+            print(f"✅ Created file for class: {class_name} at {class_file_path} (attempt {attempt})")
+            return class_extraction_result(class_name, "llm", attempt, started)
+
+        print(f"❌ Failed to extract class: {class_name} on attempt {attempt}/{class_extraction_max_attempts}")
+        # The retry must reach the model, not the rejected cached response
+        llm_client.invalidate(prompt)
+        if attempt < class_extraction_max_attempts:
+            await asyncio.sleep(class_extraction_backoff_seconds * (2 ** (attempt - 1)))
+
+    print(f"ERROR: Failed to extract class '{class_name}' from source code after {class_extraction_max_attempts} attempts. Trying with manual intervention.")
+    async with workers:
+        created = await asyncio.to_thread(extract_single_class, source_code, class_name, class_file_path)
+    method = "manual" if created and os.path.exists(class_file_path) else "failed"
+    return class_extraction_result(class_name, method, class_extraction_max_attempts + 1, started)
+
+
+def class_extraction_result(class_name, method, attempts, started):
+    return {
+        "class_name": class_name,
+        "method": method,
+        "attempts": attempts,
+        "latency_ms": round((time.perf_counter() - started) * 1000)
+    }
 
 
-    # Check if all classes were successfully created
-    missing_classes = []
-    for class_name in class_names:
-        class_file_path = os.path.join(output_dir, f"{class_name}.js")
-        if not os.path.exists(class_file_path):
-            missing_classes.append(class_name)
+def log_extraction_report(extraction_report):
+    print("📊 Class extraction report:")
+    for result in extraction_report:
+        print(f"  {result['class_name']}: {result['method']}, attempts {result['attempts']}, {result['latency_ms']} ms")
 
+    missing_classes = [result["class_name"] for result in extraction_report if result["method"] == "failed"]
     if missing_classes:    
         print(f"⚠️ Missing class files post ALL methods: {missing_classes}")
-        
-
-    # Remove the temporary Classes.js file
-    remove_classes_file = os.path.join(output_dir, f"Classes.js")
-    if os.path.exists(remove_classes_file):
-        os.remove(remove_classes_file)
-        print(f"Removed temporary Classes.js file at {remove_classes_file}")
+    else:
+        print("✅ All classes were successfully created.")
 
 
-def extract_refactored_class_code(raw_code, class_name):
-    prompt = f"""
+def build_refactored_class_prompt(raw_code, class_name):
+    return f"""
 You are a code formatting and extraction assistant.
 
 Code:
@@ -387,25 +465,12 @@ Code:
 3. If the class '{class_name}' is not found, respond with 'Class not found'.
 {PROMPT_RULES_CLASS_CREATE}
 """
-
-    try:
-        response_text = fetch_llm_response(prompt)
-        #print("invoken AWS bedrock for Class Only start: ")
-        #print(response_text)
-        response_text = extract_tag_content("ClassFile", response_text)
-        #print("invoken AWS bedrock for Class Only end: ")
-        return response_text;
-    except (ClientError, Exception) as e:
-        return "ERROR: Can't invoke '{model_id}'. Reason: {e}"
     
 
 
 
-def clean_and_extract_pom_code():
-    with open(file_name_pom, "r") as f:
-            raw_code = f.read()
-
-    prompt = f"""
+def build_pom_prompt(raw_code):
+    return f"""
 You are a code rewriting assistant.
 
 {PROMPT_RULES_POM}
@@ -414,63 +479,30 @@ Here is the code:
 {raw_code}
 """
 
-    try:
-        response_text = fetch_llm_response(prompt)
-        print("invoken AWS bedrock for POM start: ")
-        #print(response_text)
-        print("invoken AWS bedrock for POM end: ")
-        return response_text;
-    except (ClientError, Exception) as e:
-        return "ERROR: Can't invoke '{model_id}'. Reason: {e}" 
+def extract_class_names_with_regex(content):
+    print("🔍 Extracting class names using regex...")
+    class_pattern = r'class\s+([A-Za-z_][A-Za-z0-9_]*)\s*\{'
+    regex_matches = re.findall(class_pattern, content)
+    print(f"📋 Regex found classes: {regex_matches}")
+    return regex_matches
 
-def extract_class_names_from_file(file_path):
-    """
-    Extract class names from a JavaScript/TypeScript file containing Page Object Model classes.
-    Uses both regex-based and LLM-based extraction methods for comprehensive results.
+
+def merge_class_names(regex_matches, llm_classes):
+    print("🔄 Combining results from both methods...")
+    all_classes = regex_matches + llm_classes
     
-    Args:
-        file_path (str): Path to the file to analyze
-        
-    Returns:
-        list: List of unique class names found in the file using both methods
-    """
-    if not os.path.exists(file_path):
-        print(f"File not found: {file_path}")
-        return []
+    # Remove duplicates while preserving order
+    unique_classes = []
+    seen = set()
+    for class_name in all_classes:
+        if class_name not in seen and class_name:  # Ensure non-empty class names
+            unique_classes.append(class_name)
+            seen.add(class_name)
     
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-        
-        # Method 1: Regex-based extraction
-        print("🔍 Extracting class names using regex...")
-        class_pattern = r'class\s+([A-Za-z_][A-Za-z0-9_]*)\s*\{'
-        regex_matches = re.findall(class_pattern, content)
-        print(f"📋 Regex found classes: {regex_matches}")
-        
-        # Method 2: LLM-based extraction
-        llm_classes = extract_class_names_with_llm(content)
-        
-        # Method 3: Combine and deduplicate results
-        print("🔄 Combining results from both methods...")
-        all_classes = regex_matches + llm_classes
-        
-        # Remove duplicates while preserving order
-        unique_classes = []
-        seen = set()
-        for class_name in all_classes:
-            if class_name not in seen and class_name:  # Ensure non-empty class names
-                unique_classes.append(class_name)
-                seen.add(class_name)
-        
-        print(f"✅ Final unique class list: {unique_classes}")
-        print(f"📊 Total classes found: {len(unique_classes)} (Regex: {len(regex_matches)}, LLM: {len(llm_classes)})")
-        
-        return unique_classes
-        
-    except Exception as e:
-        print(f"❌ Error reading file {file_path}: {e}")
-        return []
+    print(f"✅ Final unique class list: {unique_classes}")
+    print(f"📊 Total classes found: {len(unique_classes)} (Regex: {len(regex_matches)}, LLM: {len(llm_classes)})")
+    
+    return unique_classes
 
 
 
@@ -494,11 +526,8 @@ def writeTofileCucumberFeature(code_to_write,test_case_id):
             f.write(code_to_write)
             f.write("\n\n")    
 
-def clean_and_extract_cuccumber_code():
-    with open(file_name_cucumber, "r") as f:
-            raw_code = f.read()
-
-    prompt = f"""
+def build_cucumber_prompt(raw_code):
+    return f"""
 You are a UI automation assistant.
 
 Available UI elements:
@@ -506,22 +535,10 @@ Available UI elements:
 
 {PROMPT_RULES_CUCUMBER}
 """
-
-    try:
-        response_text = fetch_llm_response(prompt)
-        print("invoken AWS bedrock for BDD start: ")
-        #print(response_text)
-        print("invoken AWS bedrock for BDD end: ")
-        return response_text;
-    except (ClientError, Exception) as e:
-        return "ERROR: Can't invoke '{model_id}'. Reason: {e}"
     
 
-def clean_and_extract_pom_test_code():
-    with open(file_name_pom, "r") as f:
-            raw_code = f.read()
-
-    prompt = f"""
+def build_pom_test_prompt(raw_code):
+    return f"""
 You are a code extraction assistant.
 
 {PROMPT_RULES_TEST_CODE}
@@ -529,14 +546,6 @@ You are a code extraction assistant.
 Here is the code:
 {raw_code}
 """
-    try:
-        response_text = fetch_llm_response(prompt)
-        print("invoken AWS bedrock for test code start: ")
-        #print(response_text)
-        print("invoken AWS bedrock for test code end: ")
-        return response_text;
-    except (ClientError, Exception) as e:
-        return "ERROR: Can't invoke '{model_id}'. Reason: {e}"   
     
 # Execute each step
 def log_ui_elements(ui_elements, title):
@@ -544,12 +553,12 @@ def log_ui_elements(ui_elements, title):
     for e in ui_elements:
         print(f"  Text: {e['text']}, Resource-ID: {e['resource_id']}, Content-Desc: {e['content_desc']}")   
 
-def process_generated_code(driver, generated_code, generated_code_raw):
+def process_generated_code(driver, workspace, generated_code, generated_code_raw):
         execute_appium_code(driver, generated_code)
         print(f"\n💡 Formatted code : \n{generated_code}")
         print(f"\n💡 Formatted code ended: ")
 
-        append_to_file(generated_code)
+        append_to_file(workspace, generated_code)
 
         fetureDetails = extract_tag_content("FeatureDetails", generated_code_raw)
         pomDetails = extract_tag_content("POMDetails", generated_code_raw)
@@ -560,74 +569,14 @@ def process_generated_code(driver, generated_code, generated_code_raw):
         fetureDetails = extract_tag_content("FeatureDetails", corelated_code)
         pomDetails = extract_tag_content("POMDetails", corelated_code)
 
-        writeTofileCucumber(fetureDetails)
-        writeTofileCucumber("\n")
+        writeTofileCucumber(workspace, fetureDetails)
+        writeTofileCucumber(workspace, "\n")
 
         
-        writeTofilePom(pomDetails)
-        writeTofilePom("\n") 
-        
-def check_if_page_scrollable(driver):
-    """Check if the current page/screen is scrollable."""
-    try:
-        # Method 1: Check for scrollable elements using UiAutomator
-        scrollable_elements = driver.find_elements(AppiumBy.ANDROID_UIAUTOMATOR, 
-            'new UiSelector().scrollable(true)')
-        
-        if scrollable_elements:
-            print(f"✅ Page is scrollable - Found {len(scrollable_elements)} scrollable containers")
-            return True
-        
-        # Method 2: Check for common scrollable view classes
-        scrollable_classes = [
-            'android.widget.ScrollView',
-            'android.widget.ListView', 
-            'android.widget.RecyclerView',
-            'androidx.recyclerview.widget.RecyclerView',
-            'android.support.v7.widget.RecyclerView'
-        ]
-        
-        for class_name in scrollable_classes:
-            elements = driver.find_elements(By.CLASS_NAME, class_name)
-            if elements:
-                print(f"✅ Page is scrollable - Found {class_name}")
-                return True
-        
-        # Method 3: Check viewport vs content size (if available)
-        try:
-            screen_size = driver.get_window_size()
-            # Try to detect if content extends beyond screen
-            all_elements = driver.find_elements(By.XPATH, "//*")
-            max_y = 0
-            for element in all_elements:
-                try:
-                    location = element.location
-                    size = element.size
-                    element_bottom = location['y'] + size['height']
-                    max_y = max(max_y, element_bottom)
-                except:
-                    continue
-            
-            if max_y > screen_size['height']:
-                print(f"✅ Page is scrollable - Content height ({max_y}) > Screen height ({screen_size['height']})")
-                return True
-        except:
-            pass
-            
-        print("❌ Page does not appear to be scrollable")
-        return False
+        writeTofilePom(workspace, pomDetails)
+        writeTofilePom(workspace, "\n") 
         
-    except Exception as e:
-        print(f"⚠️ Error checking scrollability: {e}")
-        return False
-    
-
-    
-
 def clean_and_extract_corelated_code(featureFileContent, pomFileContent):
-    with open(file_name_pom, "r") as f:
-            raw_code = f.read()
-
     prompt = f"""
 You are a code extraction assistant.
 
@@ -639,15 +588,34 @@ Here is the pom code:
 {pomFileContent}
 """
     try:
-        response_text = fetch_llm_response(prompt)
+        response_text = fetch_llm_response(prompt, "correlation")
         #print("invoken AWS bedrock for Gherkin start: ")
         #print(response_text)
         #print("invoken AWS bedrock for Gherkin end: ")
         return response_text;
+    except LLM_HARD_ERRORS:
+        raise
     except (ClientError, Exception) as e:
         return "ERROR: Can't invoke '{model_id}'. Reason: {e}"   
 
 
+def clean_and_extract_corelated_steps_code(stepFragments):
+    """Correlate the <StepDetails> blocks of consecutive steps in one call, keeping one block per step."""
+    prompt = f"""
+You are a code extraction assistant.
+
+{PROMPT_RULES_CONTENT_CORELATION}{PROMPT_RULES_CONTENT_CORELATION_STEPS}
+Here is the code of every step:
+{stepFragments}
+"""
+    try:
+        return fetch_llm_response(prompt, "correlation")
+    except LLM_HARD_ERRORS:
+        raise
+    except (ClientError, Exception) as e:
+        return f"ERROR: Can't invoke '{model_id}'. Reason: {e}"
+
+
 # Regex to extract classes with their full body (handles nested braces roughly)
 class_pattern = re.compile(r'class\s+(\w+)\s*{([^}]*(?:}(?!\s*class)[^}]*)*)}', re.DOTALL)
 
@@ -716,30 +684,20 @@ Code:
 """
 
     try:
-        response_text = fetch_llm_response(prompt)
+        response_text = fetch_llm_response(prompt, "class_extraction")
         #print("invoken AWS bedrock for Class Only start: ")
         #print(response_text)
         response_text = extract_tag_content("ClassFile", response_text)
         #print("invoken AWS bedrock for Class Only end: ")
         return response_text;
+    except LLM_HARD_ERRORS:
+        raise
     except (ClientError, Exception) as e:
         return "ERROR: Can't invoke '{model_id}'. Reason: {e}"
 
 
-def extract_class_names_with_llm(content):
-    """
-    Extract class names from JavaScript/TypeScript code using LLM.
-    
-    Args:
-        content (str): The code content to analyze
-
-    Returns:
-        list: List of class names found by the LLM
-    """
-    print("🤖 Extracting class names using LLM...")
-    llm_classes = []
-    try:
-        prompt = f"""
+def build_class_names_prompt(content):
+    return f"""
         You are a code analysis assistant. Extract all class names from the following JavaScript/TypeScript code.
 
         Code:
@@ -751,23 +709,20 @@ def extract_class_names_with_llm(content):
         Example format: ClassName1, ClassName2, ClassName3
         """
 
-        llm_response = fetch_llm_response(prompt)
-
-        if llm_response and "NO_CLASSES_FOUND" not in llm_response.upper():
-            # Parse LLM response to extract class names
-            llm_class_text = llm_response.strip()
-            # Split by comma and clean up whitespace
-            llm_classes = [name.strip() for name in llm_class_text.split(',') if name.strip()]
-            # Filter out any non-class-like names (basic validation)
-            llm_classes = [name for name in llm_classes if re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', name)]
-            print(f"🤖 LLM found classes: {llm_classes}")
-        else:
-            print("🤖 LLM found no classes")
-
-    except Exception as llm_error:
-        print(f"⚠️ LLM extraction failed: {llm_error}")
-        llm_classes = []
 
+def parse_class_names_response(llm_response):
+    """Turn the comma-separated LLM answer into a list of valid class names."""
+    llm_classes = []
+    if llm_response and not llm_response.startswith("ERROR") and "NO_CLASSES_FOUND" not in llm_response.upper():
+        # Parse LLM response to extract class names
+        llm_class_text = llm_response.strip()
+        # Split by comma and clean up whitespace
+        llm_classes = [name.strip() for name in llm_class_text.split(',') if name.strip()]
+        # Filter out any non-class-like names (basic validation)
+        llm_classes = [name for name in llm_classes if re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', name)]
+        print(f"🤖 LLM found classes: {llm_classes}")
+    else:
+        print("🤖 LLM found no classes")
     return llm_classes
 
 
@@ -798,4 +753,5 @@ def log_ui_elements(ui_elements, title):
 
 # Helper: remove elements with null/empty/"None" resource_id
 def remove_unwanted_elements(ui_elements):
-    return [e for e in ui_elements if e.get("resource_id") != "null" or e.get("content_desc") != "null" or e.get("text")]
+    return UiSnapshot.from_dicts(ui_elements).filter(
+        lambda e: e.get("resource_id") != "null" or e.get("content_desc") != "null" or e.get("text"))